@@ -0,0 +1,109 @@
+"""
+Compares get_available_slots against the previous recursive implementation
+on large synthetic days.
+
+    python -m benchmarks.bench_available_slots
+"""
+import logging
+import timeit
+from typing import List, Optional, Tuple, cast
+
+from benchmarks.synthetic import generate_calendar
+from booking_agent.calendar import TimeSlot, get_in_minutes
+from booking_agent.calendar_toolkit import CalendarToolkit, date_error_msg
+from booking_agent.exceptions import DateUnavailableError
+
+
+class RecursiveCalendarToolkit(CalendarToolkit):
+    """
+    The implementation of get_available_slots that halved the duration
+    recursively, kept as a baseline
+    """
+
+    def get_available_slots(self, date: str, duration: str):
+        try:
+            slots_rec = self._get_available_slots_rec(date, duration)
+        except DateUnavailableError:
+            return date_error_msg
+        if slots_rec is None:
+            return f"No available slots for {duration}"
+        slots_pack, multiplier = slots_rec
+        if multiplier == 1:
+            slots_str = ", ".join([f"{slot.start} up to {slot.end}" for slot in slots_pack])
+            return f"On date {date}, available slots are {slots_str}"
+        slots_str = ""
+        slots_pack = cast(List[List[TimeSlot]], slots_pack)
+        for pack_number, pack in enumerate(slots_pack):
+            slots_str += f"Combination {pack_number}:\n"
+            for slot in pack:
+                slots_str += f"{slot.start} up to {slot.end}"
+        return f"On date {date}, there's no single slot of that duration. Here are combinations that would simulate this duration when they are booked {slots_str}!."
+
+    def _get_available_slots_rec(self, date: str, duration: str, rec_multiplier=1) -> Optional[Tuple[List[TimeSlot], int]]:
+        slots = self._get_slots(date)
+        filtered_slots = [slot for slot in slots
+                          if slot.available and slot.get_duration_in_minutes() >= get_in_minutes(duration)]
+        duration_in_minutes = get_in_minutes(duration)
+        if len(filtered_slots) == 0:
+            if duration_in_minutes < 30:
+                return None
+            half_minutes = duration_in_minutes / 2
+            hours, minutes = divmod(half_minutes, 60)
+            half_duration = f"{int(hours):02d}:{int(minutes):02d}"
+            return self._get_available_slots_rec(date, half_duration, rec_multiplier + 1)
+        if rec_multiplier == 1:
+            return filtered_slots, rec_multiplier
+        total_duration = duration_in_minutes * 2 ** (rec_multiplier - 1)
+        groups = self._greedy_group_slots(total_duration, filtered_slots)
+        if len(groups) == 0:
+            return None
+        return groups, rec_multiplier
+
+    def _greedy_group_slots(self, duration_wanted_m: int, slots: List[TimeSlot]):
+        if len(slots) == 0:
+            return slots
+        groups = []
+        running_duration = slots[0].get_duration_in_minutes()
+        running_slots = [slots[0]]
+        for index in range(1, len(slots)):
+            slot = slots[index]
+            if slot.start == running_slots[-1].end:
+                running_duration += slot.get_duration_in_minutes()
+                running_slots.append(slot)
+                if running_duration >= duration_wanted_m:
+                    groups.append(running_slots)
+                    running_slots = [slot]
+                    running_duration = slot.get_duration_in_minutes()
+                continue
+            running_slots = [slot]
+            running_duration = slot.get_duration_in_minutes()
+        return groups
+
+
+def main():
+    logging.getLogger("booking-agent").setLevel(logging.WARNING)
+    cases = [
+        # (slot_minutes, duration wanted)
+        (30, "02:00"),
+        (15, "01:30"),
+        (5, "01:00"),
+        (1, "00:45"),
+    ]
+    print(f"{'slot':>6} {'duration':>9} {'recursive (ms)':>15} {'sweep (ms)':>11} {'recursive found':>16} {'sweep found':>12}")
+    for slot_minutes, duration in cases:
+        calendar_dict_kwargs = dict(days=1, slot_minutes=slot_minutes, occupancy=0.2, seed=slot_minutes)
+        recursive = RecursiveCalendarToolkit(generate_calendar(**calendar_dict_kwargs), result_cache_size=0)
+        sweep = CalendarToolkit(generate_calendar(**calendar_dict_kwargs), result_cache_size=0)
+        date = next(iter(recursive.get_calendar_json()))
+        results = {}
+        for name, toolkit in (("recursive", recursive), ("sweep", sweep)):
+            number = 20
+            seconds = timeit.timeit(lambda: toolkit.get_available_slots(date, duration), number=number)
+            answer = toolkit.get_available_slots(date, duration)
+            results[name] = (seconds / number * 1000, answer.count("Combination"))
+        print(f"{slot_minutes:>6} {duration:>9} {results['recursive'][0]:>15.3f} {results['sweep'][0]:>11.3f} "
+              f"{results['recursive'][1]:>16} {results['sweep'][1]:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures the time it takes to import the core of the package with
+`python -X importtime` and fails when it goes over a budget, or when a heavy
+dependency is imported.
+
+    python -m benchmarks.bench_import_time [--budget-ms 300] [--module booking_agent.calendar_toolkit]
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, List
+
+# Not needed to use a calendar, they must be imported lazily
+FORBIDDEN_MODULES = ["gradio", "langchain", "langchain_community", "langchain_openai", "numpy"]
+
+
+def measure_import(module: str) -> Dict[str, int]:
+    """
+    Imports a module in a fresh interpreter
+
+    :param module: The module to import
+    :return: The cumulative import time in microseconds of every imported
+        module, by module name
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    import_times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+def get_forbidden_imports(import_times: Dict[str, int]) -> List[str]:
+    return [name for name in import_times if name.split(".")[0] in FORBIDDEN_MODULES]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="booking_agent.calendar_toolkit")
+    parser.add_argument("--budget-ms", type=float, default=300)
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="the best of the runs is kept, the first ones warm the disk cache up")
+    args = parser.parse_args()
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    best_ms = min(run[args.module] for run in runs) / 1000
+    print(f"Importing {args.module} takes {best_ms:.1f}ms (budget {args.budget_ms:.0f}ms)")
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)[1:6]
+    for name, microseconds in slowest:
+        print(f"  {name:<40} {microseconds / 1000:>8.1f}ms")
+
+    failed = False
+    forbidden_imports = get_forbidden_imports(runs[-1])
+    if len(forbidden_imports) > 0:
+        print(f"Heavy modules imported: {', '.join(sorted(forbidden_imports)[:10])}")
+        failed = True
+    if best_ms > args.budget_ms:
+        print("Import time over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import json
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+def tool_call_message(*tool_calls: Dict[str, Any]) -> AIMessage:
+    """
+    Builds an AI message calling tools, each tool call is a dict with the
+    "name" and the "args" of the tool
+    """
+    return AIMessage(content="",
+                     tool_calls=[{"name": tool_call["name"], "args": tool_call["args"],
+                                  "id": f"call_{number}"}
+                                 for number, tool_call in enumerate(tool_calls)],
+                     response_metadata={"finish_reason": "tool_calls"})
+
+
+def answer_message(content: str) -> AIMessage:
+    """
+    Builds a final AI message
+    """
+    return AIMessage(content=content, response_metadata={"finish_reason": "stop"})
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A chat model that answers with a script instead of calling an LLM. The
+    script receives the messages sent to the model and returns the answer.
+
+    Attributes:
+        script: Gives the answer to the messages sent to the model
+        calls: The messages of each call, for assertions
+    """
+    script: Callable[[List[BaseMessage]], AIMessage]
+    calls: List[List[BaseMessage]] = []
+
+    @classmethod
+    def from_messages(cls, messages: List[AIMessage]) -> "ScriptedChatModel":
+        """
+        A model answering with messages one after the other
+        """
+        remaining_messages = list(messages)
+        return cls(script=lambda _: remaining_messages.pop(0))
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None,
+                  **kwargs: Any) -> ChatResult:
+        self.calls.append(list(messages))
+        return ChatResult(generations=[ChatGeneration(message=self.script(messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.calls.append(list(messages))
+        message = self.script(messages)
+        # One chunk per word, then the tool calls in a last chunk
+        for token in re.findall(r"\S+\s*", message.content):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            tool_call_chunks=[{"name": tool_call["name"], "args": json.dumps(tool_call["args"]),
+                               "id": tool_call["id"], "index": number}
+                              for number, tool_call in enumerate(message.tool_calls)],
+            response_metadata=message.response_metadata))
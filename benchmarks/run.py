@@ -0,0 +1,249 @@
+"""
+Runs the benchmark suite on synthetic calendars, everything runs offline: the
+agent benchmarks use a scripted chat model and local embeddings.
+
+    python -m benchmarks.run [--quick] [--output results.json] [--compare baseline.json]
+
+Results are printed and written as json, comparing them with a previous run
+exits with 1 when a benchmark got slower than the tolerance.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from benchmarks.fake_models import ScriptedChatModel, answer_message, tool_call_message
+from benchmarks.synthetic import generate_calendar, generate_calendar_dict
+from booking_agent.booking_agent import BookingAgent
+from booking_agent.calendar import Calendar, get_in_minutes
+from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.lazy_calendar import LazyCalendar
+from booking_agent.multi_calendar_toolkit import MultiCalendarToolkit
+from booking_agent.policy_retrieval import HashingEmbeddings
+
+# The durations are per operation, in microseconds
+Result = Dict[str, float]
+
+
+def time_operation(operation: Callable[[], object], number: int, repeat: int = 5,
+                   setup: Callable[[], object] = lambda: None) -> Result:
+    """
+    Times an operation, setup is called before each repeat and isn't timed
+
+    :param operation: The operation to time
+    :param number: The amount of calls timed together in a repeat
+    :param repeat: The amount of repeats, the best and the median are kept
+    :param setup: Prepares a repeat, for operations changing a state
+    :return: The number, the repeat and the min and median duration of an operation
+    """
+    durations = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        durations.append((time.perf_counter() - start) / number * 1e6)
+    return {"number": number, "repeat": repeat,
+            "min_us": min(durations), "median_us": statistics.median(durations)}
+
+
+def bench_calendar_load(days: int) -> Result:
+    calendar_dict = generate_calendar_dict(days=days, slot_minutes=15)
+    return time_operation(lambda: Calendar(**calendar_dict), number=5)
+
+
+def bench_lazy_calendar_load(days: int, directory: str) -> Result:
+    """
+    Loads a calendar file then queries a single date
+    """
+    calendar_path = os.path.join(directory, "calendar.json")
+    with open(calendar_path, "w") as f:
+        json.dump(generate_calendar_dict(days=days, slot_minutes=15), f)
+    return time_operation(lambda: LazyCalendar.from_file(calendar_path).root["2024-10-14"], number=5)
+
+
+def bench_is_time_slot_available(days: int) -> Result:
+    calendar_dict = generate_calendar_dict(days=days, slot_minutes=15)
+    # Without the result cache, the queries are repeated
+    toolkit = CalendarToolkit(Calendar(**calendar_dict), result_cache_size=0)
+    rng = random.Random(0)
+    queries = [(date, rng.choice(slots)["start"]) for date, slots in calendar_dict.items()]
+    queries = [rng.choice(queries) for _ in range(1000)]
+    # The first query of a date builds its index, it isn't timed
+    for date, start_time in queries:
+        toolkit.is_time_slot_available(date, start_time)
+    next_queries = itertools.cycle(queries)
+    return time_operation(lambda: toolkit.is_time_slot_available(*next(next_queries)), number=len(queries))
+
+
+def bench_book(days: int) -> Result:
+    calendar_dict = generate_calendar_dict(days=days, slot_minutes=15, occupancy=0.0)
+    bookings = [(date, slot["start"]) for date, slots in calendar_dict.items() for slot in slots]
+    state = {}
+
+    def setup():
+        state["toolkit"] = CalendarToolkit(Calendar(**calendar_dict))
+        state["bookings"] = iter(bookings)
+
+    def book_next():
+        date, start_time = next(state["bookings"])
+        state["toolkit"].book(date, start_time, "00:15")
+
+    return time_operation(book_next, number=len(bookings), setup=setup)
+
+
+def bench_get_available_slots(slot_minutes: int, duration: str, result_cache_size: int = 0) -> Result:
+    toolkit = CalendarToolkit(generate_calendar(slot_minutes=slot_minutes, occupancy=0.2),
+                              result_cache_size=result_cache_size)
+    date = next(iter(toolkit.get_calendar_json()))
+    return time_operation(lambda: toolkit.get_available_slots(date, duration), number=20)
+
+
+def bench_trim_and_group_slots(slot_minutes: int, duration: str) -> Result:
+    toolkit = CalendarToolkit(generate_calendar(slot_minutes=slot_minutes, occupancy=0.2))
+    date = next(iter(toolkit.get_calendar_json()))
+    slots = [slot for slot in toolkit._get_slots(date) if slot.available]
+    duration_m = get_in_minutes(duration)
+    return time_operation(lambda: toolkit._trim_and_group_slots(duration_m, slots), number=20)
+
+
+def bench_get_available_slots_range(days: int, duration: str) -> Result:
+    calendar_dict = generate_calendar_dict(days=days, slot_minutes=15, occupancy=0.5)
+    toolkit = CalendarToolkit(Calendar(**calendar_dict), result_cache_size=0)
+    first_date, last_date = min(calendar_dict), max(calendar_dict)
+    return time_operation(lambda: toolkit.get_available_slots_range(first_date, last_date, duration), number=5)
+
+
+def bench_find_earliest_slot(resources: int, days: int, mode: str) -> Result:
+    """
+    A search over many busy calendars, a new toolkit is searched each repeat
+    since the first search of a date builds its index
+    """
+    calendar_dicts = [generate_calendar_dict(days=days, slot_minutes=30, occupancy=0.9, seed=number)
+                      for number in range(resources)]
+    state = {}
+
+    def setup():
+        state["toolkit"] = MultiCalendarToolkit({f"resource_{number}": CalendarToolkit(Calendar(**calendar_dict))
+                                                 for number, calendar_dict in enumerate(calendar_dicts)})
+
+    return time_operation(lambda: state["toolkit"].find_earliest_slot("01:30", mode=mode), number=1, setup=setup)
+
+
+def bench_agent_invoke(days: int, tool_name: str, tool_args: dict) -> Result:
+    """
+    A turn where the model calls a tool then answers
+    """
+    def script(messages: List[BaseMessage]):
+        if isinstance(messages[-1], ToolMessage):
+            return answer_message("Done, anything else?")
+        return tool_call_message({"name": tool_name, "args": tool_args})
+
+    with open("data/booking_policies.txt", "r") as f:
+        policies = [line.strip() for line in f if line.strip()]
+    policies_db = InMemoryVectorStore.from_texts(policies, HashingEmbeddings())
+    state = {}
+
+    def setup():
+        # A new conversation on a new calendar, bookings would fail otherwise
+        toolkit = CalendarToolkit(generate_calendar(days=days, slot_minutes=15, occupancy=0.0))
+        state["agent"] = BookingAgent(ScriptedChatModel(script=script), toolkit, policies_db)
+
+    return time_operation(lambda: state["agent"].invoke(f"Please {tool_name} on {tool_args['date']}"),
+                          number=1, repeat=10, setup=setup)
+
+
+def run_benchmarks(quick: bool = False) -> Dict[str, Result]:
+    """
+    Runs every benchmark
+
+    :param quick: Use small calendars, to check that the suite runs
+    :return: The result of each benchmark by name
+    """
+    days = 3 if quick else 60
+    slot_minutes = 15 if quick else 1
+    resources = 10 if quick else 200
+    benchmarks = {
+        f"calendar_load[days={days}]": lambda: bench_calendar_load(days),
+        f"lazy_calendar_load[days={days}]": lambda: bench_lazy_calendar_load(days, directory),
+        f"is_time_slot_available[days={days}]": lambda: bench_is_time_slot_available(days),
+        f"book[days={days}]": lambda: bench_book(days),
+        f"get_available_slots[slot={slot_minutes}m,duration=01:00]":
+            lambda: bench_get_available_slots(slot_minutes, "01:00"),
+        f"get_available_slots[slot={slot_minutes}m,duration=23:00]":
+            lambda: bench_get_available_slots(slot_minutes, "23:00"),
+        # The same question asked again, answered by the result cache
+        f"get_available_slots[slot={slot_minutes}m,duration=23:00,cached]":
+            lambda: bench_get_available_slots(slot_minutes, "23:00", result_cache_size=4096),
+        f"trim_and_group_slots[slot={slot_minutes}m,duration=01:00]":
+            lambda: bench_trim_and_group_slots(slot_minutes, "01:00"),
+        f"get_available_slots_range[days={days},duration=01:00]":
+            lambda: bench_get_available_slots_range(days, "01:00"),
+        f"find_earliest_slot[resources={resources},mode=any]": lambda: bench_find_earliest_slot(resources, days, "any"),
+        # Busy calendars rarely have common windows, a few of them are enough
+        "find_earliest_slot[resources=3,mode=all]": lambda: bench_find_earliest_slot(3, days, "all"),
+        "agent_invoke[is_time_slot_available]":
+            lambda: bench_agent_invoke(days, "is_time_slot_available",
+                                       {"date": "2024-10-14", "start_time": "09:00"}),
+        "agent_invoke[book]":
+            lambda: bench_agent_invoke(days, "book",
+                                       {"date": "2024-10-14", "start_time": "09:00", "duration": "00:15"}),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, benchmark in benchmarks.items():
+            results[name] = benchmark()
+            print(f"{name:<60} {results[name]['median_us']:>12.1f}us (min {results[name]['min_us']:.1f}us)")
+    return results
+
+
+def find_regressions(results: Dict[str, Result], baseline: Dict[str, Result], tolerance: float) -> List[str]:
+    """
+    Get the benchmarks whose median got slower than the baseline by more than
+    the tolerance, benchmarks missing from the baseline are ignored
+
+    :param results: The results of the current run
+    :param baseline: The results of a previous run
+    :param tolerance: The accepted slowdown, 0.2 accepts 20% slower
+    """
+    return [name for name, result in results.items()
+            if name in baseline and result["median_us"] > baseline[name]["median_us"] * (1 + tolerance)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="small calendars, to check that the suite runs")
+    parser.add_argument("--output", help="where the results are written as json")
+    parser.add_argument("--compare", help="the json results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    logging.getLogger("booking-agent").setLevel(logging.WARNING)
+
+    results = run_benchmarks(args.quick)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "quick": args.quick, "results": results}, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for name in regressions:
+            print(f"Regression on {name}: {baseline[name]['median_us']:.1f}us -> {results[name]['median_us']:.1f}us")
+        sys.exit(1 if len(regressions) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
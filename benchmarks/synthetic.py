@@ -0,0 +1,49 @@
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+from booking_agent.calendar import Calendar, format_minutes
+
+
+def generate_calendar_dict(days: int = 1, slot_minutes: int = 60, occupancy: float = 0.3,
+                           day_start: str = "00:00", day_end: str = "24:00",
+                           first_date: date = date(2024, 10, 14),
+                           seed: int = 0) -> Dict[str, List[dict]]:
+    """
+    Generates a calendar in the json format of data/calendar.json where every
+    day is cut in contiguous slots of the same duration
+
+    :param days: The amount of days in the calendar
+    :param slot_minutes: The duration of each slot in minutes
+    :param occupancy: The probability for a slot to be already booked
+    :param day_start: The start of the first slot of each day in HH:MM format
+    :param day_end: The end of the last slot of each day in HH:MM format
+    :param first_date: The first date of the calendar
+    :param seed: The seed of the random generator, for reproducibility
+    """
+    rng = random.Random(seed)
+    start_hours, start_minutes = map(int, day_start.split(":"))
+    end_hours, end_minutes = map(int, day_end.split(":"))
+    first_minute = start_hours * 60 + start_minutes
+    # The last slot of a day can't end at 24:00 since the calendar format
+    # doesn't accept it
+    last_minute = min(end_hours * 60 + end_minutes, 24 * 60 - 1)
+
+    calendar_dict = {}
+    for day in range(days):
+        slots = []
+        for start in range(first_minute, last_minute - slot_minutes + 1, slot_minutes):
+            slots.append({
+                "start": format_minutes(start),
+                "end": format_minutes(start + slot_minutes),
+                "available": rng.random() >= occupancy
+            })
+        calendar_dict[str(first_date + timedelta(days=day))] = slots
+    return calendar_dict
+
+
+def generate_calendar(**kwargs) -> Calendar:
+    """
+    Same as generate_calendar_dict but returns a validated Calendar
+    """
+    return Calendar(**generate_calendar_dict(**kwargs))
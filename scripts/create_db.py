@@ -1,33 +1,45 @@
-import sys
-from langchain_core.documents import Document
-from langchain_community.vectorstores import FAISS
-from langchain_openai.embeddings import OpenAIEmbeddings
+import argparse
+import logging
+import time
+
+from booking_agent.booking_policies import BookingPolicies
+from booking_agent.policy_index import build_policy_index
+from booking_agent.policy_retrieval import HashingEmbeddings
 
 def main():
     """
-    A very basic script to create a FAISS vector database from a file.
+    A very basic script to create or update a FAISS vector database from a file.
     Each line in the file will be embedded separately and the output vectorstore
-    will be saved at "data/policy_index"
+    will be saved at "data/policy_index". Only the lines that changed since the
+    last run are embedded. The policies enforced by the booking rules given
+    with --rules are left out of the index.
     """
-    if len(sys.argv) != 2:
-        print("You must specify the filepath\npython scripts/create_db.py policies_filepath")
-        sys.exit(1)
-    policy_filepath = sys.argv[1]
+    parser = argparse.ArgumentParser(
+        description="python scripts/create_db.py policies_filepath")
+    parser.add_argument("policy_filepath")
+    parser.add_argument("--index-dir", default="data/policy_index")
+    parser.add_argument("--embeddings", choices=["openai", "local"], default="openai",
+                        help="local embeddings don't need any network")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rules", help="the booking rules file, e.g. data/booking_rules.json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
 
-    with open(policy_filepath, "r") as f:
-        policies = f.readlines()
-    # remove \n at the end due to readlines
-    policies = [policy[:-2] for policy in policies]
+    if args.embeddings == "openai":
+        from langchain_openai.embeddings import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings()
+    else:
+        embeddings = HashingEmbeddings()
 
-    documents = [Document(page_content=txt,
-                          metadata={
-                      "source": policy_filepath
-                 })
-                 for txt in policies]
+    excluded_policies = BookingPolicies.from_file(args.rules).get_sources() if args.rules else []
 
-    openai_embeds = OpenAIEmbeddings()
-    vec_db = FAISS.from_documents(documents, openai_embeds)
-    vec_db.save_local("data/policy_index")
+    start = time.perf_counter()
+    stats = build_policy_index(args.policy_filepath, args.index_dir, embeddings,
+                               batch_size=args.batch_size, max_workers=args.workers,
+                               excluded_policies=excluded_policies)
+    print(f"{stats['added']} policies embedded, {stats['removed']} removed, "
+          f"{stats['kept']} unchanged in {time.perf_counter() - start:.3f}s")
 
 if __name__ == "__main__":
     main()
@@ -1,73 +1,191 @@
 import logging
-import json
+import os
+import shutil
+import sys
+from typing import Optional
+
 import gradio as gr
 
-from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI
 from langchain_openai.embeddings import OpenAIEmbeddings
 
 from booking_agent.booking_agent import BookingAgent
-from booking_agent.calendar import Calendar
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.booking_policies import BookingPolicies
+from booking_agent.calendar_overlay import AnyCalendar, CalendarOverlay
 from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.calendar_view import CalendarView
+from booking_agent.fast_path import FastPathRouter
+from booking_agent.lazy_calendar import LazyCalendar
+from booking_agent.metrics import JsonLinesLogger
+from booking_agent.policy_index import build_policy_index, load_policy_index, read_policies
+from booking_agent.policy_retrieval import CachedEmbeddings, PolicyRetriever
+from booking_agent.session_manager import SessionManager
+from booking_agent.shared_calendar import SharedMemoryCalendar
+from booking_agent.shared_calendar_toolkit import SharedCalendarToolkit
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger("booking-agent")
 logger.setLevel(logging.DEBUG)
 
-def generate_calendar_html(calendar_dict):
+JOURNAL_DIRECTORY = "data/journal"
+# Each worker journals its bookings in a directory of its own in there
+WORKER_JOURNALS_DIRECTORY = os.path.join(JOURNAL_DIRECTORY, "workers")
+
+def fold_worker_journals(journal: BookingJournal, calendar: AnyCalendar) -> AnyCalendar:
     """
-    Ugly function to generate the gradio html
+    Replays the journals left by the workers of a previous run on the
+    calendar, makes it the snapshot of the journal and removes them. Replaying
+    a booking twice is harmless, so a crash before they are removed loses
+    nothing.
 
-    :param calendar_dict dict: The calendar used to create the html
+    :param journal: The journal of the launcher
+    :param calendar: The calendar loaded from the journal
+    :return: The calendar with the bookings of the workers applied
     """
-    html = "<div class='calendar'>"
-    for date, slots in calendar_dict.items():
-        html += f"<div class='date'>{date}</div>"
-        for slot in slots:
-            color = "green" if slot["available"] else "red"
-            html += f"<div class='slot' style='color: {color};'>{slot['start']} - {slot['end']}</div>"
-        html += "<hr>"
-    html += "</div>"
-    return html
-
-def main():
+    if not os.path.isdir(WORKER_JOURNALS_DIRECTORY):
+        return calendar
+    for worker_directory in sorted(os.listdir(WORKER_JOURNALS_DIRECTORY)):
+        # Workers never compact, so their journal is all there is
+        calendar = BookingJournal(os.path.join(WORKER_JOURNALS_DIRECTORY, worker_directory)).load(calendar)
+    journal.compact(calendar)
+    shutil.rmtree(WORKER_JOURNALS_DIRECTORY)
+    return calendar
+
+def main(shared_calendar_name: Optional[str] = None, server_port: Optional[int] = None,
+         journal_directory: str = JOURNAL_DIRECTORY):
     """
     Launch a gradio interface that displays a chat interface with a booking
     agent in it and its associated calendar on the left.
+
+    :param shared_calendar_name: The shared calendar to serve, when the
+        interface is one of the workers of scripts/launch_workers.py
+    :param server_port: The port of the interface, the gradio default if not given
+    :param journal_directory: The directory of the journal, each worker has
+        its own
     """
     CSS = """#row1 {flex-grow: 1; align-items: unset;}
         .form {height: fit-content;}
         #interface {height: 800px;}"""
 
-    with open("data/calendar.json", "r") as f:
-        calendar_dict = json.load(f)
-
     model = ChatOpenAI(model="gpt-4o")
-    vectorstore = FAISS.load_local("data/policy_index",
-                                   embeddings=OpenAIEmbeddings(),
-                                   allow_dangerous_deserialization=True)
-    agent = BookingAgent(model, CalendarToolkit(Calendar(**calendar_dict)), vectorstore)
+    # Embeddings are cached on disk and retrievals in memory, the retriever is
+    # shared by every session
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(), cache_path="data/embedding_cache.sqlite3")
+    # The policies that can be checked without the model are enforced by the
+    # toolkit, the model is only given the other ones
+    policies = BookingPolicies.from_file("data/booking_rules.json")
+    # The index is updated when the policies or the rules changed, it is a
+    # no-op otherwise
+    build_policy_index("data/booking_policies.txt", "data/policy_index", embeddings,
+                       excluded_policies=policies.get_sources())
+    vectorstore = load_policy_index("data/policy_index", embeddings)
+    policy_retriever = PolicyRetriever(vectorstore, excluded_policies=policies.get_sources())
+    if shared_calendar_name is None:
+        # Bookings are persisted in the journal, it is replayed on top of the
+        # calendar at startup
+        journal = BookingJournal(journal_directory)
+        # Dates are only validated when they are first queried. The base
+        # calendar is never modified, bookings are made in an overlay over it
+        base_calendar = LazyCalendar.from_file("data/calendar.json")
+        # Workers of scripts/launch_workers.py may have left their journals
+        calendar = fold_worker_journals(journal, journal.load(CalendarOverlay(base_calendar)))
+        calendar_toolkit = CalendarToolkit(calendar, journal, policies=policies)
+    else:
+        # Each worker journals its own bookings, the launcher replays the
+        # journals of the workers and compacts them, so workers never do
+        journal = BookingJournal(journal_directory, compaction_threshold=sys.maxsize)
+        calendar_toolkit = SharedCalendarToolkit(SharedMemoryCalendar.attach(shared_calendar_name), journal,
+                                                 policies=policies)
+    # The spans of every turn (retrieval, LLM and tool calls) are logged when
+    # BOOKING_AGENT_METRICS is set
+    metrics_sink = JsonLinesLogger("data/metrics.jsonl") if os.environ.get("BOOKING_AGENT_METRICS") else None
+    # Fully specified questions are answered without the model, the router is
+    # shared so that its hit rate covers every session. Bookings only take the
+    # fast path when every policy is enforced by the rules, unavailable slots
+    # are answered with the next available ones as the policies ask
+    uncovered_policies = [policy for policy in read_policies("data/booking_policies.txt")
+                          if not policies.covers(policy)]
+    # The alternatives are looked up in the current toolkit, reset replaces it
+    fast_path_router = FastPathRouter(policies.check if len(uncovered_policies) == 0 else None,
+                                      lambda *args: calendar_toolkit.get_alternatives(*args))
+    # Each browser session gets its own agent (and memory), the model client,
+    # the policy retriever and the calendar are shared between them
+    # Only the dates changed since the last render are rendered again
+    calendar_view = CalendarView(calendar_toolkit)
+    sessions = SessionManager(lambda: BookingAgent(model, calendar_toolkit, policy_retriever,
+                                                   metrics_sink=metrics_sink,
+                                                   fast_path_router=fast_path_router),
+                              max_sessions=1000, session_ttl=3600)
 
 
 
     with gr.Blocks(fill_height=True, css=CSS) as demo:
         with gr.Row(elem_id="row1"):
             with gr.Column():
-                gr.HTML(lambda:generate_calendar_html(agent.get_calendar_json()), every=2)
+                calendar_html = gr.HTML(calendar_view.render(0))
+                # The (offset of the window, key of the rendered calendar) of
+                # the session
+                window = gr.State((0, calendar_view.refresh()))
+                with gr.Row():
+                    previous_button = gr.Button("Previous")
+                    next_button = gr.Button("Next")
+
+                def update_calendar(window):
+                    # Nothing is sent to the browser if the calendar didn't change
+                    offset, rendered_key = window
+                    key = calendar_view.refresh()
+                    if key == rendered_key:
+                        return gr.skip(), gr.skip()
+                    return calendar_view.render(offset), (offset, key)
+
+                def move_window(window, shift):
+                    offset = calendar_view.clamp_offset(window[0] + shift)
+                    return calendar_view.render(offset), (offset, calendar_view.refresh())
+
+                gr.Timer(2).tick(update_calendar, [window], [calendar_html, window])
+                window_size = calendar_view.get_window_size()
+                previous_button.click(lambda window: move_window(window, -window_size), [window], [calendar_html, window])
+                next_button.click(lambda window: move_window(window, window_size), [window], [calendar_html, window])
             with gr.Column(scale=15, elem_id="interface"):
-                def invoke_and_update_calendar(m: str):
-                    result = agent.invoke(m)
-                    return result
-                interface = gr.ChatInterface(lambda m, _: invoke_and_update_calendar(m),
-                             type="messages")
+                async def invoke_and_update_calendar(m: str, _, request: gr.Request):
+                    # The answer is streamed, preceded by the tool calls made
+                    # to build it
+                    response = ""
+                    async for event in sessions.get(request.session_hash).astream(m):
+                        if event.type == "tool_call":
+                            response += f"*{event.content}…*\n\n"
+                        else:
+                            response += event.content
+                        yield response
+                # The handler awaits the model so a single process can hold
+                # many conversations in flight, hence no concurrency limit
+                interface = gr.ChatInterface(invoke_and_update_calendar,
+                             type="messages", concurrency_limit=None)
 
                 def reset():
+                    nonlocal calendar_toolkit
+                    if shared_calendar_name is not None:
+                        # The calendar is shared with the other workers, only
+                        # the sessions of this worker are reset
+                        logger.debug("Memory reset")
+                        sessions.clear()
+                        return
                     logger.debug("Memory and calendar reset")
-                    agent.reset_agent_and_calendar(CalendarToolkit(Calendar(**calendar_dict)))
+                    # Dropping the overlay is enough to go back to the base
+                    calendar = CalendarOverlay(base_calendar)
+                    # The fresh calendar becomes the new snapshot so that
+                    # previous bookings are not replayed at the next startup
+                    journal.compact(calendar)
+                    calendar_toolkit = CalendarToolkit(calendar, journal, policies=policies)
+                    calendar_view.set_toolkit(calendar_toolkit)
+                    # The calendar is shared so every session is dropped, their
+                    # agents would otherwise stay bound to the previous calendar
+                    sessions.clear()
 
                 button = gr.ClearButton(interface.chatbot, value="Reset memory and calendar")
                 button.click(reset, [], [])
-    demo.launch()
+    demo.launch(server_port=server_port)
 
 
 if __name__ == "__main__":
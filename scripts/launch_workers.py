@@ -0,0 +1,63 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+
+from launch_interface import JOURNAL_DIRECTORY, WORKER_JOURNALS_DIRECTORY, fold_worker_journals
+from launch_interface import main as launch_interface
+
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.calendar_overlay import CalendarOverlay
+from booking_agent.lazy_calendar import LazyCalendar
+from booking_agent.shared_calendar import SharedMemoryCalendar
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger("booking-agent")
+logger.setLevel(logging.DEBUG)
+
+def main():
+    """
+    Launch several interfaces in worker processes, on consecutive ports, that
+    book in a single calendar held in shared memory. The calendar is loaded
+    from data/calendar.json and the journals, each worker journals its
+    bookings so that they survive a crash of any process, and the calendar is
+    compacted in the journal when the workers stop.
+    """
+    parser = argparse.ArgumentParser(description="python scripts/launch_workers.py --workers 4")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--port", type=int, default=7860, help="the port of the first worker")
+    args = parser.parse_args()
+
+    journal = BookingJournal(JOURNAL_DIRECTORY)
+    calendar = journal.load(CalendarOverlay(LazyCalendar.from_file("data/calendar.json")))
+    calendar = fold_worker_journals(journal, calendar)
+    shared_calendar = SharedMemoryCalendar.create(calendar)
+    # Workers are children of this process so that they share its resource
+    # tracker, see SharedMemoryCalendar.attach
+    workers = [multiprocessing.Process(target=launch_interface,
+                                       args=(shared_calendar.get_name(), args.port + number,
+                                             os.path.join(WORKER_JOURNALS_DIRECTORY, str(number))))
+               for number in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    logger.debug(f"Started {args.workers} workers from port {args.port}")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+    finally:
+        # The bookings of the workers become the new snapshot, their journals
+        # are only removed once it is durable
+        journal.compact(shared_calendar)
+        journal.close()
+        shutil.rmtree(WORKER_JOURNALS_DIRECTORY, ignore_errors=True)
+        shared_calendar.close()
+        shared_calendar.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from booking_agent.calendar import Calendar, get_date_obj, get_in_minutes
+
+MINUTES_PER_DAY = 24 * 60
+
+logger = logging.getLogger("booking-agent")
+
+class AvailabilityBitmap:
+    """
+    A compact representation of a calendar availability with one bit per
+    minute of each day (180 bytes a day, whatever the amount of slots). A bit is
+    set when the minute belongs to an available slot.
+    Days are sorted chronologically so that a date range is a contiguous block
+    of rows that can be searched in one vectorized pass.
+
+    Rows can be filled lazily, an unfilled row is considered fully unavailable.
+
+    Attributes:
+        _dates: The dates of the calendar sorted chronologically
+        _positions: The row of each date
+        _ordinals: The ordinal of each date, used to find the rows of a range
+        _rows: The packed bits of each day
+        _filled: Whether the row of each day has been filled
+    """
+    _dates: List[str]
+    _positions: Dict[str, int]
+    _ordinals: np.ndarray
+    _rows: np.ndarray
+    _filled: np.ndarray
+
+    def __init__(self, dates: Iterable[str]):
+        parsed_dates = []
+        for date in dates:
+            try:
+                parsed_dates.append((get_date_obj(date).toordinal(), date))
+            except ValueError:
+                logger.warning(f"Date {date} is not in format YYYY-m-d, it won't be searchable by range")
+        parsed_dates.sort()
+        self._dates = [date for _, date in parsed_dates]
+        self._positions = {date: position for position, date in enumerate(self._dates)}
+        self._ordinals = np.array([ordinal for ordinal, _ in parsed_dates], dtype=np.int64)
+        self._rows = np.zeros((len(self._dates), MINUTES_PER_DAY // 8), dtype=np.uint8)
+        self._filled = np.zeros(len(self._dates), dtype=bool)
+
+    @classmethod
+    def from_calendar(cls, calendar: Calendar) -> "AvailabilityBitmap":
+        """
+        Build the bitmap of a whole calendar
+
+        :param calendar: The calendar to represent
+        """
+        bitmap = cls(calendar.root.keys())
+        for date, slots in calendar.root.items():
+            bitmap.set_day(date, [(get_in_minutes(slot.start), get_in_minutes(slot.end))
+                                  for slot in slots if slot.available])
+        return bitmap
+
+    @property
+    def nbytes(self) -> int:
+        return self._rows.nbytes + self._ordinals.nbytes + self._filled.nbytes
+
+    def get_range(self, start_ordinal: int, end_ordinal: int) -> Tuple[int, int]:
+        """
+        Get the rows of the dates between two ordinals (both included)
+
+        :return: The first row and the row after the last one
+        """
+        first = int(np.searchsorted(self._ordinals, start_ordinal, side="left"))
+        last = int(np.searchsorted(self._ordinals, end_ordinal, side="right"))
+        return first, max(first, last)
+
+    def get_dates(self, first: int, last: int) -> List[str]:
+        """
+        Get the dates of the rows between first and last
+        """
+        return self._dates[first:last]
+
+    def get_unfilled_dates(self, first: int, last: int) -> List[str]:
+        """
+        Get the dates of the rows between first and last that are not filled yet
+        """
+        return [self._dates[first + offset] for offset in np.flatnonzero(~self._filled[first:last])]
+
+    def set_day(self, date: str, free_intervals: Iterable[Tuple[int, int]]):
+        """
+        Fill the row of a date
+
+        :param date: The date in YYYY-m-d format
+        :param free_intervals: The available (start, end) intervals in minutes
+        """
+        position = self._positions.get(date)
+        if position is None:
+            return
+        bits = np.zeros(MINUTES_PER_DAY, dtype=np.uint8)
+        for start, end in free_intervals:
+            bits[start:end] = 1
+        self._rows[position] = np.packbits(bits)
+        self._filled[position] = True
+
+    def set_unavailable(self, date: str, start: int, end: int):
+        """
+        Clear the minutes between start and end of a date, it is a no-op if the
+        row was not filled yet since it will be read from the calendar when needed
+        """
+        position = self._positions.get(date)
+        if position is None or not self._filled[position]:
+            return
+        bits = np.unpackbits(self._rows[position])
+        bits[start:end] = 0
+        self._rows[position] = np.packbits(bits)
+
+    def find_windows(self, first: int, last: int, duration: int) -> List[Tuple[str, int, int]]:
+        """
+        Find every contiguous free window of at least duration minutes in the
+        rows between first and last, in a single vectorized pass
+
+        :param duration: The duration wanted in minutes
+        :return: The (date, start, end) of each window, chronologically sorted
+        """
+        if first >= last:
+            return []
+        bits = np.unpackbits(self._rows[first:last], axis=1)
+        # Padding each day with an unavailable minute on both sides makes every
+        # free run begin with a +1 edge and end with a -1 edge
+        padded = np.zeros((last - first, MINUTES_PER_DAY + 2), dtype=np.int8)
+        padded[:, 1:-1] = bits
+        edges = np.diff(padded, axis=1)
+        days, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        fitting = (ends - starts) >= duration
+        return [(self._dates[first + day], int(start), int(end))
+                for day, start, end in zip(days[fitting], starts[fitting], ends[fitting])]
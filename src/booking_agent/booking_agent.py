@@ -1,14 +1,50 @@
 import logging
+from typing import List, Optional, Union
 
+from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import ToolMessage
+from langchain_core.messages.tool import ToolCall, tool_call
 from langchain_core.tools import StructuredTool
+from langchain_core.vectorstores import VectorStore
 from booking_agent.booking_tools import get_today_date
 from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.conversation_memory import ConversationMemory
+from booking_agent.fast_path import FastPathRequest, FastPathRouter
 from booking_agent.memory_tools_agent import MemoryToolsAgent
-from langchain.vectorstores import VectorStore
+from booking_agent.metrics import MetricsSink
+from booking_agent.multi_calendar_toolkit import MultiCalendarToolkit
+from booking_agent.policy_retrieval import PolicyRetriever
 
 logger = logging.getLogger("booking-agent")
 
+# Shown to the user while the tool runs, when streaming
+tool_call_descriptions = {
+    "get_today_date": "Checking today's date",
+    "is_time_slot_available": "Checking availability on {date} at {start_time}",
+    "book": "Booking {date} at {start_time}",
+    "book_batch": "Booking several slots",
+    "book_recurring": "Booking {occurrences} occurrences from {start_date} at {start_time}",
+    "get_available_slots": "Looking for available slots on {date}",
+    "get_available_slots_range": "Looking for available slots between {start_date} and {end_date}",
+    "find_earliest_slot": "Looking for the earliest window of {duration}",
+    "book_resource": "Booking {resource} on {date} at {start_time}",
+}
+
+# Tool outputs pinned in memory, so that the agent doesn't forget what today
+# is or what was booked when old turns are compacted
+booking_fact_extractors = {
+    "get_today_date": lambda args, output: f"Today is {output}",
+    "book": lambda args, output: (f"Booked on {args.get('date')} at {args.get('start_time')} for {args.get('duration')}"
+                                  if "with success" in output else None),
+    "book_batch": lambda args, output: output if "with success" in output else None,
+    "book_recurring": lambda args, output: (f"{output}, every {args.get('interval_days', 7)} days for "
+                                            f"{args.get('duration')}" if "with success" in output else None),
+    "book_resource": lambda args, output: (f"Booked {args.get('resource')} on {args.get('date')} at "
+                                           f"{args.get('start_time')} for {args.get('duration')}"
+                                           if "with success" in output else None),
+}
+
 class BookingAgent(MemoryToolsAgent):
     """
     A booking agent that extend a memory tools agent by checking booking
@@ -16,38 +52,120 @@ class BookingAgent(MemoryToolsAgent):
 
     Attributes:
         _calendar_toolkit: The class from which calendar related tools will be taken
-        _booking_policies_db: The vectorstore where booking policies are
+        _policy_retriever: Retrieves the booking policies relevant to a message
+        _multi_calendar_toolkit: The calendars of the resources (practitioners,
+            rooms..) searched together, if any
+        _fast_path_router: Parses the messages that can be answered without
+            the model, if any
     """
     _calendar_toolkit: CalendarToolkit
-    _booking_policies_db: VectorStore
+    _policy_retriever: PolicyRetriever
+    _multi_calendar_toolkit: Optional[MultiCalendarToolkit]
+    _fast_path_router: Optional[FastPathRouter]
 
     def __init__(self, model: BaseChatModel, calendar_toolkit: CalendarToolkit,
-                 booking_policies_db: VectorStore):
+                 booking_policies_db: Union[VectorStore, PolicyRetriever],
+                 memory: Optional[ConversationMemory] = None,
+                 metrics_sink: Optional[MetricsSink] = None,
+                 multi_calendar_toolkit: Optional[MultiCalendarToolkit] = None,
+                 fast_path_router: Optional[FastPathRouter] = None):
         self._calendar_toolkit = calendar_toolkit
-        self._booking_policies_db = booking_policies_db
-        super().__init__(model, [
-            StructuredTool.from_function(get_today_date),
-            StructuredTool.from_function(self._calendar_toolkit.is_time_slot_available),
-            StructuredTool.from_function(self._calendar_toolkit.book),
-            StructuredTool.from_function(self._calendar_toolkit.get_available_slots)
-        ], """You are a booking assistant that tries to help people
+        self._multi_calendar_toolkit = multi_calendar_toolkit
+        self._fast_path_router = fast_path_router
+        # A retriever can be given to share its cache between agents
+        if isinstance(booking_policies_db, PolicyRetriever):
+            self._policy_retriever = booking_policies_db
+        else:
+            self._policy_retriever = PolicyRetriever(booking_policies_db,
+                                                     excluded_policies=self._get_excluded_policies())
+        super().__init__(model, self._get_tools(), """You are a booking assistant that tries to help people
         booking appointments in their calendar. If there's an availability
         issue you take initiative to suggest direct concrete workaround for the user (check for
         workarounds and propose handy solutions) without asking user if you
         should do it. You understand that people are often considering today's
                          date by default except when they specifically precised
                          a date. You know that when people speak about next
-                         week, they speak about the week starting at the next Monday.""")
+                         week, they speak about the week starting at the next Monday.""",
+                         memory or ConversationMemory(fact_extractors=booking_fact_extractors),
+                         metrics_sink)
 
     # Overload to add booking policies context
-    def invoke(self, msg: str) -> str:
-        # Here I set k = 2 not to just have every policy in the index which
-        # would make the search a bit useless
-        results = self._booking_policies_db.similarity_search(
-            msg, k=2)
+    def _prepare_user_message(self, msg: str) -> str:
+        with self._metrics.span("retrieval", turn=self._turn_id):
+            results = self._policy_retriever.retrieve(msg)
+        return self._build_prompt(msg, results)
+
+    async def _aprepare_user_message(self, msg: str) -> str:
+        # The retrieval awaits the embedding request instead of blocking, so
+        # other conversations go on in the meantime
+        with self._metrics.span("retrieval", turn=self._turn_id):
+            results = await self._policy_retriever.aretrieve(msg)
+        return self._build_prompt(msg, results)
+
+    # Overload to answer fully specified requests without retrieval nor model
+    def _answer_locally(self, msg: str) -> Optional[str]:
+        request = self._route_locally(msg)
+        if request is None:
+            return None
+        policy_violation = self._fast_path_router.check_policies(request)
+        if policy_violation is not None:
+            self._record_local_turn(msg, policy_violation)
+            return policy_violation
+        fast_path_call = self._get_fast_path_call(request)
+        return self._answer_with_tool(msg, request, fast_path_call, self._call_tool_locally(fast_path_call))
+
+    async def _aanswer_locally(self, msg: str) -> Optional[str]:
+        request = self._route_locally(msg)
+        if request is None:
+            return None
+        policy_violation = self._fast_path_router.check_policies(request)
+        if policy_violation is not None:
+            self._record_local_turn(msg, policy_violation)
+            return policy_violation
+        fast_path_call = self._get_fast_path_call(request)
+        return self._answer_with_tool(msg, request, fast_path_call, await self._acall_tool_locally(fast_path_call))
+
+    def _route_locally(self, msg: str) -> Optional[FastPathRequest]:
+        if self._fast_path_router is None:
+            return None
+        return self._fast_path_router.route(msg)
+
+    def _get_fast_path_call(self, request: FastPathRequest) -> ToolCall:
+        return tool_call(name=request.tool, args=request.args, id=f"fast_path_{self._turn_id}")
+
+    def _answer_with_tool(self, msg: str, request: FastPathRequest, fast_path_call: ToolCall,
+                          tool_msg: Optional[ToolMessage]) -> Optional[str]:
+        """
+        Turns the output of a fast path tool call in the answer and records
+        the turn, the model answers instead when the tool failed
+        """
+        if tool_msg is None:
+            return None
+        answer = self._fast_path_router.get_answer(request, tool_msg.content)
+        self._record_local_turn(msg, answer, fast_path_call, tool_msg)
+        return answer
+
+    def _describe_tool_call(self, tool_call: ToolCall) -> str:
+        description = tool_call_descriptions.get(tool_call["name"].lower())
+        try:
+            return description.format(**tool_call["args"])
+        except (AttributeError, KeyError):
+            # Unknown tool or arguments missing from the call
+            return super()._describe_tool_call(tool_call)
+
+    def _build_prompt(self, msg: str, results: List[Document]) -> str:
+        """
+        Builds the prompt sent to the agent from the user message and the
+        booking policies retrieved for it. The policies enforced by the
+        booking rules of the toolkit are left out, the tools refuse what breaks
+        them.
+        """
+        policies = self._calendar_toolkit.get_policies()
+        if policies is not None:
+            results = [result for result in results if not policies.covers(result.page_content)]
         booking_policies_str = "\n".join([result.page_content for result in results])
         logger.debug(f"Policies retrieved\n{booking_policies_str}")
-        prompt = f"""
+        return f"""
 User msg: {msg}
 Relevant booking policies:
 {booking_policies_str}
@@ -56,23 +174,48 @@ Please respond to the user's message. You should only process request if they
 comply with booking policies, check if the user is not breaking one of them
 before processing
 """
-        return super().invoke(prompt)
 
 
     def reset_agent_and_calendar(self, calendar_toolkit: CalendarToolkit):
         """
         Resets the agent memory, the calendar and rebind the tools (else
-        the agent would remain bound to the previous calendar toolkit)
+        the agent would remain bound to the previous calendar toolkit). The
+        policies excluded from retrieval follow the booking rules of the new
+        toolkit
 
         :param calendar_toolkit: The new calendar toolkit to use
         """
         self._calendar_toolkit = calendar_toolkit
-        self._reset_memory_and_rebind_tools([
+        self._policy_retriever.set_excluded_policies(self._get_excluded_policies())
+        self._reset_memory_and_rebind_tools(self._get_tools())
+
+    def _get_excluded_policies(self) -> List[str]:
+        """
+        Get the policies enforced by the booking rules of the calendar toolkit,
+        they are left out of the retrieved policies
+        """
+        policies = self._calendar_toolkit.get_policies()
+        return policies.get_sources() if policies is not None else []
+
+    def _get_tools(self):
+        """
+        Get the tools the agent can call, bound to the current calendar toolkit
+        """
+        tools = [
             StructuredTool.from_function(get_today_date),
             StructuredTool.from_function(self._calendar_toolkit.is_time_slot_available),
             StructuredTool.from_function(self._calendar_toolkit.book),
-            StructuredTool.from_function(self._calendar_toolkit.get_available_slots)
-        ])
+            StructuredTool.from_function(self._calendar_toolkit.book_batch),
+            StructuredTool.from_function(self._calendar_toolkit.book_recurring),
+            StructuredTool.from_function(self._calendar_toolkit.get_available_slots),
+            StructuredTool.from_function(self._calendar_toolkit.get_available_slots_range)
+        ]
+        if self._multi_calendar_toolkit is not None:
+            tools += [
+                StructuredTool.from_function(self._multi_calendar_toolkit.find_earliest_slot),
+                StructuredTool.from_function(self._multi_calendar_toolkit.book_resource),
+            ]
+        return tools
 
     def get_calendar_json(self):
         """
@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional, TextIO
+
+from booking_agent.calendar_overlay import AnyCalendar
+from booking_agent.lazy_calendar import LazyCalendar
+
+logger = logging.getLogger("booking-agent")
+
+class BookingJournal:
+    """
+    Persists the bookings of a calendar without rewriting it. Each booking is
+    appended as one json line to a write-ahead journal, and the journal is
+    periodically compacted into a snapshot of the whole calendar.
+
+    Appends are flushed to the OS right away but fsynced in batches, a timer
+    fsyncs the last batch when no more bookings come, so a power loss can lose
+    at most sync_batch_size bookings or sync_interval seconds of bookings,
+    while a process crash loses none.
+
+    The journal can be shared by threads. Compaction rotates the journal before
+    dumping the calendar so that bookings can go on while it runs: every entry of
+    the rotated journal was applied to the calendar before the dump started. It
+    can run in a background thread (see start_compaction) so that the booking
+    crossing the threshold doesn't wait for the dump.
+
+    Attributes:
+        _directory: The directory holding the snapshot and the journal
+        _sync_batch_size: The amount of appends after which the journal is fsynced
+        _sync_interval: The amount of seconds after which the journal is fsynced
+        _compaction_threshold: The amount of journal entries after which
+            compaction is needed
+        _journal_file: The journal opened in append mode
+        _pending_syncs: The amount of appends that were not fsynced yet
+        _last_sync: The time of the last fsync
+        _sync_timer: Fsyncs the pending appends once sync_interval has passed
+        _compaction_thread: The background compaction, if one was started
+        _entries: The amount of entries in the journal
+        _lock: Serializes the appends and the rotation of the journal
+        _compaction_lock: Prevents concurrent compactions
+    """
+    SNAPSHOT_FILENAME = "snapshot.json"
+    JOURNAL_FILENAME = "journal.log"
+    ROTATED_JOURNAL_FILENAME = "journal.log.old"
+
+    _directory: str
+    _sync_batch_size: int
+    _sync_interval: float
+    _compaction_threshold: int
+    _journal_file: Optional[TextIO]
+    _pending_syncs: int
+    _last_sync: float
+    _sync_timer: Optional[threading.Timer]
+    _compaction_thread: Optional[threading.Thread]
+    _entries: int
+    _lock: threading.Lock
+    _compaction_lock: threading.Lock
+
+    def __init__(self, directory: str, sync_batch_size: int = 16,
+                 sync_interval: float = 1.0, compaction_threshold: int = 1000):
+        self._directory = directory
+        self._sync_batch_size = sync_batch_size
+        self._sync_interval = sync_interval
+        self._compaction_threshold = compaction_threshold
+        self._journal_file = None
+        self._pending_syncs = 0
+        self._last_sync = time.monotonic()
+        self._sync_timer = None
+        self._compaction_thread = None
+        self._entries = 0
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    ############
+    #  Public  #
+    ############
+
+    def load(self, initial_calendar: AnyCalendar) -> AnyCalendar:
+        """
+        Loads the last snapshot, or initial_calendar if there's none yet, and
+        replays the journal on top of it
+
+        :param initial_calendar: The calendar to start from when no snapshot exists
+        :return: The calendar with every journaled booking applied
+        """
+        if os.path.exists(self._snapshot_path):
+            # Only the dates of the journal entries are validated, the
+            # others are when they are first queried
+            calendar = LazyCalendar.from_file(self._snapshot_path)
+        else:
+            calendar = initial_calendar
+
+        self._entries = 0
+        # A rotated journal is left over when a compaction was interrupted
+        for journal_path in (self._rotated_journal_path, self._journal_path):
+            if os.path.exists(journal_path):
+                self._entries += self._replay_journal(calendar, journal_path)
+        logger.debug(f"Replayed {self._entries} bookings from the journal")
+        return calendar
+
+    def append(self, date: str, start_time: str):
+        """
+        Appends a booking to the journal
+
+        :param date: The date of the booked slot in YYYY-m-d format
+        :param start_time: The start of the booked slot, as written in the calendar
+        """
+        line = json.dumps({"date": date, "start": start_time}) + "\n"
+        with self._lock:
+            journal_file = self._get_journal_file()
+            journal_file.write(line)
+            journal_file.flush()
+            self._entries += 1
+            self._pending_syncs += 1
+            if (self._pending_syncs >= self._sync_batch_size
+                    or time.monotonic() - self._last_sync >= self._sync_interval):
+                self._sync()
+            elif self._sync_timer is None:
+                self._sync_timer = threading.Timer(self._sync_interval, self.sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+
+    def sync(self):
+        """
+        Forces the appended bookings to disk
+        """
+        with self._lock:
+            self._sync()
+
+    def needs_compaction(self) -> bool:
+        return self._entries >= self._compaction_threshold
+
+    def start_compaction(self, calendar: AnyCalendar):
+        """
+        Compacts the journal in a background thread, unless a compaction is
+        already running
+
+        :param calendar: The calendar with every booking of the journal applied
+        """
+        with self._lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self.compact, args=(calendar,),
+                                                       name="journal-compaction", daemon=True)
+            self._compaction_thread.start()
+
+    def wait_for_compaction(self):
+        """
+        Waits for the background compaction to end
+        """
+        compaction_thread = self._compaction_thread
+        if compaction_thread is not None:
+            compaction_thread.join()
+
+    def compact(self, calendar: AnyCalendar):
+        """
+        Writes calendar as the new snapshot and empties the journal. The
+        snapshot is atomically replaced so a crash leaves either the old
+        snapshot with the full journal or the new one.
+
+        :param calendar: The calendar with every booking of the journal applied
+        """
+        # Another thread is already compacting
+        if not self._compaction_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                self._sync()
+                if self._journal_file is not None:
+                    self._journal_file.close()
+                    self._journal_file = None
+                if os.path.exists(self._journal_path):
+                    os.replace(self._journal_path, self._rotated_journal_path)
+                self._entries = 0
+
+            tmp_path = self._snapshot_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(calendar.model_dump(), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._snapshot_path)
+            self._fsync_directory()
+
+            # Replaying entries that are already in the snapshot is harmless, so
+            # the rotated journal only has to be removed once the snapshot is durable
+            if os.path.exists(self._rotated_journal_path):
+                os.remove(self._rotated_journal_path)
+            logger.debug("Compacted the booking journal into a new snapshot")
+        finally:
+            self._compaction_lock.release()
+
+    def close(self):
+        self.wait_for_compaction()
+        with self._lock:
+            if self._journal_file is not None:
+                self._sync()
+                self._journal_file.close()
+                self._journal_file = None
+
+    #############
+    #  Private  #
+    #############
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self._directory, self.SNAPSHOT_FILENAME)
+
+    @property
+    def _journal_path(self) -> str:
+        return os.path.join(self._directory, self.JOURNAL_FILENAME)
+
+    @property
+    def _rotated_journal_path(self) -> str:
+        return os.path.join(self._directory, self.ROTATED_JOURNAL_FILENAME)
+
+    def _sync(self):
+        if self._journal_file is not None and self._pending_syncs > 0:
+            os.fsync(self._journal_file.fileno())
+        self._pending_syncs = 0
+        self._last_sync = time.monotonic()
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+
+    def _get_journal_file(self) -> TextIO:
+        if self._journal_file is None:
+            self._journal_file = open(self._journal_path, "a")
+        return self._journal_file
+
+    def _fsync_directory(self):
+        """
+        Makes the rename of the snapshot durable
+        """
+        directory_fd = os.open(self._directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    def _replay_journal(self, calendar: AnyCalendar, journal_path: str) -> int:
+        """
+        Replays every entry of a journal file on the calendar
+
+        :param calendar: The calendar to apply the bookings on
+        :param journal_path: The path of the journal file
+        :return: The amount of entries replayed
+        """
+        entries = 0
+        with open(journal_path, "rb+") as f:
+            valid_size = 0
+            missing_newline = False
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn write from a crash can only be the last line
+                    logger.warning(f"Ignoring a corrupted journal entry: {line!r}")
+                    break
+                self._replay(calendar, entry["date"], entry["start"])
+                entries += 1
+                valid_size += len(line)
+                missing_newline = not line.endswith(b"\n")
+            # The torn line is dropped and the last entry terminated so
+            # that the next appends don't get glued to them
+            f.truncate(valid_size)
+            if missing_newline:
+                f.seek(valid_size)
+                f.write(b"\n")
+        return entries
+
+    def _replay(self, calendar: AnyCalendar, date: str, start_time: str):
+        """
+        Marks the slot of a journal entry as booked
+
+        :param calendar: The calendar to apply the booking on
+        :param date: The date of the booked slot
+        :param start_time: The start of the booked slot
+        """
+        for slot in calendar.root.get(date, []):
+            if slot.start == start_time:
+                slot.available = False
+                return
+        logger.warning(f"Journaled booking on {date} at {start_time} doesn't match any slot")
@@ -0,0 +1,252 @@
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Annotated, Callable, ClassVar, Iterable, List, Literal, Optional, Tuple, Union
+
+from pydantic import BaseModel, Field, PrivateAttr, TypeAdapter
+
+from booking_agent.calendar import get_date_obj, get_in_minutes
+
+logger = logging.getLogger("booking-agent")
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def normalize_policy(policy: str) -> str:
+    """
+    Get the text of a policy without what doesn't change its meaning (case,
+    spacing, final full stop), so that policies written slightly differently
+    in the rules and in the index are recognized
+    """
+    return " ".join(policy.lower().split()).rstrip(".").rstrip()
+
+
+class BookingRule(BaseModel):
+    """
+    A booking policy checked without the model. Rules are validated from the
+    rules file and their times converted to minutes once, checking a booking
+    is then a few comparisons.
+
+    Attributes:
+        source: The text of the policy enforced by the rule, the reason given
+            when a booking breaks it
+    """
+    source: str
+    # Whether the rule depends on the current time, so that results computed
+    # with it can't be cached for long
+    depends_on_time: ClassVar[bool] = False
+
+    def clip(self, day: date, start: int, end: int, now: datetime) -> Tuple[int, int]:
+        """
+        Get the part of a window of a day where the rule allows bookings, the
+        window is empty when start >= end
+
+        :param day: The date of the window
+        :param start: The start of the window in minutes
+        :param end: The end of the window in minutes
+        :param now: The current time
+        """
+        return start, end
+
+    def allows_duration(self, duration: int) -> bool:
+        """
+        Whether the rule allows a booking of a duration in minutes
+        """
+        return True
+
+
+class MaxDurationRule(BookingRule):
+    """
+    Bookings can't last longer than a duration
+
+    Attributes:
+        duration: The longest duration in format HH:mm
+    """
+    type: Literal["max_duration"] = "max_duration"
+    duration: str
+    _minutes: int = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._minutes = get_in_minutes(self.duration)
+
+    def allows_duration(self, duration: int) -> bool:
+        return duration <= self._minutes
+
+
+class AllowedHoursRule(BookingRule):
+    """
+    Bookings must start and end within opening hours
+
+    Attributes:
+        start: The opening time in format HH:mm
+        end: The closing time in format HH:mm
+    """
+    type: Literal["allowed_hours"] = "allowed_hours"
+    start: str
+    end: str
+    _start: int = PrivateAttr()
+    _end: int = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._start = get_in_minutes(self.start)
+        self._end = get_in_minutes(self.end)
+
+    def clip(self, day: date, start: int, end: int, now: datetime) -> Tuple[int, int]:
+        return max(start, self._start), min(end, self._end)
+
+
+class AllowedWeekdaysRule(BookingRule):
+    """
+    Bookings can only be made on some days of the week
+
+    Attributes:
+        weekdays: The names of the allowed days ("Monday", "Tuesday"..)
+    """
+    type: Literal["allowed_weekdays"] = "allowed_weekdays"
+    weekdays: List[Literal["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]]
+    _weekdays: frozenset = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._weekdays = frozenset(WEEKDAYS.index(weekday) for weekday in self.weekdays)
+
+    def clip(self, day: date, start: int, end: int, now: datetime) -> Tuple[int, int]:
+        return (start, end) if day.weekday() in self._weekdays else (start, start)
+
+
+class MinLeadTimeRule(BookingRule):
+    """
+    Bookings must be made some time in advance
+
+    Attributes:
+        hours: The least amount of hours between now and the booking
+    """
+    type: Literal["min_lead_time"] = "min_lead_time"
+    hours: float
+    depends_on_time: ClassVar[bool] = True
+
+    def clip(self, day: date, start: int, end: int, now: datetime) -> Tuple[int, int]:
+        earliest = now + timedelta(hours=self.hours)
+        if day < earliest.date():
+            return start, start
+        if day > earliest.date():
+            return start, end
+        return max(start, earliest.hour * 60 + earliest.minute + (earliest.second > 0)), end
+
+
+AnyRule = Annotated[Union[MaxDurationRule, AllowedHoursRule, AllowedWeekdaysRule, MinLeadTimeRule],
+                    Field(discriminator="type")]
+
+_rules_adapter = TypeAdapter(List[AnyRule])
+
+
+class BookingPolicies:
+    """
+    The booking policies that can be checked without the model, compiled from
+    a rules file. The toolkit refuses bookings breaking them and doesn't
+    propose slots breaking them, so only the policies that are not rules are
+    left to the model.
+
+    Attributes:
+        _rules: The rules, in the order of the file
+        _clock: Gives the current time, for lead times
+        _depends_on_time: Whether a rule depends on the current time
+    """
+    _rules: List[BookingRule]
+    _clock: Callable[[], datetime]
+    _depends_on_time: bool
+
+    def __init__(self, rules: Iterable[BookingRule], clock: Callable[[], datetime] = datetime.now):
+        self._rules = list(rules)
+        self._clock = clock
+        self._depends_on_time = any(rule.depends_on_time for rule in self._rules)
+
+    @classmethod
+    def from_file(cls, path: str, clock: Callable[[], datetime] = datetime.now) -> "BookingPolicies":
+        """
+        Compiles a rules file in the format of data/booking_rules.json
+
+        :param path: The path of the rules file
+        :param clock: Gives the current time, for lead times
+        """
+        with open(path, "r") as f:
+            rules = _rules_adapter.validate_python(json.load(f)["rules"])
+        logger.debug(f"Compiled {len(rules)} booking rules from {path}")
+        return cls(rules, clock)
+
+    ############
+    #  Public  #
+    ############
+
+    def get_sources(self) -> List[str]:
+        """
+        Get the texts of the policies enforced by the rules
+        """
+        return list(dict.fromkeys(rule.source for rule in self._rules))
+
+    def covers(self, policy: str) -> bool:
+        """
+        Whether a policy of the policy file is enforced by the rules, the
+        texts are compared once normalized
+        """
+        return normalize_policy(policy) in {normalize_policy(source) for source in self.get_sources()}
+
+    def check(self, date: str, start_time: str, duration: str) -> Optional[str]:
+        """
+        Checks a booking against the rules
+
+        :param date: The date in format YYYY-m-d
+        :param start_time: The start time in format HH:mm
+        :param duration: The duration in format HH:mm
+        :return: Why the booking is refused, None if the rules allow it
+        """
+        rule = self.get_broken_rule(date, start_time, duration)
+        if rule is None:
+            return None
+        return f"This booking is not allowed by the booking policies: {rule.source}"
+
+    def get_broken_rule(self, date: str, start_time: str, duration: str) -> Optional[BookingRule]:
+        """
+        Get the first rule refusing a booking, None if every rule allows it or
+        if the booking can't be parsed (the calendar reports it)
+        """
+        try:
+            day = get_date_obj(date)
+            start = get_in_minutes(start_time)
+            end = start + get_in_minutes(duration)
+        except ValueError:
+            return None
+        now = self._clock() if self._depends_on_time else None
+        for rule in self._rules:
+            if not rule.allows_duration(end - start) or rule.clip(day, start, end, now) != (start, end):
+                return rule
+        return None
+
+    def get_duration_rule(self, duration: int) -> Optional[BookingRule]:
+        """
+        Get the first rule refusing any booking of a duration in minutes
+        """
+        for rule in self._rules:
+            if not rule.allows_duration(duration):
+                return rule
+        return None
+
+    def clip(self, day: date, start: int, end: int) -> Tuple[int, int]:
+        """
+        Get the part of a free window of a day where bookings are allowed, the
+        window is empty when start >= end
+        """
+        now = self._clock() if self._depends_on_time else None
+        for rule in self._rules:
+            start, end = rule.clip(day, start, end, now)
+            if start >= end:
+                break
+        return start, end
+
+    def get_time_key(self) -> Optional[int]:
+        """
+        Get the current minute when a rule depends on the time, so that
+        results computed with the rules are cached for a minute at most
+        """
+        if not self._depends_on_time:
+            return None
+        return int(self._clock().timestamp() // 60)
@@ -1,4 +1,4 @@
-from gradio.processing_utils import logging
+import logging
 from datetime import date, datetime
 
 logger = logging.getLogger("booking-agent")
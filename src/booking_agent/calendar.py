@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
 from typing import Dict, List
 from pydantic import BaseModel, RootModel
 
@@ -10,10 +11,19 @@ def get_time_obj(time_str: str):
     """
     return datetime.strptime(time_str, "%H:%M")
 
+def get_date_obj(date_str: str) -> date:
+    """
+    Transforms a date str in format YYYY-m-d to a date object
+
+    :param date_str: The date str to be transformed
+    """
+    return datetime.strptime(date_str, "%Y-%m-%d").date()
+
+@lru_cache(maxsize=4096)
 def get_in_minutes(time: str) -> int:
     """
     Converts a time str in H:M format to an int that is the amount of minutes it
-    represents
+    represents. Results are cached since calendars reuse the same few times.
 
     :param time: The time str in H:M format
     :return: The amount of minutes
@@ -21,6 +31,17 @@ def get_in_minutes(time: str) -> int:
     time_obj = get_time_obj(time)
     return time_obj.hour * 60 + time_obj.minute
 
+def format_minutes(minutes: int) -> str:
+    """
+    Converts an amount of minutes to a time str in HH:MM format, it is the
+    inverse of get_in_minutes
+
+    :param minutes: The amount of minutes
+    :return: The time str in HH:MM format
+    """
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}"
+
 class TimeSlot(BaseModel):
     start: str
     end: str
@@ -31,5 +52,19 @@ class TimeSlot(BaseModel):
 
 
 
+class SlotRequest(BaseModel):
+    """
+    A slot asked for a booking
+
+    Attributes:
+        date: The date in format YYYY-m-d
+        start_time: The start time of the slot in format HH:mm
+        duration: The duration of the slot in format HH:mm
+    """
+    date: str
+    start_time: str
+    duration: str
+
+
 class Calendar(RootModel):
     root: Dict[str, List[TimeSlot]]
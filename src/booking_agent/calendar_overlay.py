@@ -0,0 +1,107 @@
+import logging
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple, Union
+
+from booking_agent.calendar import Calendar, TimeSlot
+from booking_agent.lazy_calendar import LazyCalendar
+
+if TYPE_CHECKING:
+    # Only imported by multi-process deployments
+    from booking_agent.shared_calendar import SharedMemoryCalendar
+
+logger = logging.getLogger("booking-agent")
+
+
+class OverlayDays(Mapping):
+    """
+    The dates of an overlay: the slots of a date are copied from the base the
+    first time the date is accessed, and the copies are the ones booked. The
+    base is never modified.
+
+    Attributes:
+        _base: The slots of each date of the base calendar
+        _copies: The copied slots of the dates accessed so far, with the
+            availability of the slots when they were copied
+    """
+    _base: Mapping
+    _copies: Dict[str, Tuple[List[TimeSlot], List[bool]]]
+
+    def __init__(self, base: Mapping):
+        self._base = base
+        self._copies = {}
+
+    def __getitem__(self, date: str) -> List[TimeSlot]:
+        copy = self._copies.get(date)
+        if copy is None:
+            slots = [slot.model_copy() for slot in self._base[date]]
+            # Like LazyDays, the first copy wins if two threads make one
+            copy = self._copies.setdefault(date, (slots, [slot.available for slot in slots]))
+        return copy[0]
+
+    def __contains__(self, date: object) -> bool:
+        return date in self._base
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._base)
+
+    def __len__(self) -> int:
+        return len(self._base)
+
+    def get_copied_dates(self) -> List[str]:
+        return list(self._copies)
+
+    def get_changes(self) -> List[Tuple[str, TimeSlot]]:
+        changes = []
+        for date, (slots, copied_availabilities) in list(self._copies.items()):
+            for slot, copied_available in zip(slots, copied_availabilities):
+                if slot.available != copied_available:
+                    changes.append((date, slot))
+        return changes
+
+
+class CalendarOverlay:
+    """
+    A copy-on-write view of a calendar. Only the dates accessed through the
+    overlay are copied, so creating one is free whatever the size of the base,
+    and dropping its changes is just forgetting the copies. Overlays can be
+    stacked, the base of an overlay can be another overlay.
+
+    Attributes:
+        root: The slots of each date, like Calendar.root
+        _base: The calendar the overlay is over, it is never modified
+    """
+    root: OverlayDays
+    _base: "AnyCalendar"
+
+    def __init__(self, base: "AnyCalendar"):
+        self._base = base
+        self.root = OverlayDays(base.root)
+
+    def get_changes(self) -> List[Tuple[str, TimeSlot]]:
+        """
+        Get the slots changed through the overlay, compared to the base when
+        their date was copied (the base may have changed since)
+
+        :return: The (date, slot) of each changed slot, slot being the one of
+            the overlay
+        """
+        return self.root.get_changes()
+
+    def reset(self):
+        """
+        Drops every change, the overlay shows the base again
+        """
+        self.root = OverlayDays(self._base.root)
+
+    def model_dump(self) -> Dict[str, List[dict]]:
+        """
+        Get the calendar in json format, like Calendar.model_dump
+        """
+        calendar_dict = self._base.model_dump()
+        for date in self.root.get_copied_dates():
+            calendar_dict[date] = [slot.model_dump() for slot in self.root[date]]
+        return calendar_dict
+
+
+# Every calendar can be given to the toolkit and the journal
+AnyCalendar = Union[Calendar, LazyCalendar, CalendarOverlay, "SharedMemoryCalendar"]
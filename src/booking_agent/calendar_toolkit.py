@@ -1,12 +1,32 @@
 import logging
-from typing import List, Optional, Tuple, cast
+import threading
+from collections import deque
+from contextlib import ExitStack
+from datetime import date as Date, timedelta
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
 
-from booking_agent.calendar import Calendar, TimeSlot, get_in_minutes
-from booking_agent.exceptions import DateUnavailableError, TimeSlotUnavailableError
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.booking_policies import BookingPolicies
+from booking_agent.calendar import SlotRequest, TimeSlot, format_minutes, get_date_obj, get_in_minutes
+from booking_agent.calendar_overlay import AnyCalendar, CalendarOverlay
+from booking_agent.exceptions import CalendarNotForkedError, DateUnavailableError, TimeSlotUnavailableError
+from booking_agent.result_cache import VersionedResultCache
+from booking_agent.slot_index import DaySlotIndex
+
+if TYPE_CHECKING:
+    # numpy is only needed by range searches, it is imported on the first one
+    from booking_agent.availability_bitmap import AvailabilityBitmap
 
 
 date_error_msg = "The calendar doesn't provide information about this specific date."
 
+# The amount of changes kept in the change feed, a reader further behind has
+# to reload everything
+CHANGE_FEED_SIZE = 1024
+
+# Tells a cache miss from a cached result that is None or False
+_missing = object()
+
 
 logger = logging.getLogger("booking-agent")
 
@@ -16,21 +36,115 @@ class CalendarToolkit:
     For simplicity here, I directly access the calendar object but in production,
     this would be an abstract class and a strategy design pattern could be
     implemented to adapt to the client calendar (google calendar, apple calendar..)
-    """
-    _calendar: Calendar
 
-    def __init__(self, calendar: Calendar):
+    A toolkit can be shared by several sessions running in different threads.
+    Bookings of a date are serialized by a lock of this date only, so that
+    bookings on different dates don't wait for each other, and every booking
+    bumps the version of its date.
+
+    Every change also bumps the version of the whole calendar and is recorded
+    in a change feed, so that views can tell what changed since they were
+    rendered instead of reloading the calendar.
+
+    A toolkit can be forked over a copy-on-write overlay of its calendar, to
+    give a session a sandbox or to explore a what-if branch. The fork only
+    copies the dates it accesses, its bookings are applied to the parent when
+    committed and dropped when discarded.
+
+    The results of the read-only tools are cached with the version of the
+    dates they read, so a question asked again is answered without searching
+    until a booking changes one of these dates.
+
+    When booking policies are given, bookings breaking them are refused and
+    searches only propose slots complying with them.
+    """
+    _calendar: AnyCalendar
+    _indexes: Dict[str, DaySlotIndex]
+    _bitmap: Optional["AvailabilityBitmap"]
+    _journal: Optional[BookingJournal]
+    _date_locks: Dict[str, threading.Lock]
+    _versions: Dict[str, int]
+    _version: int
+    _changes: Deque[Tuple[int, str]]
+    _guard: threading.Lock
+    _parent: Optional["CalendarToolkit"]
+    _results: VersionedResultCache
+    _policies: Optional[BookingPolicies]
+
+    def __init__(self, calendar: AnyCalendar, journal: Optional[BookingJournal] = None,
+                 result_cache_size: int = 4096, policies: Optional[BookingPolicies] = None):
         self._calendar = calendar
+        # When provided, every booking is persisted in it
+        self._journal = journal
+        # Built lazily, one per date, the first time a date is queried
+        self._indexes = {}
+        # Built lazily, on the first range search
+        self._bitmap = None
+        self._date_locks = {}
+        self._versions = {}
+        self._version = 0
+        # The (version, date) of the last changes
+        self._changes = deque(maxlen=CHANGE_FEED_SIZE)
+        # Protects the creation of the date locks, of the bitmap and the
+        # change feed
+        self._guard = threading.Lock()
+        # The toolkit this one was forked from, if any
+        self._parent = None
+        # Shared by every session using the toolkit, 0 disables it
+        self._results = VersionedResultCache(result_cache_size)
+        self._policies = policies
 
     ############
     #  Public  #
     ############
 
-    def get_calendar_json(self):
+    def get_calendar_json(self, dates: Optional[Iterable[str]] = None):
         """
         Get the current loaded calendar in json format
+
+        :param dates: The dates to get, every date if None. Dates missing from
+            the calendar are ignored.
+        """
+        if dates is None:
+            return self._calendar.model_dump()
+        return {date: [slot.model_dump() for slot in self._get_slots(date)]
+                for date in dates if date in self._calendar.root}
+
+    def get_dates(self) -> List[str]:
+        """
+        Get the dates of the calendar, in the order of the calendar
+        """
+        return list(self._calendar.root)
+
+    def get_version(self) -> int:
+        """
+        Get the version of the calendar, it is bumped by every change
+        """
+        return self._version
+
+    def get_policies(self) -> Optional[BookingPolicies]:
+        return self._policies
+
+    def get_cache_stats(self) -> Dict[str, int]:
         """
-        return self._calendar.model_dump()
+        Get the hits and misses of the cache of the read-only tools
+        """
+        return self._results.get_stats()
+
+    def get_changes_since(self, version: int) -> Optional[List[str]]:
+        """
+        Get the dates changed since a version of the calendar
+
+        :param version: A version given by get_version
+        :return: The changed dates without duplicates, or None when the
+            change feed doesn't go back to this version anymore
+        """
+        with self._guard:
+            if version == self._version:
+                return []
+            if version > self._version or len(self._changes) == 0 or self._changes[0][0] > version + 1:
+                return None
+            return list(dict.fromkeys(date for change_version, date in self._changes if change_version > version))
 
     def book(self, date: str, start_time: str, duration: str):
         """
@@ -41,17 +155,93 @@ class CalendarToolkit:
         :param duration: The duration of the slot in format HH:mm
         """
         logger.debug(f"Booking on {date} at {start_time} for a duration of {duration}")
-        if not self.is_time_slot_available(date, start_time, duration):
-            return "This time slot is not available for booking or the duration is not fitting in this specific time slot."
+        violation = self._policies.check(date, start_time, duration) if self._policies is not None else None
+        if violation is not None:
+            return violation
         try:
-            slot = self._find_slot(date, start_time)
+            index, position = self._find_position(date, start_time)
         except DateUnavailableError:
             return date_error_msg
         except TimeSlotUnavailableError:
             return f"The calendar doesn't provide information about the slot you asked on {date}"
-        slot.available = False
+        # The check and the booking must be atomic, else two sessions could
+        # both see the slot available and book it
+        with self._get_date_lock(date):
+            if not index.is_available(position):
+                return "This time slot is already booked (it may have just been booked in another conversation), it is not available anymore."
+            if not self._is_duration_valid(index.get_duration(position), duration):
+                return "This time slot is not available for booking or the duration is not fitting in this specific time slot."
+            self._mark_booked(date, index, position)
+        self._journal_bookings([(date, index.get_slot(position).start)])
         return f"Booked at {start_time} on {date} with success"
 
+    def book_batch(self, slots: List[SlotRequest]):
+        """
+        Book several time slots at once, either every slot is booked or none
+        is. Use it instead of several book calls when the user wants more
+        than one appointment.
+
+        :param slots: The slots to book, each with a date in format YYYY-m-d,
+            a start_time and a duration in format HH:mm
+        """
+        logger.debug(f"Booking a batch of {len(slots)} slots")
+        return self._book_all([SlotRequest.model_validate(slot) for slot in slots])
+
+    def book_recurring(self, start_date: str, start_time: str, duration: str,
+                       interval_days: int = 7, occurrences: int = 1):
+        """
+        Book a recurring appointment (every week, every two days..), either
+        every occurrence is booked or none is.
+
+        :param start_date: The date of the first occurrence in format YYYY-m-d
+        :param start_time: The start time of each occurrence in format HH:mm
+        :param duration: The duration of each occurrence in format HH:mm
+        :param interval_days: The amount of days between two occurrences, 7 for every week
+        :param occurrences: The amount of occurrences to book
+        """
+        logger.debug(f"Booking {occurrences} occurrences every {interval_days} days from {start_date} at {start_time}")
+        try:
+            first_date = get_date_obj(start_date)
+        except ValueError:
+            return "Dates must be in format YYYY-m-d."
+        if interval_days < 1 or occurrences < 1:
+            return "The interval and the amount of occurrences must be at least 1."
+        return self._book_all([SlotRequest(date=str(first_date + timedelta(days=interval_days * occurrence)),
+                                           start_time=start_time, duration=duration)
+                               for occurrence in range(occurrences)])
+
+    def book_covering(self, date: str, start_time: str, duration: str):
+        """
+        Book the contiguous slots covering the time from start_time for a
+        duration, either every slot is booked or none is. The time doesn't
+        have to start at the start of a slot, so windows merging several
+        slots or intersecting calendars can be booked as they are found.
+
+        :param date: The date in format YYYY-m-d
+        :param start_time: The start of the time to cover in format HH:mm
+        :param duration: The duration to cover in format HH:mm
+        """
+        logger.debug(f"Booking the slots covering {duration} from {start_time} on {date}")
+        try:
+            start = get_in_minutes(start_time)
+            end = start + get_in_minutes(duration)
+        except ValueError:
+            return "The start time and the duration must be in format HH:mm."
+        try:
+            index = self._get_index(date)
+        except DateUnavailableError:
+            return date_error_msg
+        positions = index.get_positions_overlapping(start, end)
+        if (len(positions) == 0 or index.get_start(positions[0]) > start or index.get_end(positions[-1]) < end
+                or any(index.get_end(previous) != index.get_start(position)
+                       for previous, position in zip(positions, positions[1:]))):
+            return f"The calendar has no contiguous slots covering {duration} from {start_time} on {date}."
+        if len(positions) == 1 and index.get_start(positions[0]) == start:
+            return self.book(date, start_time, duration)
+        return self._book_all([SlotRequest(date=date, start_time=format_minutes(index.get_start(position)),
+                                           duration=format_minutes(index.get_duration(position)))
+                               for position in positions])
+
     def is_time_slot_available(self, date: str,
                                start_time: str, duration: str = "01:00"):
         """
@@ -63,15 +253,9 @@ class CalendarToolkit:
         :param duration: The duration of the slot in format HH:mm
         """
         logger.debug(f"Checking availability on {date} at {start_time} for a duration of {duration}")
-        try:
-            slot = self._find_slot(date, start_time)
-        except DateUnavailableError:
-            return date_error_msg
-        except TimeSlotUnavailableError:
-            return f"The calendar doesn't provide information about the slot you asked on {date}"
-        if not slot.available:
-            return False
-        return self._is_duration_valid(slot, duration)
+        return self._get_cached(("is_time_slot_available", date, start_time, duration, self._get_policies_key()),
+                                self._get_version(date),
+                                lambda: self._is_time_slot_available(date, start_time, duration))
 
     def get_available_slots(self, date: str, duration: str):
         """
@@ -82,100 +266,469 @@ class CalendarToolkit:
         :param duration: The duration of the slots we want to have
         """
         logger.debug(f"Getting available slots on {date} for {duration}")
+        return self._get_cached(("get_available_slots", date, duration, self._get_policies_key()),
+                                self._get_version(date),
+                                lambda: self._get_available_slots(date, duration))
+
+    def get_available_slots_range(self, start_date: str, end_date: str, duration: str):
+        """
+        Get every available window that can hold a specific duration on all
+        the dates between start_date and end_date (both included). Contiguous
+        available slots are merged in a single window, the slots making it up
+        are listed and must be booked together with book_batch.
+
+        :param start_date: The first date of the range in format YYYY-m-d
+        :param end_date: The last date of the range in format YYYY-m-d
+        :param duration: The duration of the slots we want to have in format HH:mm
+        """
+        logger.debug(f"Getting available slots between {start_date} and {end_date} for {duration}")
+        try:
+            start_ordinal = get_date_obj(start_date).toordinal()
+            end_ordinal = get_date_obj(end_date).toordinal()
+            duration_minutes = get_in_minutes(duration)
+        except ValueError:
+            return "Dates must be in format YYYY-m-d and the duration in format HH:mm."
+        duration_violation = self._get_duration_violation(duration_minutes)
+        if duration_violation is not None:
+            return duration_violation
+        bitmap = self._get_bitmap()
+        first, last = bitmap.get_range(start_ordinal, end_ordinal)
+        if first == last:
+            return f"The calendar doesn't provide information about any date between {start_date} and {end_date}."
+        # Versions only go up, so their sum changes whenever a date of the
+        # range changes
+        version = sum(self._get_version(date) for date in bitmap.get_dates(first, last))
+        key = ("get_available_slots_range", start_date, end_date, duration, self._get_policies_key())
+        return self._get_cached(key, version,
+                                lambda: self._get_available_slots_range(start_date, end_date, duration,
+                                                                        duration_minutes, first, last))
+
+    def get_alternatives(self, date: str, start_time: str, duration: str) -> str:
+        """
+        Describes the available slots of a date that could replace an
+        unavailable one, the closest to start_time first
+
+        :param date: The date in format YYYY-m-d
+        :param start_time: The start time asked in format HH:mm
+        :param duration: The duration asked in format HH:mm
+        """
+        return self._get_alternatives_str(SlotRequest(date=date, start_time=start_time, duration=duration))
+
+    def get_free_windows(self, date: str) -> List[Tuple[int, int]]:
+        """
+        Get the free windows of a date, contiguous available slots are merged
+        in a single window
+
+        :param date: The date in YYYY-m-d format
+        :return: The (start, end) minutes of each window, chronologically sorted
+        :raises DateUnavailableError: date not found in calendar
+        """
+        windows = []
+        for start, end in self._get_free_intervals(date):
+            if len(windows) > 0 and windows[-1][1] == start:
+                windows[-1] = (windows[-1][0], end)
+            else:
+                windows.append((start, end))
+        day = self._get_policies_day(date)
+        if day is None:
+            return windows
+        windows = [self._policies.clip(day, start, end) for start, end in windows]
+        return [(start, end) for start, end in windows if start < end]
+
+    def fork(self) -> "CalendarToolkit":
+        """
+        Get a toolkit over a copy-on-write overlay of the calendar, its
+        bookings don't change this calendar until they are committed. A date
+        is copied when the fork first accesses it, so later bookings of this
+        calendar on the date are only seen by the fork as conflicts on commit.
+        """
+        toolkit = CalendarToolkit(CalendarOverlay(self._calendar), policies=self._policies)
+        toolkit._parent = self
+        return toolkit
+
+    def commit(self) -> List[str]:
+        """
+        Applies the bookings of a forked toolkit to its parent, through the
+        booking of the parent so that they are locked, journaled and
+        versioned like any other booking. The fork then shows the parent again.
+
+        :return: The answers of the bookings that could not be applied, the
+            slot was booked in the parent in the meantime
+        :raises CalendarNotForkedError: the toolkit was not forked
+        """
+        if self._parent is None:
+            raise CalendarNotForkedError
+        failures = []
+        for date, slot in self._calendar.get_changes():
+            if slot.available:
+                continue
+            answer = self._parent.book(date, slot.start, format_minutes(slot.get_duration_in_minutes()))
+            if "with success" not in answer:
+                failures.append(answer)
+        logger.debug(f"Committed a fork with {len(failures)} conflicts")
+        self.discard()
+        return failures
+
+    def discard(self):
+        """
+        Drops the bookings of a forked toolkit that were not committed
+
+        :raises CalendarNotForkedError: the toolkit was not forked
+        """
+        if self._parent is None:
+            raise CalendarNotForkedError
+        copied_dates = self._calendar.root.get_copied_dates()
+        with self._guard:
+            self._calendar.reset()
+            self._indexes = {}
+            self._bitmap = None
+        self._record_changes(copied_dates)
+
+    #############
+    #  Private  #
+    #############
+
+    def _is_time_slot_available(self, date: str, start_time: str, duration: str):
         try:
-            slots_rec = self._get_available_slots_rec(date, duration)
+            index, position = self._find_position(date, start_time)
         except DateUnavailableError:
             return date_error_msg
-        if slots_rec is None:
-            return f"No available slots for {duration}"
+        except TimeSlotUnavailableError:
+            return f"The calendar doesn't provide information about the slot you asked on {date}"
+        if not index.is_available(position):
+            return False
+        if not self._is_duration_valid(index.get_duration(position), duration):
+            return False
+        violation = self._policies.check(date, start_time, duration) if self._policies is not None else None
+        if violation is not None:
+            return f"The slot is free but can't be booked. {violation}"
+        return True
 
-        slots_pack, multiplier = slots_rec
-        if multiplier == 1:
-            logger.debug(f"Found the following slots {slots_pack}, with multiplier {multiplier}")
-            slots_str = ", ".join([f"{slot.start} up to {slot.end}" for slot in slots_pack])
+    def _get_available_slots(self, date: str, duration: str):
+        try:
+            index = self._get_index(date)
+        except DateUnavailableError:
+            return date_error_msg
+        duration_in_minutes = get_in_minutes(duration)
+        duration_violation = self._get_duration_violation(duration_in_minutes)
+        if duration_violation is not None:
+            return duration_violation
+        day = self._get_policies_day(date)
+        available_positions = [position for position in range(len(index)) if index.is_available(position)
+                               and (day is None or self._is_bookable(day, index.get_start(position),
+                                                                     index.get_end(position)))]
+
+        fitting_slots = [index.get_slot(position) for position in available_positions
+                         if index.get_duration(position) >= duration_in_minutes]
+        if len(fitting_slots) > 0:
+            logger.debug(f"Found the following slots {fitting_slots}")
+            slots_str = ", ".join([f"{slot.start} up to {slot.end}" for slot in fitting_slots])
             return f"On date {date}, available slots are {slots_str}"
 
+        groups = self._trim_and_group_slots(duration_in_minutes,
+                                            [index.get_slot(position) for position in available_positions])
+        if len(groups) == 0:
+            return f"No available slots for {duration}"
+        # Not logging the groups themselves, their repr costs more than the search
+        logger.debug(f"Found {len(groups)} combinations")
         slots_str = ""
-        slots_pack = cast(List[List[TimeSlot]], slots_pack) # For pyright
-        for pack_number, pack in enumerate(slots_pack):
-            slots_str += f"Combination {pack_number}:\n"
-            for slot in pack:
-                slots_str += f"{slot.start} up to {slot.end}"
+        for group_number, group in enumerate(groups):
+            group_str = ", ".join([f"{slot.start} up to {slot.end}" for slot in group])
+            slots_str += f"\nCombination {group_number} ({group[0].start} up to {group[-1].end}): {group_str}"
 
-        return f"On date {date}, there's no single slot of that duration. Here are combinations that would simulate this duration when they are booked {slots_str}!."
+        return f"On date {date}, there's no single slot of that duration. Here are combinations that would simulate this duration when they are booked:{slots_str}"
 
-    #############
-    #  Private  #
-    #############
+    def _get_available_slots_range(self, start_date: str, end_date: str, duration: str,
+                                   duration_minutes: int, first: int, last: int):
+        """
+        Searches the windows of the rows between first and last of the bitmap
+        """
+        bitmap = self._get_bitmap()
+        for date in bitmap.get_unfilled_dates(first, last):
+            # Under the date lock so that a concurrent booking can't happen
+            # between reading the slots and filling the row
+            with self._get_date_lock(date):
+                bitmap.set_day(date, self._get_free_intervals(date))
+
+        windows = bitmap.find_windows(first, last, duration_minutes)
+        if self._policies is not None:
+            windows = [(date, *self._policies.clip(get_date_obj(date), start, end)) for date, start, end in windows]
+            windows = [(date, start, end) for date, start, end in windows if end - start >= duration_minutes]
+        windows_by_date: Dict[str, List[str]] = {}
+        several_slots = False
+        for date, start, end in windows:
+            for slots in self._get_window_slots(date, start, end, duration_minutes):
+                window_str = f"{format_minutes(slots[0][0])} up to {format_minutes(slots[-1][1])}"
+                if len(slots) > 1:
+                    several_slots = True
+                    slots_str = ", ".join([f"{format_minutes(slot_start)} up to {format_minutes(slot_end)}"
+                                           for slot_start, slot_end in slots])
+                    window_str += f" [{slots_str}]"
+                windows_by_date.setdefault(date, []).append(window_str)
+        if len(windows_by_date) == 0:
+            return f"No available slots for {duration} between {start_date} and {end_date}"
+        dates_str = "\n".join([f"On date {date}: {', '.join(date_windows)}"
+                               for date, date_windows in windows_by_date.items()])
+        answer = f"Available slots for {duration} between {start_date} and {end_date}:\n{dates_str}"
+        if several_slots:
+            answer += ("\nWindows made of several slots, listed in brackets, are booked by booking together "
+                       "with book_batch the contiguous slots holding the duration, each for its own duration.")
+        return answer
+
+    def _get_window_slots(self, date: str, start: int, end: int, duration: int) -> List[List[Tuple[int, int]]]:
+        """
+        Get the available slots lying in a free window, the window can be cut
+        in several runs of contiguous slots when the policies clipped it in
+        the middle of a slot
 
-    def _get_available_slots_rec(self, date: str, duration: str, rec_multiplier = 1) -> Optional[Tuple[List[TimeSlot], int]]:
+        :param duration: The duration wanted in minutes
+        :return: The (start, end) of the slots of each run that can hold the duration
         """
-        Hacky function that get the available slots that fit a duration at a
-        specific date.
-        If there's no available slots, it tries recursively with
-        half the duration and increase a rec_multiplier until it finds available slots,
-        then it groups them to make contiguous groups that could simulate the
-        duration wanted.
+        index = self._get_index(date)
+        runs: List[List[Tuple[int, int]]] = []
+        for position in index.get_positions_within(start, end):
+            if not index.is_available(position):
+                continue
+            slot = (index.get_start(position), index.get_end(position))
+            if len(runs) > 0 and runs[-1][-1][1] == slot[0]:
+                runs[-1].append(slot)
+            else:
+                runs.append([slot])
+        return [run for run in runs if run[-1][1] - run[0][0] >= duration]
+
+    def _get_policies_key(self) -> Optional[int]:
         """
-        logger.debug(f"Getting available slots on {date} for {duration}")
-        slots = self._get_slots(date)
-        filtered_slots = [slot for slot in slots if slot.available and self._is_duration_valid(slot, duration)]
-        logger.debug(f"Found the following slots: {filtered_slots}")
-        duration_in_minutes = get_in_minutes(duration)
+        Get what results computed with the policies depend on besides the
+        calendar, the current minute when a policy depends on the time
+        """
+        return self._policies.get_time_key() if self._policies is not None else None
 
-        # No slots available
-        if len(filtered_slots) == 0:
-            # We go out if we splitted too much (30 is half the minimum amount
-            # here, in reality this would be to define according to the calendar
-            # type)
-            if duration_in_minutes < 30:
-                return None
-            half_minutes = duration_in_minutes / 2
-            hours, minutes = divmod(half_minutes, 60)
-            half_duration = f"{int(hours):02d}:{int(minutes):02d}"
-            # Try with half the duration and increase the multiplier
-            return self._get_available_slots_rec(date, half_duration, rec_multiplier + 1)
-        # Slots available and it was straightforward, we simply return them
-        if rec_multiplier == 1:
-            return filtered_slots, rec_multiplier
-
-        # We trim and group the slots found to match the total duration wanted
-        total_duration = duration_in_minutes * 2 ** (rec_multiplier - 1)
-        groups = self._trim_and_group_slots(total_duration, filtered_slots)
-        # Maybe we can't if we're in a case where available slots are surrounded
-        # by unavailable ones
-        if len(groups) == 0:
+    def _get_policies_day(self, date: str) -> Optional[Date]:
+        """
+        Get the date object the policies are checked with, None when there's
+        no policy to check
+        """
+        if self._policies is None:
+            return None
+        try:
+            return get_date_obj(date)
+        except ValueError:
             return None
-        return groups, rec_multiplier
 
+    def _get_duration_violation(self, duration: int) -> Optional[str]:
+        rule = self._policies.get_duration_rule(duration) if self._policies is not None else None
+        if rule is None:
+            return None
+        return f"No slot can be booked for {format_minutes(duration)}, the booking policies say: {rule.source}"
 
-    def _trim_and_group_slots(self, duration_wanted_m: int, slots: List[TimeSlot]):
+    def _is_bookable(self, day: Date, start: int, end: int) -> bool:
+        """
+        Whether the policies allow bookings during the whole slot from start
+        to end on a day
         """
-        Goes through the slots and group them to create groups of contiguous
-        slots that could simulate the duration wanted
+        return self._policies.clip(day, start, end) == (start, end)
+
+    def _get_cached(self, key: Hashable, version: int, compute: Callable[[], Any]) -> Any:
+        """
+        Get the cached result of a read-only tool, computed when it is missing
+        or outdated
+
+        :param key: The tool and its arguments
+        :param version: The version of the dates read by the tool, read before
+            the computation
+        :param compute: Computes the result
+        """
+        result = self._results.get(key, version, _missing)
+        if result is _missing:
+            result = compute()
+            self._results.set(key, version, result)
+        return result
+
+    def _get_bitmap(self) -> "AvailabilityBitmap":
+        """
+        Get the availability bitmap of the calendar, its rows are filled when a
+        range search first needs them
+        """
+        from booking_agent.availability_bitmap import AvailabilityBitmap
+
+        with self._guard:
+            if self._bitmap is None:
+                self._bitmap = AvailabilityBitmap(self._calendar.root.keys())
+            return self._bitmap
+
+    def _get_date_lock(self, date: str) -> threading.Lock:
+        """
+        Get the lock serializing the bookings of a date
+        """
+        lock = self._date_locks.get(date)
+        if lock is None:
+            with self._guard:
+                lock = self._date_locks.setdefault(date, threading.Lock())
+        return lock
+
+    def _get_version(self, date: str) -> int:
+        """
+        Get the version of a date, it is bumped by every booking on this date
+        """
+        return self._versions.get(date, 0)
+
+    def _mark_booked(self, date: str, index: DaySlotIndex, position: int):
+        """
+        Books a slot, the lock of its date must be held
+        """
+        index.mark_unavailable(position)
+        self._record_changes([date])
+        if self._bitmap is not None:
+            self._bitmap.set_unavailable(date, index.get_start(position), index.get_end(position))
+
+    def _journal_bookings(self, bookings: List[Tuple[str, str]]):
+        """
+        Persists the (date, start) of booked slots, outside of the date locks
+        so that bookings of the date don't wait for the disk, the compaction
+        runs in the background for the same reason
+        """
+        if self._journal is None:
+            return
+        for date, start in bookings:
+            self._journal.append(date, start)
+        if self._journal.needs_compaction():
+            self._journal.start_compaction(self._calendar)
+
+    def _book_all(self, requests: List[SlotRequest]) -> str:
+        """
+        Checks every requested slot then books them all, under the locks of
+        every date involved so that no other booking can come in between. The
+        locks are taken in the order of the dates, so two batches can't
+        deadlock.
+
+        :param requests: The slots to book
+        :return: A summary of the bookings, or of the conflicts with
+            alternatives if nothing was booked
+        """
+        if len(requests) == 0:
+            return "No slot to book."
+        try:
+            durations = [get_in_minutes(request.duration) for request in requests]
+        except ValueError:
+            return "Durations must be in format HH:mm."
+        positions = []
+        conflicts = []
+        for request in requests:
+            broken_rule = self._policies.get_broken_rule(request.date, request.start_time, request.duration) \
+                if self._policies is not None else None
+            if broken_rule is not None:
+                positions.append(None)
+                conflicts.append((request, f"it breaks the booking policy \"{broken_rule.source}\""))
+                continue
+            try:
+                positions.append(self._find_position(request.date, request.start_time))
+            except DateUnavailableError:
+                positions.append(None)
+                conflicts.append((request, "the calendar doesn't provide information about this date"))
+            except TimeSlotUnavailableError:
+                positions.append(None)
+                conflicts.append((request, "there's no slot starting at this time"))
+
+        with ExitStack() as stack:
+            for date in sorted({request.date for request, position in zip(requests, positions)
+                                if position is not None}):
+                stack.enter_context(self._get_date_lock(date))
+            requested = set()
+            for request, position, duration in zip(requests, positions, durations):
+                if position is None:
+                    continue
+                index, slot_position = position
+                if not index.is_available(slot_position):
+                    conflicts.append((request, "already booked"))
+                elif index.get_duration(slot_position) < duration:
+                    conflicts.append((request, "the duration doesn't fit in this slot"))
+                elif (request.date, slot_position) in requested:
+                    conflicts.append((request, "asked twice"))
+                requested.add((request.date, slot_position))
+
+            if len(conflicts) == 0:
+                for request, (index, slot_position) in zip(requests, positions):
+                    self._mark_booked(request.date, index, slot_position)
+
+        if len(conflicts) > 0:
+            conflicts_str = "\n".join([f"- On {request.date} at {request.start_time}: {reason}."
+                                       f"{self._get_alternatives_str(request)}"
+                                       for request, reason in conflicts])
+            return (f"Nothing was booked since {len(conflicts)} of the {len(requests)} slots can't be "
+                    f"booked:\n{conflicts_str}")
+        self._journal_bookings([(request.date, index.get_slot(slot_position).start)
+                                for request, (index, slot_position) in zip(requests, positions)])
+        slots_str = ", ".join([f"{request.date} at {request.start_time}" for request in requests])
+        return f"Booked {len(requests)} slots with success: {slots_str}"
+
+    def _get_alternatives_str(self, request: SlotRequest, count: int = 3) -> str:
+        """
+        Describes the available slots of the date of a request that can hold
+        its duration, the closest to the requested time first
+        """
+        try:
+            index = self._get_index(request.date)
+            requested_start = get_in_minutes(request.start_time)
+        except (DateUnavailableError, ValueError):
+            return ""
+        duration = get_in_minutes(request.duration)
+        day = self._get_policies_day(request.date)
+        alternatives = sorted([position for position in range(len(index))
+                               if index.is_available(position) and index.get_duration(position) >= duration
+                               and (day is None or self._is_bookable(day, index.get_start(position),
+                                                                     index.get_end(position)))],
+                              key=lambda position: abs(index.get_start(position) - requested_start))[:count]
+        if len(alternatives) == 0:
+            return " There's no other slot that day."
+        starts_str = ", ".join([format_minutes(index.get_start(position)) for position in sorted(alternatives)])
+        return f" Available that day: {starts_str}."
+
+    def _record_changes(self, dates: List[str]):
+        """
+        Bumps the versions of changed dates and of the calendar, and records
+        the changes in the feed
+        """
+        with self._guard:
+            for date in dates:
+                self._versions[date] = self._versions.get(date, 0) + 1
+                self._version += 1
+                self._changes.append((self._version, date))
+
+    def _get_free_intervals(self, date: str) -> List[Tuple[int, int]]:
+        """
+        Get the (start, end) minutes of each available slot of a date
+        """
+        index = self._get_index(date)
+        return [(index.get_start(position), index.get_end(position))
+                for position in range(len(index)) if index.is_available(position)]
+
+    def _trim_and_group_slots(self, duration_wanted_m: int, slots: List[TimeSlot]) -> List[List[TimeSlot]]:
+        """
+        Goes through the slots in a single sweep and returns, for each slot, the
+        shortest group of contiguous slots ending with it that could simulate
+        the duration wanted. Each slot enters and leaves the running group at
+        most once so this is linear in the amount of slots.
 
         :param duration_wanted_m: The duration wanted in minutes
-        :param slots: All the available slots we want to trim
+        :param slots: All the available slots we want to group, sorted by start
         """
-        if len(slots) == 0:
-            return slots
+        starts = [get_in_minutes(slot.start) for slot in slots]
+        ends = [get_in_minutes(slot.end) for slot in slots]
         groups = []
-        running_duration = slots[0].get_duration_in_minutes()
-        running_slots = [slots[0]]
-        for index in range(1, len(slots)):
-            slot = slots[index]
-            last_end = running_slots[-1].end
-            if slot.start == last_end:
-                running_duration += slot.get_duration_in_minutes()
-                running_slots.append(slot)
-                if running_duration >= duration_wanted_m:
-                    groups.append(running_slots)
-                    running_slots = [slot]
-                    running_duration = slot.get_duration_in_minutes()
-                continue
-            # Here we finished a group that can't simulate the duration wanted
-            running_slots = [slot]
-            running_duration = slot.get_duration_in_minutes()
+        first = 0
+        running_duration = 0
+        for last in range(len(slots)):
+            # The running group is broken by a gap, we start a new one
+            if last > first and starts[last] != ends[last - 1]:
+                first = last
+                running_duration = 0
+            running_duration += ends[last] - starts[last]
+            # We drop the first slots as long as the group still fits without them
+            while first < last and running_duration - (ends[first] - starts[first]) >= duration_wanted_m:
+                running_duration -= ends[first] - starts[first]
+                first += 1
+            if running_duration >= duration_wanted_m:
+                groups.append(slots[first:last + 1])
         return groups
 
     def _get_slots(self, date: str) -> List[TimeSlot]:
@@ -192,6 +745,37 @@ class CalendarToolkit:
         return calendar_dict[date]
 
 
+    def _get_index(self, date: str) -> DaySlotIndex:
+        """
+        Get the sorted slot index of a date, building it on first access
+
+        :param date: The date in YYYY-m-d format
+        :return: The index of the slots at this date
+        :raises DateUnavailableError: date not found in calendar
+        """
+        index = self._indexes.get(date)
+        if index is None:
+            # If two threads build it concurrently, both indexes reference the
+            # same slots and only the first one is kept
+            index = self._indexes.setdefault(date, DaySlotIndex(self._get_slots(date)))
+        return index
+
+    def _find_position(self, date: str, start_time: str) -> Tuple[DaySlotIndex, int]:
+        """
+        Find the index of date and the position of the slot that begins at
+        start_time in it
+
+        :return: The index and the position of the slot in it
+        :raises DateUnavailableError: date not found in calendar
+        :raises TimeSlotUnavailableError: time slot not found on this day
+        """
+        index = self._get_index(date)
+        try:
+            start_minutes = get_in_minutes(start_time)
+        except ValueError:
+            raise TimeSlotUnavailableError
+        return index, index.find(start_minutes)
+
     def _find_slot(self, date: str, start_time: str) -> TimeSlot:
         """
         Find the slot that begins at start_time on date
@@ -199,23 +783,16 @@ class CalendarToolkit:
         :return: The TimeSlot
         :raises TimeSlotUnavailableError: time slot not found on this day
         """
-        slots = self._get_slots(date)
+        index, position = self._find_position(date, start_time)
+        return index.get_slot(position)
 
-        for slot in slots:
-            if slot.start == start_time:
-                return slot
-        raise TimeSlotUnavailableError
-
-    def _is_duration_valid(self, slot: TimeSlot, duration: str) -> bool:
+    def _is_duration_valid(self, available_minutes: int, duration: str) -> bool:
         """
-        Returns a boolean assessing if there's enough time in the given slot for
+        Returns a boolean assessing if there's enough time in a slot for
         the provided duration
 
-        :param slot: The slot to check
+        :param available_minutes: The duration of the slot in minutes
         :param duration: The duration is H:M format
         """
-        duration_minutes = get_in_minutes(duration)
-        available_minutes = slot.get_duration_in_minutes()
-
-        return available_minutes >= duration_minutes
+        return available_minutes >= get_in_minutes(duration)
 
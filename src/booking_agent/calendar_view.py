@@ -0,0 +1,116 @@
+import logging
+import threading
+from html import escape
+from typing import Dict, List, Tuple
+
+from booking_agent.calendar_toolkit import CalendarToolkit
+
+logger = logging.getLogger("booking-agent")
+
+
+def render_date_html(date: str, slots: List[dict]) -> str:
+    """
+    Renders the HTML of a date, available slots in green and booked ones in red
+
+    :param date: The date
+    :param slots: The slots of the date in json format
+    """
+    parts = [f"<div class='date'>{escape(date)}</div>"]
+    for slot in slots:
+        color = "green" if slot["available"] else "red"
+        parts.append(f"<div class='slot' style='color: {color};'>{escape(slot['start'])} - {escape(slot['end'])}</div>")
+    parts.append("<hr>")
+    return "".join(parts)
+
+
+class CalendarView:
+    """
+    Renders a window of dates of a calendar in HTML. The HTML of each date is
+    cached and only rendered again when the change feed of the toolkit reports
+    that the date changed, so refreshing a view of an unchanged calendar costs
+    a version check. The view can be shared by every session.
+
+    Attributes:
+        _toolkit: The toolkit of the calendar to render
+        _window_size: The amount of dates shown at once
+        _dates: The dates of the calendar, the window slides over them
+        _generation: Bumped when the toolkit is replaced
+        _version: The version of the toolkit the cached HTML is up to date with
+        _date_html: The cached HTML of each date
+        _lock: Protects the cache
+    """
+    _toolkit: CalendarToolkit
+    _window_size: int
+    _dates: List[str]
+    _generation: int
+    _version: int
+    _date_html: Dict[str, str]
+    _lock: threading.Lock
+
+    def __init__(self, toolkit: CalendarToolkit, window_size: int = 7):
+        self._window_size = window_size
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.set_toolkit(toolkit)
+
+    def set_toolkit(self, toolkit: CalendarToolkit):
+        """
+        Renders another toolkit, when the calendar is reset
+
+        :param toolkit: The new toolkit
+        """
+        with self._lock:
+            self._toolkit = toolkit
+            self._generation += 1
+            self._version = toolkit.get_version()
+            self._date_html = {}
+            self._dates = toolkit.get_dates()
+
+    def refresh(self) -> Tuple[int, int]:
+        """
+        Drops the cached HTML of the dates changed since the last refresh
+
+        :return: A key of the state of the calendar, it changes when the
+            calendar does
+        """
+        with self._lock:
+            return self._refresh()
+
+    def clamp_offset(self, offset: int) -> int:
+        """
+        Get the closest offset showing a full window of dates
+        """
+        return max(0, min(offset, len(self._dates) - self._window_size))
+
+    def get_window_size(self) -> int:
+        return self._window_size
+
+    def render(self, offset: int = 0) -> str:
+        """
+        Renders the window of dates starting at offset
+
+        :param offset: The position of the first date shown, in the order of
+            the calendar
+        :return: The HTML of the window
+        """
+        with self._lock:
+            self._refresh()
+            window = self._dates[offset:offset + self._window_size]
+            missing_dates = [date for date in window if date not in self._date_html]
+            if len(missing_dates) > 0:
+                logger.debug(f"Rendering {len(missing_dates)} dates of the calendar")
+                for date, slots in self._toolkit.get_calendar_json(missing_dates).items():
+                    self._date_html[date] = render_date_html(date, slots)
+            return "<div class='calendar'>" + "".join([self._date_html[date] for date in window]) + "</div>"
+
+    def _refresh(self) -> Tuple[int, int]:
+        version = self._toolkit.get_version()
+        if version != self._version:
+            changed_dates = self._toolkit.get_changes_since(self._version)
+            if changed_dates is None:
+                self._date_html = {}
+            else:
+                for date in changed_dates:
+                    self._date_html.pop(date, None)
+            self._version = version
+        return self._generation, self._version
@@ -0,0 +1,157 @@
+import json
+import logging
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+logger = logging.getLogger("booking-agent")
+
+# Extracts a fact worth remembering from the (args, output) of a tool call
+FactExtractor = Callable[[dict, str], Optional[str]]
+
+def count_tokens_approximately(messages: List[BaseMessage]) -> int:
+    """
+    A rough token count (4 characters a token plus a few tokens of overhead per
+    message) that doesn't need a tokenizer
+
+    :param messages: The messages to count
+    :return: The approximate amount of tokens
+    """
+    tokens = 0
+    for message in messages:
+        tokens += 4 + len(str(message.content)) // 4
+        if isinstance(message, AIMessage):
+            tokens += sum(len(json.dumps(tool_call["args"])) // 4 + 4 for tool_call in message.tool_calls)
+    return tokens
+
+
+class ConversationMemory:
+    """
+    Keeps the history sent to the model under a token budget.
+
+    Tool outputs are kept verbatim for the most recent turns only. In older
+    turns, the tool calls and their outputs are dropped and only the user
+    message and the final answer remain. If the history is still over budget,
+    the oldest turns are dropped, the ongoing turn is always kept.
+
+    To avoid forgetting what was found with tools (like the date of today), the
+    outputs of some tools are turned into facts by extractors, and these facts
+    are pinned in a summary sent with every call.
+
+    Attributes:
+        _max_tokens: The budget of the history sent to the model
+        _keep_recent_turns: The amount of turns whose tool messages are kept
+        _fact_extractors: The extractor of each tool whose outputs are worth pinning
+        _count_tokens: Counts the tokens of messages
+        _pinned_facts: The facts extracted so far, by tool call
+    """
+    _max_tokens: int
+    _keep_recent_turns: int
+    _fact_extractors: Dict[str, FactExtractor]
+    _count_tokens: Callable[[List[BaseMessage]], int]
+    _pinned_facts: Dict[str, str]
+
+    def __init__(self, max_tokens: int = 8000, keep_recent_turns: int = 3,
+                 fact_extractors: Optional[Dict[str, FactExtractor]] = None,
+                 count_tokens: Callable[[List[BaseMessage]], int] = count_tokens_approximately):
+        self._max_tokens = max_tokens
+        self._keep_recent_turns = keep_recent_turns
+        self._fact_extractors = fact_extractors or {}
+        self._count_tokens = count_tokens
+        self._pinned_facts = {}
+
+    ############
+    #  Public  #
+    ############
+
+    def compact(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Pins the facts of the tool messages then compacts the history to fit
+        the budget. It is meant to be called at the beginning of a turn, once
+        the user message has been added.
+
+        :param messages: The history, starting with the system message
+        :return: The compacted history
+        """
+        self._pin_facts(messages)
+        system_messages, turns = self._split_turns(messages)
+        # The last turn is the ongoing one, it comes on top of the recent ones
+        for turn_number in range(len(turns) - 1 - self._keep_recent_turns):
+            turns[turn_number] = self._collapse_turn(turns[turn_number])
+
+        summary = self._get_summary_messages()
+        tokens = self._count_tokens(system_messages + summary) + sum(self._count_tokens(turn) for turn in turns)
+        dropped_turns = 0
+        while tokens > self._max_tokens and len(turns) > 1:
+            tokens -= self._count_tokens(turns.pop(0))
+            dropped_turns += 1
+        if dropped_turns > 0:
+            logger.debug(f"Dropped {dropped_turns} turns from memory to fit in {self._max_tokens} tokens")
+        return system_messages + [message for turn in turns for message in turn]
+
+    def get_context(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Get the messages to send to the model: the history with the summary of
+        the pinned facts right after the system message
+
+        :param messages: The history, starting with the system message
+        """
+        return messages[:1] + self._get_summary_messages() + messages[1:]
+
+    def reset(self):
+        self._pinned_facts = {}
+
+    #############
+    #  Private  #
+    #############
+
+    def _pin_facts(self, messages: List[BaseMessage]):
+        """
+        Extracts the facts of every tool message whose tool has an extractor
+        """
+        tool_calls = {tool_call["id"]: tool_call
+                      for message in messages if isinstance(message, AIMessage)
+                      for tool_call in message.tool_calls}
+        for message in messages:
+            if not isinstance(message, ToolMessage) or message.tool_call_id not in tool_calls:
+                continue
+            tool_call = tool_calls[message.tool_call_id]
+            extractor = self._fact_extractors.get(tool_call["name"].lower())
+            if extractor is None:
+                continue
+            fact = extractor(tool_call["args"], str(message.content))
+            if fact is not None:
+                # Keyed by the call so that a same call made again updates its fact
+                key = tool_call["name"].lower() + json.dumps(tool_call["args"], sort_keys=True)
+                self._pinned_facts[key] = fact
+
+    def _get_summary_messages(self) -> List[BaseMessage]:
+        if len(self._pinned_facts) == 0:
+            return []
+        facts_str = "\n".join([f"- {fact}" for fact in self._pinned_facts.values()])
+        return [SystemMessage(content=f"Facts established earlier in the conversation:\n{facts_str}")]
+
+    def _split_turns(self, messages: List[BaseMessage]):
+        """
+        Splits the history in the leading system messages and turns, a turn
+        begins with a user message
+        """
+        system_messages = []
+        turns: List[List[BaseMessage]] = []
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                turns.append([message])
+            elif len(turns) > 0:
+                turns[-1].append(message)
+            else:
+                system_messages.append(message)
+        return system_messages, turns
+
+    def _collapse_turn(self, turn: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Keeps only the user message and the final answer of a finished turn
+        """
+        final_answer = turn[-1]
+        if isinstance(final_answer, AIMessage) and len(final_answer.tool_calls) == 0 and len(turn) > 2:
+            return [turn[0], final_answer]
+        return turn
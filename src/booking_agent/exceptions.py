@@ -10,3 +10,9 @@ class TimeSlotUnavailableError(Exception):
     Error to report a time slot that could not be found
     """
     pass
+
+class CalendarNotForkedError(Exception):
+    """
+    Error to report a commit or a discard on a toolkit that was not forked
+    """
+    pass
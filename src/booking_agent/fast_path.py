@@ -0,0 +1,188 @@
+import logging
+import re
+import threading
+from typing import Callable, Dict, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("booking-agent")
+
+# Tells why booking a (date, start_time, duration) breaks the booking
+# policies, None when it complies with them
+PolicyChecker = Callable[[str, str, str], Optional[str]]
+# Describes the slots that could replace an unavailable (date, start_time,
+# duration), appended to the answer
+AlternativesFinder = Callable[[str, str, str], str]
+
+_date = r"(?P<date>\d{4}-\d{1,2}-\d{1,2})"
+_time = r"(?P<start_time>\d{1,2}:\d{2})"
+_duration = r"(?P<duration>\d+\s*h(?:ours?)?(?:\s*\d+(?:\s*min(?:utes)?)?)?|\d+\s*min(?:utes)?|\d{1,2}:\d{2})"
+_end = r"\s*[.!?]?\s*$"
+
+# Only fully specified messages are matched, anything else (relative dates,
+# several requests, missing duration..) is left to the model
+_patterns = {
+    "book": re.compile(rf"^(?:please\s+)?book\s+(?:a\s+slot\s+)?(?:on\s+)?{_date}\s+at\s+{_time}"
+                       rf"\s+for\s+{_duration}{_end}", re.IGNORECASE),
+    "is_time_slot_available": re.compile(rf"^is\s+(?:the\s+slot\s+)?(?:on\s+)?{_date}\s+at\s+{_time}"
+                                         rf"\s+(?:free|available)(?:\s+for\s+{_duration})?{_end}", re.IGNORECASE),
+    "get_available_slots": re.compile(rf"^(?:what(?:'s|\s+is)\s+(?:free|available)|(?:free|available)\s+slots)"
+                                      rf"\s+on\s+{_date}(?:\s+for\s+{_duration})?{_end}", re.IGNORECASE),
+}
+
+# The duration assumed when a question doesn't give one, bookings always need one
+_default_durations = {
+    "is_time_slot_available": "01:00",
+    # Every available slot fits
+    "get_available_slots": "00:00",
+}
+
+# Turn the output of the tool in the answer to the user
+answer_templates = {
+    "book": lambda args, output: output,
+    "is_time_slot_available": lambda args, output: (
+        f"Yes, {args['date']} at {args['start_time']} is available for {args['duration']}." if output == "true"
+        else f"No, {args['date']} at {args['start_time']} is not available for {args['duration']}."
+        if output == "false" else output),
+    "get_available_slots": lambda args, output: (
+        f"There's no available slot on {args['date']}." if output.startswith("No available slots") else output),
+}
+
+
+class FastPathRequest(BaseModel):
+    """
+    A user message parsed without the model, as the tool call answering it
+
+    Attributes:
+        tool: The name of the tool to call
+        args: The arguments of the tool
+    """
+    tool: str
+    args: Dict[str, str]
+
+
+def format_duration(duration: str) -> str:
+    """
+    Get a duration written by a user ("1h", "1h30", "90min", "1:30") in
+    format HH:mm
+
+    :raises ValueError: the duration doesn't fit in a day or its minutes go
+        past 59 ("24h", "1h 75min")
+    """
+    numbers = [int(number) for number in re.findall(r"\d+", duration)]
+    if ":" in duration:
+        hours, minutes = numbers
+    elif "h" in duration.lower():
+        hours, minutes = numbers[0], numbers[1] if len(numbers) > 1 else 0
+    else:
+        hours, minutes = divmod(numbers[0], 60)
+    if hours >= 24 or minutes >= 60:
+        raise ValueError(f"{duration} is not a duration in format HH:mm")
+    return f"{hours:02d}:{minutes:02d}"
+
+
+class FastPathRouter:
+    """
+    Answers fully specified messages ("book 2024-10-16 at 09:00 for 1h",
+    "what's free on 2024-10-17?") with a single tool call and a template,
+    without the policy retrieval and the model round trips. Bookings can only
+    take the fast path when the policies can be checked without the model,
+    that is when a policy checker is given. Answers telling that a slot is
+    not available suggest other slots when an alternatives finder is given.
+    The router is shared by every session.
+
+    Attributes:
+        _policy_checker: Checks bookings against the booking policies
+        _alternatives_finder: Suggests slots when the one asked is not available
+        _hits: The amount of messages answered by the fast path
+        _misses: The amount of messages left to the model
+        _lock: Protects the counters
+    """
+    _policy_checker: Optional[PolicyChecker]
+    _alternatives_finder: Optional[AlternativesFinder]
+    _hits: int
+    _misses: int
+    _lock: threading.Lock
+
+    def __init__(self, policy_checker: Optional[PolicyChecker] = None,
+                 alternatives_finder: Optional[AlternativesFinder] = None):
+        self._policy_checker = policy_checker
+        self._alternatives_finder = alternatives_finder
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    ############
+    #  Public  #
+    ############
+
+    def route(self, msg: str) -> Optional[FastPathRequest]:
+        """
+        Parses a user message
+
+        :param msg: The user message
+        :return: The tool call answering the message, None if the model is
+            needed
+        """
+        request = self._parse(msg.strip())
+        with self._lock:
+            if request is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            hit_rate = self._hits / (self._hits + self._misses)
+        if request is not None:
+            logger.debug(f"Answering {request.tool} without the model, fast path hit rate {hit_rate:.0%}")
+        return request
+
+    def check_policies(self, request: FastPathRequest) -> Optional[str]:
+        """
+        Get why a request breaks the booking policies, None if it doesn't
+        """
+        if request.tool != "book":
+            return None
+        return self._policy_checker(request.args["date"], request.args["start_time"], request.args["duration"])
+
+    def get_answer(self, request: FastPathRequest, output: str) -> str:
+        """
+        Get the answer to the user from the output of the tool call
+        """
+        answer = answer_templates[request.tool](request.args, output)
+        if (self._alternatives_finder is not None and request.tool == "is_time_slot_available"
+                and (output == "false" or output.startswith("The slot is free but can't be booked"))):
+            answer += self._alternatives_finder(request.args["date"], request.args["start_time"],
+                                                request.args["duration"])
+        return answer
+
+    def get_hit_rate(self) -> float:
+        """
+        Get the share of the messages answered by the fast path
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return self._hits / total if total > 0 else 0.0
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses}
+
+    #############
+    #  Private  #
+    #############
+
+    def _parse(self, msg: str) -> Optional[FastPathRequest]:
+        for tool, pattern in _patterns.items():
+            if tool == "book" and self._policy_checker is None:
+                continue
+            match = pattern.match(msg)
+            if match is None:
+                continue
+            args = match.groupdict()
+            duration = args["duration"]
+            try:
+                args["duration"] = format_duration(duration) if duration is not None else _default_durations[tool]
+            except ValueError:
+                # The tools can't take it, the model explains why
+                return None
+            return FastPathRequest(tool=tool, args=args)
+        return None
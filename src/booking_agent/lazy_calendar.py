@@ -0,0 +1,129 @@
+import logging
+import mmap
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Tuple
+
+from pydantic import TypeAdapter
+
+from booking_agent.calendar import TimeSlot
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    # orjson is optional, the standard parser is only slower
+    from json import loads as json_loads
+
+logger = logging.getLogger("booking-agent")
+
+_slots_adapter = TypeAdapter(List[TimeSlot])
+
+
+class LazyDays(Mapping):
+    """
+    The dates of a calendar file, the slots of a date are parsed and validated
+    the first time the date is accessed. Only the position of each date in the
+    file is known beforehand.
+
+    Attributes:
+        _buffer: The content of the calendar file, usually memory-mapped
+        _offsets: The (start, end) position of the slots of each date in the
+            buffer, in the order of the file
+        _days: The slots of the dates accessed so far
+    """
+    _buffer: bytes
+    _offsets: Dict[str, Tuple[int, int]]
+    _days: Dict[str, List[TimeSlot]]
+
+    def __init__(self, buffer: bytes):
+        self._buffer = buffer
+        self._offsets = {}
+        # Slots never contain lists, so every list holds the slots of a date,
+        # its key is the last string before it and it ends at the first
+        # closing bracket. Searching brackets instead of parsing keeps the
+        # scan in C and proportional to the amount of dates.
+        start = buffer.find(b"[")
+        while start != -1:
+            key_end = buffer.rfind(b'"', 0, start)
+            key_start = buffer.rfind(b'"', 0, key_end)
+            end = buffer.find(b"]", start) + 1
+            self._offsets[buffer[key_start + 1:key_end].decode()] = (start, end)
+            start = buffer.find(b"[", end)
+        self._days = {}
+
+    def __getitem__(self, date: str) -> List[TimeSlot]:
+        slots = self._days.get(date)
+        if slots is None:
+            start, end = self._offsets[date]
+            # If two threads validate the same date, only the first slots are
+            # kept so that bookings are all made on the same objects
+            slots = self._days.setdefault(date, _slots_adapter.validate_json(self._buffer[start:end]))
+        return slots
+
+    def __contains__(self, date: object) -> bool:
+        return date in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get_loaded_dates(self) -> List[str]:
+        return list(self._days)
+
+    def dump_date(self, date: str) -> List[dict]:
+        """
+        Get the slots of a date in json format, without validating them if
+        they were not accessed yet
+
+        :param date: The date in YYYY-m-d format
+        """
+        slots = self._days.get(date)
+        if slots is not None:
+            return [slot.model_dump() for slot in slots]
+        start, end = self._offsets[date]
+        return json_loads(self._buffer[start:end])
+
+
+class LazyCalendar:
+    """
+    A calendar loaded from a json file without parsing it: the file is
+    memory-mapped and the slots of a date are only validated when the date is
+    accessed, so that startup time and memory don't grow with the history of
+    the calendar. It can be used wherever a Calendar is.
+
+    Attributes:
+        root: The slots of each date, like Calendar.root
+    """
+    root: LazyDays
+
+    def __init__(self, root: LazyDays):
+        self.root = root
+
+    @classmethod
+    def from_file(cls, path: str) -> "LazyCalendar":
+        """
+        Memory-maps a calendar file in the format of data/calendar.json
+
+        :param path: The path of the calendar file
+        """
+        with open(path, "rb") as f:
+            try:
+                # The mapping stays valid once the file is closed
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file can't be mapped
+                buffer = b""
+        calendar = cls(LazyDays(buffer))
+        logger.debug(f"Found {len(calendar.root)} dates in {path}")
+        return calendar
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "LazyCalendar":
+        return cls(LazyDays(content))
+
+    def model_dump(self) -> Dict[str, List[dict]]:
+        """
+        Get the calendar in json format, like Calendar.model_dump
+        """
+        return {date: self.root.dump_date(date) for date in self.root}
@@ -1,12 +1,38 @@
-from collections.abc import Sequence
+import asyncio
+import itertools
+import logging
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Dict, Literal, Optional
+
 from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts.chat import MessagesPlaceholder
 from langchain_core.runnables import Runnable
 from langchain_core.tools import BaseTool
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage, message_chunk_to_message
+from langchain_core.messages.tool import ToolCall
+from pydantic import BaseModel
+
+from booking_agent.conversation_memory import ConversationMemory
+from booking_agent.metrics import MetricsSink, NoopMetricsSink
+
+logger = logging.getLogger("booking-agent")
+
+_agent_numbers = itertools.count()
+
 
+class AgentEvent(BaseModel):
+    """
+    An event streamed by the agent, either a token of the answer as soon as the
+    model produced it, or the description of a tool call that is starting
+
+    Attributes:
+        type: "token" or "tool_call"
+        content: The token or the description of the tool call
+    """
+    type: Literal["token", "tool_call"]
+    content: str
 
 
 class MemoryToolsAgent:
@@ -17,20 +43,38 @@ class MemoryToolsAgent:
     Attributes:
         _agent: The agent
         _model: The model that the agent is based on
+        _memory: Keeps the history under a token budget without forgetting
+            the facts found with tools
+        _metrics: Receives the spans of the turns (turn, LLM and tool calls)
+        _agent_number: Tells apart the turns of different agents in the spans
+        _turn_numbers: Numbers the turns of the agent
+        _turn_id: Identifies the ongoing turn in the spans
     """
     _agent: Runnable
     _model: BaseChatModel
+    _memory: ConversationMemory
+    _metrics: MetricsSink
+    _agent_number: int
+    _turn_numbers: Iterator[int]
+    _turn_id: str
 
     ############
     #  Public  #
     ############
 
     def __init__(self, model: BaseChatModel, tools,
-                 system_prompt: str = "You are an assistant that tries to answer questions"):
+                 system_prompt: str = "You are an assistant that tries to answer questions",
+                 memory: Optional[ConversationMemory] = None,
+                 metrics_sink: Optional[MetricsSink] = None):
         # Session id is bound to the agent here
         self._messages = []
         self._tools = tools
         self._model = model
+        self._memory = memory or ConversationMemory()
+        self._metrics = metrics_sink or NoopMetricsSink()
+        self._agent_number = next(_agent_numbers)
+        self._turn_numbers = itertools.count()
+        self._turn_id = ""
         self._initialize_agent(tools, system_prompt)
 
 
@@ -43,33 +87,238 @@ class MemoryToolsAgent:
         :param msg: The user input
         :return: The final message of the llm (after the tool call loop)
         """
-        # We add the user input
-        self._messages.append(HumanMessage(content=msg))
-        # We get the ai answer and add it
-        ai_answer = self._agent.invoke({"messages": self._messages})
-        self._messages.append(ai_answer)
-
-        tools_map = {tool.func.__name__: tool for tool in self._tools}
-        # If it's not a classical stop, we are in a tool calling case
-        while ai_answer.response_metadata["finish_reason"] != "stop":
-            # We call each tool one after the other and store permanently their
-            # output
-            for tool_call in ai_answer.tool_calls:
-                selected_tool = tools_map[tool_call["name"].lower()]
-                tool_msg = selected_tool.invoke(tool_call)
-                self._messages.append(tool_msg)
-            ai_answer = self._agent.invoke({"messages": self._messages})
+        with self._start_turn() as turn_span:
+            local_answer = self._answer_locally(msg)
+            if local_answer is not None:
+                turn_span.set_attributes(fast_path=True)
+                return local_answer
+            # We add the user input
+            self._add_user_message(self._prepare_user_message(msg))
+            # We get the ai answer and add it
+            ai_answer = self._call_model()
             self._messages.append(ai_answer)
-        return ai_answer.content
+
+            tools_map = self._get_tools_map()
+            # If it's not a classical stop, we are in a tool calling case
+            while ai_answer.response_metadata["finish_reason"] != "stop":
+                # We call each tool one after the other and store permanently their
+                # output
+                for tool_call in ai_answer.tool_calls:
+                    self._messages.append(self._call_tool(tools_map, tool_call))
+                ai_answer = self._call_model()
+                self._messages.append(ai_answer)
+            return ai_answer.content
+
+    async def ainvoke(self, msg: str) -> str:
+        """
+        Same as invoke but awaits the model instead of blocking a thread and
+        runs the tool calls of a same answer concurrently, since they are
+        independent from each other
+
+        :param msg: The user input
+        :return: The final message of the llm (after the tool call loop)
+        """
+        with self._start_turn() as turn_span:
+            local_answer = await self._aanswer_locally(msg)
+            if local_answer is not None:
+                turn_span.set_attributes(fast_path=True)
+                return local_answer
+            self._add_user_message(await self._aprepare_user_message(msg))
+            ai_answer = await self._acall_model()
+            self._messages.append(ai_answer)
+
+            tools_map = self._get_tools_map()
+            while ai_answer.response_metadata["finish_reason"] != "stop":
+                # gather keeps the order of the tool calls for the tool messages
+                tool_msgs = await asyncio.gather(*[
+                    self._acall_tool(tools_map, tool_call) for tool_call in ai_answer.tool_calls
+                ])
+                self._messages.extend(tool_msgs)
+                ai_answer = await self._acall_model()
+                self._messages.append(ai_answer)
+            return ai_answer.content
+
+
+    async def astream(self, msg: str) -> AsyncIterator[AgentEvent]:
+        """
+        Same as ainvoke but yields the tokens of the answers as they arrive and
+        an event for each tool call before it runs, so the user doesn't wait
+        for the whole tool calling loop to see something
+
+        :param msg: The user input
+        :return: The events of the turn
+        """
+        with self._start_turn() as turn_span:
+            local_answer = await self._aanswer_locally(msg)
+            if local_answer is not None:
+                turn_span.set_attributes(fast_path=True)
+                yield AgentEvent(type="token", content=local_answer)
+                return
+            self._add_user_message(await self._aprepare_user_message(msg))
+            tools_map = self._get_tools_map()
+            while True:
+                agent_input = self._get_agent_input()
+                with self._metrics.span("llm_call", turn=self._turn_id,
+                                        history_length=len(agent_input["messages"])) as span:
+                    ai_answer_chunk = None
+                    async for chunk in self._agent.astream(agent_input):
+                        ai_answer_chunk = chunk if ai_answer_chunk is None else ai_answer_chunk + chunk
+                        if isinstance(chunk.content, str) and chunk.content != "":
+                            yield AgentEvent(type="token", content=chunk.content)
+                    # Chunks are merged back in a message, else tool calls would be
+                    # stored as partial json chunks in memory
+                    ai_answer = message_chunk_to_message(ai_answer_chunk)
+                    span.set_attributes(**self._get_token_counts(ai_answer))
+                self._messages.append(ai_answer)
+                if len(ai_answer.tool_calls) == 0:
+                    return
+
+                for tool_call in ai_answer.tool_calls:
+                    yield AgentEvent(type="tool_call", content=self._describe_tool_call(tool_call))
+                tool_msgs = await asyncio.gather(*[
+                    self._acall_tool(tools_map, tool_call) for tool_call in ai_answer.tool_calls
+                ])
+                self._messages.extend(tool_msgs)
 
 
     #############
     #  Private  #
     #############
 
+    def _prepare_user_message(self, msg: str) -> str:
+        """
+        Turns the user input in the message added to the history, meant to be
+        overloaded by agents adding context to it. It runs inside the turn, so
+        that its spans belong to it.
+
+        :param msg: The user input
+        """
+        return msg
+
+    async def _aprepare_user_message(self, msg: str) -> str:
+        return self._prepare_user_message(msg)
+
+    def _answer_locally(self, msg: str) -> Optional[str]:
+        """
+        Answers the user input without the model when it can, meant to be
+        overloaded by agents able to parse some inputs. The turn must be
+        recorded in the history like the model would have, see
+        _record_local_turn.
+
+        :param msg: The user input
+        :return: The answer, None if the model is needed
+        """
+        return None
+
+    async def _aanswer_locally(self, msg: str) -> Optional[str]:
+        return self._answer_locally(msg)
+
+    def _call_tool_locally(self, tool_call: ToolCall) -> Optional[ToolMessage]:
+        """
+        Calls a tool without the model, nothing is recorded in the history
+
+        :return: The output of the tool, None if it failed and the model
+            should answer instead
+        """
+        try:
+            return self._call_tool(self._get_tools_map(), tool_call)
+        except Exception:
+            logger.exception(f"The local call of {tool_call['name']} failed, falling back to the model")
+            return None
+
+    async def _acall_tool_locally(self, tool_call: ToolCall) -> Optional[ToolMessage]:
+        # The tools run in a thread so that other conversations go on
+        try:
+            return await self._acall_tool(self._get_tools_map(), tool_call)
+        except Exception:
+            logger.exception(f"The local call of {tool_call['name']} failed, falling back to the model")
+            return None
+
+    def _record_local_turn(self, msg: str, answer: str, tool_call: Optional[ToolCall] = None,
+                           tool_msg: Optional[ToolMessage] = None):
+        """
+        Records a turn answered without the model in the history as if the
+        model had answered it, so that later turns know about it. The turn is
+        only recorded once complete, a tool call is never left without its
+        output.
+
+        :param msg: The user input
+        :param answer: The answer given to the user
+        :param tool_call: The tool call made to answer, if any
+        :param tool_msg: The output of the tool call
+        """
+        self._add_user_message(msg)
+        if tool_call is not None:
+            self._messages.append(AIMessage(content="", tool_calls=[tool_call],
+                                            response_metadata={"finish_reason": "tool_calls"}))
+            self._messages.append(tool_msg)
+        self._messages.append(AIMessage(content=answer, response_metadata={"finish_reason": "stop"}))
+
+    def _start_turn(self):
+        """
+        Gives an id to the new turn and starts its span
+        """
+        self._turn_id = f"{self._agent_number}-{next(self._turn_numbers)}"
+        return self._metrics.span("turn", turn=self._turn_id)
+
+    def _call_model(self) -> AIMessage:
+        agent_input = self._get_agent_input()
+        with self._metrics.span("llm_call", turn=self._turn_id,
+                                history_length=len(agent_input["messages"])) as span:
+            ai_answer = self._agent.invoke(agent_input)
+            span.set_attributes(**self._get_token_counts(ai_answer))
+        return ai_answer
+
+    async def _acall_model(self) -> AIMessage:
+        agent_input = self._get_agent_input()
+        with self._metrics.span("llm_call", turn=self._turn_id,
+                                history_length=len(agent_input["messages"])) as span:
+            ai_answer = await self._agent.ainvoke(agent_input)
+            span.set_attributes(**self._get_token_counts(ai_answer))
+        return ai_answer
+
+    def _call_tool(self, tools_map: Dict[str, BaseTool], tool_call: ToolCall) -> ToolMessage:
+        with self._metrics.span("tool_call", turn=self._turn_id, tool=tool_call["name"]):
+            return tools_map[tool_call["name"].lower()].invoke(tool_call)
+
+    async def _acall_tool(self, tools_map: Dict[str, BaseTool], tool_call: ToolCall) -> ToolMessage:
+        with self._metrics.span("tool_call", turn=self._turn_id, tool=tool_call["name"]):
+            return await tools_map[tool_call["name"].lower()].ainvoke(tool_call)
+
+    def _get_token_counts(self, ai_answer: AIMessage) -> Dict[str, int]:
+        # Not every model reports its usage
+        usage = ai_answer.usage_metadata
+        if usage is None:
+            return {}
+        return {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"]}
+
+    def _describe_tool_call(self, tool_call: ToolCall) -> str:
+        """
+        Describes a tool call to the user while it runs, meant to be overloaded
+        by agents that know their tools
+
+        :param tool_call: The tool call
+        """
+        return f"Calling {tool_call['name']}"
+
+    def _add_user_message(self, msg: str):
+        """
+        Starts a turn with the user input, the history is compacted at this
+        point so that it is not sent over budget during the tool calling loop
+        """
+        self._messages.append(HumanMessage(content=msg))
+        self._messages = self._memory.compact(self._messages)
+
+    def _get_agent_input(self):
+        return {"messages": self._memory.get_context(self._messages)}
+
+    def _get_tools_map(self):
+        return {tool.func.__name__: tool for tool in self._tools}
+
     def _reset_memory_and_rebind_tools(self, tools):
         # We keep the system msg, this function is made for testing with gradio
         self._messages = [self._messages[0]]
+        self._memory.reset()
         self._tools = tools
         self._initialize_agent(tools, self._messages[0].content)
 
@@ -82,6 +331,8 @@ class MemoryToolsAgent:
         # calls, the LLM was forgetting what "today" was meaning since
         # it was found thanks to a tool in a previous call (same for some dates) 
         # and it was quite annoying to see him forget between two inputs
+        # ConversationMemory keeps the same guarantee once old turns are
+        # compacted, by pinning these facts in a summary
         self._messages.append(SystemMessage(system_prompt))
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -0,0 +1,208 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional, TextIO, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("booking-agent")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Span(BaseModel):
+    """
+    A timed step of an agent turn
+
+    Attributes:
+        name: What was timed, "turn", "retrieval", "llm_call" or "tool_call"
+        start: When the step started, in seconds since the epoch
+        duration: How long the step took, in seconds
+        attributes: What is known about the step (turn, tool, token counts..)
+    """
+    name: str
+    start: float
+    duration: float
+    attributes: Dict[str, Any]
+
+
+class MetricsSink(ABC):
+    """
+    Receives the spans recorded by agents. Sinks are shared by every session
+    so they must be thread-safe.
+    """
+    enabled: bool = True
+
+    def span(self, name: str, **attributes) -> "ActiveSpan":
+        """
+        Times the block of a with statement and records it as a span when it
+        exits, attributes can be added to the span while it runs
+
+        :param name: The name of the span
+        :param attributes: The attributes known when the span starts
+        """
+        return ActiveSpan(self, name, attributes)
+
+    @abstractmethod
+    def record(self, span: Span):
+        """
+        Records a span that ended
+        """
+
+
+class ActiveSpan:
+    """
+    A span being timed, see MetricsSink.span
+    """
+    __slots__ = ("_sink", "_name", "_attributes", "_start", "_start_counter")
+
+    def __init__(self, sink: MetricsSink, name: str, attributes: Dict[str, Any]):
+        self._sink = sink
+        self._name = name
+        self._attributes = attributes
+
+    def __enter__(self) -> "ActiveSpan":
+        self._start = time.time()
+        self._start_counter = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._start_counter
+        if exc_type is not None:
+            self._attributes["error"] = exc_type.__name__
+        try:
+            self._sink.record(Span(name=self._name, start=self._start, duration=duration,
+                                   attributes=self._attributes))
+        except Exception:
+            # Metrics must never break a conversation
+            logger.exception(f"Could not record the span {self._name}")
+        return False
+
+    def set_attributes(self, **attributes):
+        self._attributes.update(attributes)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_attributes(self, **attributes):
+        pass
+
+
+# Shared by every disabled span, so that nothing is allocated or timed
+NOOP_SPAN = _NoopSpan()
+
+
+class NoopMetricsSink(MetricsSink):
+    """
+    The sink used when metrics are disabled
+    """
+    enabled = False
+
+    def span(self, name: str, **attributes) -> _NoopSpan:
+        return NOOP_SPAN
+
+    def record(self, span: Span):
+        pass
+
+
+class PrometheusTextExporter(MetricsSink):
+    """
+    Aggregates spans in a duration histogram per span (and tool) and counts
+    the tokens of LLM calls, exported in the Prometheus text format.
+
+    Attributes:
+        _buckets: The upper bounds of the histogram buckets, in seconds
+        _histograms: The (bucket counts, sum, count) of each label set
+        _tokens: The amount of tokens of each kind ("prompt", "completion")
+        _lock: Protects the aggregates, spans come from every session
+    """
+    _buckets: Tuple[float, ...]
+    _histograms: Dict[Tuple[Tuple[str, str], ...], list]
+    _tokens: Dict[str, int]
+    _lock: threading.Lock
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        self._histograms = {}
+        self._tokens = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        labels = (("span", span.name),)
+        if "tool" in span.attributes:
+            labels += (("tool", str(span.attributes["tool"])),)
+        with self._lock:
+            bucket_counts, _, _ = histogram = self._histograms.setdefault(
+                labels, [[0] * len(self._buckets), 0.0, 0])
+            for number, upper_bound in enumerate(self._buckets):
+                if span.duration <= upper_bound:
+                    bucket_counts[number] += 1
+            histogram[1] += span.duration
+            histogram[2] += 1
+            for kind in ("prompt", "completion"):
+                self._tokens[kind] += span.attributes.get(f"{kind}_tokens") or 0
+
+    def export(self) -> str:
+        """
+        Get the metrics in the Prometheus text exposition format
+        """
+        lines = [
+            "# HELP booking_agent_span_duration_seconds Duration of the steps of agent turns",
+            "# TYPE booking_agent_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for labels, (bucket_counts, duration_sum, count) in sorted(self._histograms.items()):
+                labels_str = ",".join(f'{name}="{value}"' for name, value in labels)
+                for upper_bound, bucket_count in zip(self._buckets, bucket_counts):
+                    lines.append(f'booking_agent_span_duration_seconds_bucket{{{labels_str},le="{upper_bound}"}} '
+                                 f'{bucket_count}')
+                lines.append(f'booking_agent_span_duration_seconds_bucket{{{labels_str},le="+Inf"}} {count}')
+                lines.append(f"booking_agent_span_duration_seconds_sum{{{labels_str}}} {duration_sum}")
+                lines.append(f"booking_agent_span_duration_seconds_count{{{labels_str}}} {count}")
+            lines += [
+                "# HELP booking_agent_llm_tokens_total Tokens of LLM calls",
+                "# TYPE booking_agent_llm_tokens_total counter",
+            ]
+            for kind, tokens in sorted(self._tokens.items()):
+                lines.append(f'booking_agent_llm_tokens_total{{kind="{kind}"}} {tokens}')
+        return "\n".join(lines) + "\n"
+
+
+class JsonLinesLogger(MetricsSink):
+    """
+    Writes every span as a json line, to analyze slow turns afterwards
+
+    Attributes:
+        _file: The file where spans are written
+        _owns_file: Whether the file was opened by the logger
+        _lock: Serializes the writes, spans come from every session
+    """
+    _file: TextIO
+    _owns_file: bool
+    _lock: threading.Lock
+
+    def __init__(self, path: Optional[str] = None, file: Optional[TextIO] = None):
+        if (path is None) == (file is None):
+            raise ValueError("Either a path or a file must be given")
+        self._owns_file = file is None
+        self._file = file if file is not None else open(path, "a")
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        line = span.model_dump_json()
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
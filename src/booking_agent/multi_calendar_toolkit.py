@@ -0,0 +1,181 @@
+import heapq
+import logging
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+
+from booking_agent.calendar import format_minutes, get_date_obj, get_in_minutes
+from booking_agent.calendar_toolkit import CalendarToolkit
+
+MINUTES_PER_DAY = 24 * 60
+
+logger = logging.getLogger("booking-agent")
+
+# A free window in minutes since the first day of the calendar era, with its
+# date and its resource
+FreeWindow = Tuple[int, int, str, str]
+
+
+class MultiCalendarToolkit:
+    """
+    The calendars of several resources (practitioners, rooms..) searched
+    together, so that finding when some of them are free is a single tool call
+    instead of one per calendar.
+
+    The free windows of each calendar are streamed in chronological order and
+    the streams are merged with a heap, so the search reads the calendars date
+    by date and stops at the first window found.
+
+    Attributes:
+        _toolkits: The toolkit of each resource, by resource name
+        _sorted_dates: The (ordinal, date) of each calendar chronologically
+            sorted, computed on the first search of the resource
+    """
+    _toolkits: Dict[str, CalendarToolkit]
+    _sorted_dates: Dict[str, List[Tuple[int, str]]]
+
+    def __init__(self, toolkits: Dict[str, CalendarToolkit]):
+        self._toolkits = toolkits
+        self._sorted_dates = {}
+
+    ############
+    #  Public  #
+    ############
+
+    def get_resources(self) -> List[str]:
+        return list(self._toolkits)
+
+    def get_toolkit(self, resource: str) -> CalendarToolkit:
+        return self._toolkits[resource]
+
+    def find_earliest_slot(self, duration: str, resources: Optional[List[str]] = None,
+                           mode: Literal["any", "all"] = "any", from_date: Optional[str] = None,
+                           from_time: str = "00:00"):
+        """
+        Find the earliest window of a specific duration where any (or all) of
+        the resources are free.
+
+        :param duration: The duration wanted in format HH:mm
+        :param resources: The names of the resources to search, every resource if not given
+        :param mode: "any" for a window where at least one resource is free,
+            "all" for a window where every resource is free at the same time
+        :param from_date: The first date to search in format YYYY-m-d, the first date of the calendars if not given
+        :param from_time: The time from which to search on from_date in format HH:mm
+        """
+        logger.debug(f"Looking for the earliest window of {duration} where {mode} of {resources} are free")
+        resources = resources or self.get_resources()
+        unknown_resources = [resource for resource in resources if resource not in self._toolkits]
+        if len(unknown_resources) > 0:
+            return (f"Unknown resources: {', '.join(unknown_resources)}. "
+                    f"The resources are {', '.join(self.get_resources())}.")
+        try:
+            duration_minutes = get_in_minutes(duration)
+            from_ordinal = get_date_obj(from_date).toordinal() if from_date is not None else 0
+            from_minutes = from_ordinal * MINUTES_PER_DAY + get_in_minutes(from_time)
+        except ValueError:
+            return "Dates must be in format YYYY-m-d, the duration and times in format HH:mm."
+
+        streams = [self._iter_free_windows(resource, from_minutes) for resource in resources]
+        if mode == "all":
+            window = self._find_common_window(streams, duration_minutes)
+            if window is None:
+                return f"There's no window of {duration} where all of {', '.join(resources)} are free."
+            start, end, date = window
+            return (f"The earliest window of {duration} where all of {', '.join(resources)} are free "
+                    f"is on {date} from {format_minutes(start)} up to {format_minutes(end)}.")
+
+        window = self._find_first_window(streams, duration_minutes)
+        if window is None:
+            return f"There's no window of {duration} where any of {', '.join(resources)} is free."
+        start, end, date, resource = window
+        return (f"The earliest window of {duration} is with {resource} on {date} "
+                f"from {format_minutes(start)} up to {format_minutes(end)}.")
+
+    def book_resource(self, resource: str, date: str, start_time: str, duration: str):
+        """
+        Book a time in the calendar of a resource, the slots covering it are
+        booked together so that a window found by find_earliest_slot can be
+        booked as it is given.
+
+        :param resource: The name of the resource
+        :param date: The date in format YYYY-m-d
+        :param start_time: The start time in format HH:mm
+        :param duration: The duration in format HH:mm
+        """
+        if resource not in self._toolkits:
+            return f"Unknown resource {resource}. The resources are {', '.join(self.get_resources())}."
+        return self._toolkits[resource].book_covering(date, start_time, duration)
+
+    #############
+    #  Private  #
+    #############
+
+    def _get_sorted_dates(self, resource: str) -> List[Tuple[int, str]]:
+        sorted_dates = self._sorted_dates.get(resource)
+        if sorted_dates is None:
+            sorted_dates = []
+            for date in self._toolkits[resource].get_dates():
+                try:
+                    sorted_dates.append((get_date_obj(date).toordinal(), date))
+                except ValueError:
+                    logger.warning(f"Date {date} of {resource} is not in format YYYY-m-d, it won't be searched")
+            sorted_dates.sort()
+            self._sorted_dates[resource] = sorted_dates
+        return sorted_dates
+
+    def _iter_free_windows(self, resource: str, from_minutes: int) -> Iterator[FreeWindow]:
+        """
+        Streams the free windows of a resource that end after from_minutes, in
+        chronological order. Dates are only read when the stream reaches them.
+        """
+        toolkit = self._toolkits[resource]
+        sorted_dates = self._get_sorted_dates(resource)
+        first = bisect_left(sorted_dates, (from_minutes // MINUTES_PER_DAY, ""))
+        for ordinal, date in sorted_dates[first:]:
+            day_start = ordinal * MINUTES_PER_DAY
+            for start, end in toolkit.get_free_windows(date):
+                start, end = max(day_start + start, from_minutes), day_start + end
+                if start < end:
+                    yield start, end, date, resource
+
+    def _find_first_window(self, streams: List[Iterator[FreeWindow]], duration: int) -> Optional[FreeWindow]:
+        """
+        Merges the streams in a single chronological one, the first window
+        long enough is the one starting the earliest
+        """
+        for start, end, date, resource in heapq.merge(*streams):
+            if end - start >= duration:
+                day_start = start - start % MINUTES_PER_DAY
+                return start - day_start, end - day_start, date, resource
+        return None
+
+    def _find_common_window(self, streams: List[Iterator[FreeWindow]],
+                            duration: int) -> Optional[Tuple[int, int, str]]:
+        """
+        Intersects the streams: the current window of each stream is kept in a
+        heap by end. The intersection of the current windows runs from the
+        latest start to the earliest end, when it is too short the window
+        ending first can't be part of any later intersection and is replaced
+        by the next one of its stream.
+        """
+        heap = []
+        latest_start = None
+        for number, stream in enumerate(streams):
+            window = next(stream, None)
+            if window is None:
+                return None
+            heap.append((window[1], number, window))
+            latest_start = window if latest_start is None or window[0] > latest_start[0] else latest_start
+        heapq.heapify(heap)
+        while True:
+            earliest_end, number, _ = heap[0]
+            if earliest_end - latest_start[0] >= duration:
+                # Windows don't go past midnight, so the intersection is within a day
+                start, _, date, _ = latest_start
+                day_start = start - start % MINUTES_PER_DAY
+                return start - day_start, earliest_end - day_start, date
+            window = next(streams[number], None)
+            if window is None:
+                return None
+            heapq.heapreplace(heap, (window[1], number, window))
+            if window[0] > latest_start[0]:
+                latest_start = window
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
+
+from booking_agent.booking_policies import normalize_policy
+
+logger = logging.getLogger("booking-agent")
+
+MANIFEST_FILENAME = "manifest.json"
+
+def get_embeddings_model(embeddings: Embeddings) -> str:
+    """
+    Get the name of an embeddings model, vectors of different models can't be
+    mixed in a same index
+    """
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+def get_policy_id(policy: str) -> str:
+    return hashlib.sha256(policy.encode()).hexdigest()
+
+def read_policies(policy_filepath: str) -> List[str]:
+    """
+    Reads a policy file, one policy per line. Blank lines and duplicates are
+    skipped.
+
+    :param policy_filepath: The path of the policy file
+    :return: The policies in the order of the file
+    """
+    with open(policy_filepath, "r") as f:
+        policies = [line.strip() for line in f]
+    return list(dict.fromkeys(policy for policy in policies if policy != ""))
+
+def build_policy_index(policy_filepath: str, index_dir: str, embeddings: Embeddings,
+                       batch_size: int = 64, max_workers: int = 4,
+                       excluded_policies: Iterable[str] = ()) -> Dict[str, int]:
+    """
+    Builds or updates the FAISS index of a policy file incrementally. Each
+    policy is identified by the hash of its text and a manifest records the
+    policies of the index, so only new or changed policies are embedded and
+    deleted ones are removed from the index. When the file didn't change at all,
+    the index isn't even loaded.
+
+    :param policy_filepath: The path of the policy file, one policy per line
+    :param index_dir: The directory where the index and its manifest are saved
+    :param embeddings: The embeddings used to embed the policies
+    :param batch_size: The amount of policies embedded in a single request
+    :param max_workers: The amount of embedding requests running concurrently
+    :param excluded_policies: The policies left out of the index, those
+        enforced by booking rules don't need to be retrieved
+    :return: The amount of policies added, removed and kept. When no policy
+        is left to index, only the manifest is written, see load_policy_index
+    """
+    excluded_policies = sorted(set(excluded_policies))
+    source = hashlib.sha256()
+    with open(policy_filepath, "rb") as f:
+        source.update(f.read())
+    # Changing the exclusions changes the index like changing the file
+    for policy in excluded_policies:
+        source.update(b"\n-" + policy.encode())
+    source_hash = source.hexdigest()
+    model = get_embeddings_model(embeddings)
+    manifest = _load_manifest(index_dir)
+    index_exists = os.path.exists(os.path.join(index_dir, "index.faiss"))
+    reusable_index = index_exists and manifest.get("embeddings_model") == model
+
+    if reusable_index and manifest.get("source_hash") == source_hash:
+        logger.debug("Policy file unchanged, nothing to do")
+        return {"added": 0, "removed": 0, "kept": len(manifest["policies"])}
+
+    normalized_excluded_policies = {normalize_policy(policy) for policy in excluded_policies}
+    policies = {get_policy_id(policy): policy for policy in read_policies(policy_filepath)
+                if normalize_policy(policy) not in normalized_excluded_policies}
+    indexed_ids = set(manifest.get("policies", [])) if reusable_index else set()
+    new_ids = [policy_id for policy_id in policies if policy_id not in indexed_ids]
+    removed_ids = [policy_id for policy_id in indexed_ids if policy_id not in policies]
+
+    if len(policies) == 0:
+        # FAISS can't build an index without vectors
+        for filename in ("index.faiss", "index.pkl"):
+            if os.path.exists(os.path.join(index_dir, filename)):
+                os.remove(os.path.join(index_dir, filename))
+        os.makedirs(index_dir, exist_ok=True)
+        _save_manifest(index_dir, {"embeddings_model": model, "source_hash": source_hash, "policies": []})
+        logger.debug("No policy left to index, the index is empty")
+        return {"added": 0, "removed": len(removed_ids), "kept": 0}
+
+    new_texts = [policies[policy_id] for policy_id in new_ids]
+    batches = [new_texts[start:start + batch_size] for start in range(0, len(new_texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        new_vectors = [vector for batch_vectors in executor.map(embeddings.embed_documents, batches)
+                       for vector in batch_vectors]
+
+    # Imported here so that an unchanged run doesn't pay for it
+    from langchain_community.vectorstores import FAISS
+
+    text_embeddings = list(zip(new_texts, new_vectors))
+    metadatas = [{"source": policy_filepath} for _ in new_texts]
+    if reusable_index:
+        vec_db = FAISS.load_local(index_dir, embeddings=embeddings,
+                                  allow_dangerous_deserialization=True)
+        if len(removed_ids) > 0:
+            vec_db.delete(removed_ids)
+        if len(text_embeddings) > 0:
+            vec_db.add_embeddings(text_embeddings, metadatas=metadatas, ids=new_ids)
+    else:
+        vec_db = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=new_ids)
+    vec_db.save_local(index_dir)
+
+    _save_manifest(index_dir, {
+        "embeddings_model": model,
+        "source_hash": source_hash,
+        "policies": list(policies),
+    })
+    logger.debug(f"Embedded {len(new_ids)} policies and removed {len(removed_ids)} from the index")
+    return {"added": len(new_ids), "removed": len(removed_ids), "kept": len(policies) - len(new_ids)}
+
+def load_policy_index(index_dir: str, embeddings: Embeddings) -> VectorStore:
+    """
+    Loads an index built by build_policy_index
+
+    :param index_dir: The directory where the index and its manifest are saved
+    :param embeddings: The embeddings the index was built with
+    :return: The index, an empty store when no policy was indexed
+    """
+    if _load_manifest(index_dir).get("policies") == []:
+        return InMemoryVectorStore(embeddings)
+    from langchain_community.vectorstores import FAISS
+    return FAISS.load_local(index_dir, embeddings=embeddings, allow_dangerous_deserialization=True)
+
+def _load_manifest(index_dir: str) -> dict:
+    manifest_path = os.path.join(index_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def _save_manifest(index_dir: str, manifest: dict):
+    manifest_path = os.path.join(index_dir, MANIFEST_FILENAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
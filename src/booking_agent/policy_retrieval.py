@@ -0,0 +1,301 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from booking_agent.booking_policies import normalize_policy
+
+logger = logging.getLogger("booking-agent")
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local embeddings that don't need any network or model: words are hashed in
+    a fixed amount of signed buckets and the vector is normalized. Texts sharing
+    words end up close, which is enough to retrieve short policies offline.
+
+    Attributes:
+        model: The name of the embeddings, used in cache keys
+        _size: The size of the vectors
+    """
+    model: str
+    _size: int
+
+    def __init__(self, size: int = 256):
+        self._size = size
+        self.model = f"hashing-{size}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = [0.0] * self._size
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode()).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self._size
+            vector[bucket] += 1.0 if digest[4] % 2 == 0 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps embeddings with an in-memory LRU cache and an optional on-disk
+    sqlite store, both keyed by a hash of the embeddings model and the text, so
+    a text is embedded once even across restarts.
+
+    Attributes:
+        model: The name of the wrapped embeddings model
+        _embeddings: The wrapped embeddings
+        _max_size: The amount of vectors kept in memory
+        _memory_cache: The vectors in least recently used order
+        _connection: The connection to the on-disk store, if any
+        _lock: Protects the caches, embeddings are shared by sessions
+        _stats: The hits and misses of the caches
+    """
+    model: str
+    _embeddings: Embeddings
+    _max_size: int
+    _memory_cache: "OrderedDict[str, List[float]]"
+    _connection: Optional[sqlite3.Connection]
+    _lock: threading.Lock
+    _stats: Dict[str, int]
+
+    def __init__(self, embeddings: Embeddings, cache_path: Optional[str] = None,
+                 max_size: int = 1024, model: Optional[str] = None):
+        self._embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self._max_size = max_size
+        self._memory_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._connection = None
+        if cache_path is not None:
+            self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector TEXT)")
+
+    ############
+    #  Public  #
+    ############
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing_texts = self._lookup(texts)
+        if len(missing_texts) > 0:
+            # Every text that missed is embedded in a single call
+            missing_vectors = self._embeddings.embed_documents(missing_texts)
+            self._store(missing_texts, missing_vectors)
+            vectors = self._fill_missing(texts, vectors, missing_texts, missing_vectors)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vectors, missing_texts = self._lookup([text])
+        if len(missing_texts) > 0:
+            vector = self._embeddings.embed_query(text)
+            self._store([text], [vector])
+            return vector
+        return vectors[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing_texts = self._lookup(texts)
+        if len(missing_texts) > 0:
+            missing_vectors = await self._embeddings.aembed_documents(missing_texts)
+            self._store(missing_texts, missing_vectors)
+            vectors = self._fill_missing(texts, vectors, missing_texts, missing_vectors)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vectors, missing_texts = self._lookup([text])
+        if len(missing_texts) > 0:
+            vector = await self._embeddings.aembed_query(text)
+            self._store([text], [vector])
+            return vector
+        return vectors[0]
+
+    #############
+    #  Private  #
+    #############
+
+    def _get_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode()).hexdigest()
+
+    def _lookup(self, texts: List[str]):
+        """
+        Looks the texts up in memory then on disk
+
+        :param texts: The texts to look up
+        :return: The vectors of the texts (None when missing) and the missing
+            texts, without duplicates
+        """
+        vectors = []
+        missing_texts = {}
+        with self._lock:
+            for text in texts:
+                key = self._get_key(text)
+                vector = self._memory_cache.get(key)
+                if vector is not None:
+                    self._memory_cache.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                else:
+                    vector = self._load_from_disk(key)
+                    if vector is not None:
+                        self._remember(key, vector)
+                        self._stats["disk_hits"] += 1
+                    else:
+                        missing_texts[text] = True
+                        self._stats["misses"] += 1
+                vectors.append(vector)
+        return vectors, list(missing_texts)
+
+    def _fill_missing(self, texts: List[str], vectors: List[Optional[List[float]]],
+                      missing_texts: List[str], missing_vectors: List[List[float]]) -> List[List[float]]:
+        computed_vectors = dict(zip(missing_texts, missing_vectors))
+        return [vector if vector is not None else computed_vectors[text]
+                for text, vector in zip(texts, vectors)]
+
+    def _store(self, texts: List[str], vectors: List[List[float]]):
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self._get_key(text)
+                self._remember(key, vector)
+                if self._connection is not None:
+                    self._connection.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                                             (key, json.dumps(vector)))
+            if self._connection is not None:
+                self._connection.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory_cache[key] = vector
+        self._memory_cache.move_to_end(key)
+        while len(self._memory_cache) > self._max_size:
+            self._memory_cache.popitem(last=False)
+
+    def _load_from_disk(self, key: str) -> Optional[List[float]]:
+        if self._connection is None:
+            return None
+        row = self._connection.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+
+class PolicyRetriever:
+    """
+    Retrieves the booking policies relevant to a user message and caches the
+    results by message, since users often send the same short messages ("yes",
+    "book it"). The policies index doesn't change while serving so cached
+    results never go stale.
+
+    Policies enforced by booking rules can be excluded, more policies are
+    then searched so that the k policies returned are all left to the model.
+
+    Attributes:
+        _vectorstore: The vectorstore where booking policies are
+        _k: The amount of policies retrieved for a message
+        _excluded_policies: The normalized texts of the excluded policies
+        _max_size: The amount of results kept in memory
+        _cache: The results in least recently used order
+        _lock: Protects the cache, the retriever is shared by sessions
+        _stats: The hits and misses of the cache
+    """
+    _vectorstore: VectorStore
+    _k: int
+    _excluded_policies: FrozenSet[str]
+    _max_size: int
+    _cache: "OrderedDict[str, List[Document]]"
+    _lock: threading.Lock
+    _stats: Dict[str, int]
+
+    # Here I set k = 2 not to just have every policy in the index which
+    # would make the search a bit useless
+    def __init__(self, vectorstore: VectorStore, k: int = 2, max_size: int = 1024,
+                 excluded_policies: Iterable[str] = ()):
+        self._vectorstore = vectorstore
+        self._k = k
+        self._excluded_policies = frozenset(normalize_policy(policy) for policy in excluded_policies)
+        self._max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get the hits and misses of the retrieval cache, and of the embeddings
+        cache if the vectorstore uses CachedEmbeddings
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        embeddings = self._vectorstore.embeddings
+        if isinstance(embeddings, CachedEmbeddings):
+            stats.update({f"embeddings_{name}": value for name, value in embeddings.get_stats().items()})
+        return stats
+
+    def set_excluded_policies(self, excluded_policies: Iterable[str]):
+        """
+        Replace the excluded policies, the cached results are dropped if they
+        changed
+
+        :param excluded_policies: The texts of the policies to exclude
+        """
+        excluded_policies = frozenset(normalize_policy(policy) for policy in excluded_policies)
+        with self._lock:
+            if excluded_policies != self._excluded_policies:
+                self._excluded_policies = excluded_policies
+                self._cache.clear()
+
+    def retrieve(self, msg: str) -> List[Document]:
+        """
+        Get the policies relevant to a message
+
+        :param msg: The user message
+        """
+        key = self._get_key(msg)
+        results = self._get_cached(key)
+        if results is None:
+            results = self._vectorstore.similarity_search(msg, k=self._k + len(self._excluded_policies))
+            results = self._filter(results)
+            self._set_cached(key, results)
+        return results
+
+    async def aretrieve(self, msg: str) -> List[Document]:
+        key = self._get_key(msg)
+        results = self._get_cached(key)
+        if results is None:
+            results = await self._vectorstore.asimilarity_search(msg, k=self._k + len(self._excluded_policies))
+            results = self._filter(results)
+            self._set_cached(key, results)
+        return results
+
+    def _filter(self, results: List[Document]) -> List[Document]:
+        return [result for result in results
+                if normalize_policy(result.page_content) not in self._excluded_policies][:self._k]
+
+    def _get_key(self, msg: str) -> str:
+        # Case and spacing don't change the meaning of a message
+        return " ".join(msg.lower().split())
+
+    def _get_cached(self, key: str) -> Optional[List[Document]]:
+        with self._lock:
+            results = self._cache.get(key)
+            if results is None:
+                self._stats["misses"] += 1
+                return None
+            self._cache.move_to_end(key)
+            self._stats["hits"] += 1
+            return results
+
+    def _set_cached(self, key: str, results: List[Document]):
+        with self._lock:
+            self._cache[key] = results
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+
+class VersionedResultCache:
+    """
+    Caches the results of read-only calendar tools by arguments, along with
+    the version of the calendar dates they were computed from. A result is
+    only returned while the version is the same, and versions are bumped by
+    every booking, so a cached result is never stale and nothing has to be
+    invalidated. Outdated results are dropped when they are looked up or
+    pushed out of the cache.
+
+    Attributes:
+        _max_size: The amount of results kept in memory, 0 disables the cache
+        _cache: The (version, result) of each key in least recently used order
+        _lock: Protects the cache, the toolkit is shared by sessions
+        _stats: The hits and misses of the cache
+    """
+    _max_size: int
+    _cache: "OrderedDict[Hashable, Tuple[int, Any]]"
+    _lock: threading.Lock
+    _stats: Dict[str, int]
+
+    def __init__(self, max_size: int = 4096):
+        self._max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: Hashable, version: int, default: Any = None) -> Any:
+        """
+        Get the result of a key computed at a version
+
+        :param key: The tool and its arguments
+        :param version: The current version of the dates the result depends on
+        :param default: Returned when there's no result for this version
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    del self._cache[key]
+                self._stats["misses"] += 1
+                return default
+            self._cache.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key: Hashable, version: int, result: Any):
+        """
+        Stores the result of a key
+
+        :param version: The version of the dates read before computing the
+            result, so that a booking made during the computation makes it
+            outdated
+        """
+        if self._max_size == 0:
+            return
+        with self._lock:
+            self._cache[key] = (version, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Tuple, TypeVar
+
+logger = logging.getLogger("booking-agent")
+
+Agent = TypeVar("Agent")
+
+class SessionManager(Generic[Agent]):
+    """
+    Keeps one agent per session so that conversations don't bleed into each
+    other. Agents are created on the first message of a session by a factory,
+    which is where heavy resources (model client, vectorstore, calendar) are
+    shared between them.
+
+    Sessions are kept in least recently used order, the least recently used ones
+    are evicted when there are more than max_sessions, and sessions idle for
+    more than session_ttl seconds are evicted as well.
+
+    Attributes:
+        _agent_factory: Creates the agent of a new session
+        _max_sessions: The maximum amount of sessions kept in memory
+        _session_ttl: The amount of seconds after which an idle session is evicted
+        _clock: Gives the current time in seconds
+        _sessions: The (agent, last access time) of each session, least
+            recently used first
+        _lock: Protects the sessions, the manager is shared by every request
+    """
+    _agent_factory: Callable[[], Agent]
+    _max_sessions: int
+    _session_ttl: float
+    _clock: Callable[[], float]
+    _sessions: "OrderedDict[str, Tuple[Agent, float]]"
+    _lock: threading.Lock
+
+    def __init__(self, agent_factory: Callable[[], Agent], max_sessions: int = 1000,
+                 session_ttl: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self._agent_factory = agent_factory
+        self._max_sessions = max_sessions
+        self._session_ttl = session_ttl
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Agent:
+        """
+        Get the agent of a session, creating it if the session is new or was
+        evicted
+
+        :param session_id: The id of the session
+        :return: The agent of the session
+        """
+        now = self._clock()
+        with self._lock:
+            self._evict_expired(now)
+            if session_id in self._sessions:
+                agent, _ = self._sessions.pop(session_id)
+                self._sessions[session_id] = (agent, now)
+                return agent
+
+        # Created outside of the lock so that other sessions are not blocked
+        logger.debug(f"Creating an agent for session {session_id}")
+        new_agent = self._agent_factory()
+        with self._lock:
+            # The same session may have sent two messages at the same time
+            agent, _ = self._sessions.pop(session_id, (new_agent, now))
+            self._sessions[session_id] = (agent, now)
+            while len(self._sessions) > self._max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                logger.debug(f"Evicting least recently used session {evicted_id}")
+        return agent
+
+    def drop(self, session_id: str):
+        """
+        Forgets a session, its next message will start a new conversation
+
+        :param session_id: The id of the session
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self):
+        """
+        Forgets every session
+        """
+        with self._lock:
+            self._sessions.clear()
+
+    def _evict_expired(self, now: float):
+        """
+        Evicts the sessions idle for more than session_ttl, they are the first
+        ones since sessions are kept in least recently used order
+        """
+        while len(self._sessions) > 0:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access <= self._session_ttl:
+                return
+            logger.debug(f"Evicting idle session {session_id}")
+            self._sessions.popitem(last=False)
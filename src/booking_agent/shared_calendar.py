@@ -0,0 +1,430 @@
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+from collections.abc import Mapping
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from booking_agent.calendar import TimeSlot, get_in_minutes
+from booking_agent.slot_index import DaySlotIndex
+
+if TYPE_CHECKING:
+    from booking_agent.calendar_overlay import AnyCalendar
+
+try:
+    import fcntl
+except ImportError:
+    # Cross-process locks rely on POSIX record locks
+    fcntl = None
+
+logger = logging.getLogger("booking-agent")
+
+MAGIC = b"BKCAL001"
+# magic, metadata size, amount of dates, amount of slots, version of the calendar
+_header = struct.Struct("8sQQQQ")
+# The position of the version of the calendar among the fields after the magic
+_VERSION_INDEX = 3
+# The amount of changes kept in the change feed, like CHANGE_FEED_SIZE of the
+# toolkit
+SHARED_CHANGE_FEED_SIZE = 1024
+
+
+def _get_layout(metadata_size: int, date_count: int) -> Tuple[int, int, int]:
+    """
+    Get the offsets of the versions, of the change feed and of the
+    availabilities in the block, the 8 bytes integers are aligned
+    """
+    versions_offset = (_header.size + metadata_size + 7) // 8 * 8
+    changes_offset = versions_offset + date_count * 8
+    return versions_offset, changes_offset, changes_offset + SHARED_CHANGE_FEED_SIZE * 16
+
+
+class _LockFile:
+    """
+    The lock file of a shared calendar opened by this process. Record locks
+    belong to processes and closing any descriptor of the file releases all
+    of them, so the file is opened once per process and shared by every
+    calendar attached to it, along with the thread locks of the dates.
+
+    Attributes:
+        fd: The descriptor of the lock file
+        thread_locks: The thread lock of each position
+        thread_locks_guard: Protects the creation of the thread locks
+        users: The amount of calendars using the file
+    """
+    fd: int
+    thread_locks: Dict[int, threading.Lock]
+    thread_locks_guard: threading.Lock
+    users: int
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.thread_locks = {}
+        self.thread_locks_guard = threading.Lock()
+        self.users = 0
+
+
+# The lock files opened by this process, by real path
+_lock_files: Dict[str, _LockFile] = {}
+_lock_files_guard = threading.Lock()
+
+
+def _open_lock_file(path: str) -> _LockFile:
+    with _lock_files_guard:
+        lock_file = _lock_files.get(path)
+        if lock_file is None:
+            lock_file = _lock_files[path] = _LockFile(path)
+        lock_file.users += 1
+        return lock_file
+
+
+def _close_lock_file(path: str, lock_file: _LockFile):
+    with _lock_files_guard:
+        lock_file.users -= 1
+        if lock_file.users == 0:
+            # A calendar inherited through a fork has a file the child
+            # doesn't register
+            if _lock_files.get(path) is lock_file:
+                del _lock_files[path]
+            os.close(lock_file.fd)
+
+
+def _forget_lock_files():
+    """
+    A forked child holds none of the record locks of its parent and its
+    thread locks may have been copied while held, so it opens its own files
+    """
+    global _lock_files, _lock_files_guard
+    _lock_files = {}
+    _lock_files_guard = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_lock_files)
+
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Attaches an existing block without tracking it, only its creator unlinks
+    it. Before Python 3.13 blocks can't be attached untracked, workers must
+    then be started by the creator with multiprocessing so that they share
+    its resource tracker, else the block would be unlinked when a worker exits.
+    """
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        return SharedMemory(name=name)
+
+
+class SharedDateLock:
+    """
+    Serializes the bookings of a date across threads and processes: a thread
+    lock for the threads of the process, then a record lock on the byte of the
+    date in the lock file for the other processes (record locks are held by
+    processes, not threads). Both are shared by every calendar attached to the
+    lock file in the process. Record locks are released by the system if the
+    process dies.
+
+    Attributes:
+        _thread_lock: Serializes the threads of this process
+        _fd: The lock file, opened once per process
+        _position: The byte locked in the lock file
+    """
+    __slots__ = ("_thread_lock", "_fd", "_position")
+
+    def __init__(self, thread_lock: threading.Lock, fd: int, position: int):
+        self._thread_lock = thread_lock
+        self._fd = fd
+        self._position = position
+
+    def __enter__(self) -> "SharedDateLock":
+        self._thread_lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._position, os.SEEK_SET)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._position, os.SEEK_SET)
+        self._thread_lock.release()
+        return False
+
+
+class SharedDaySlotIndex(DaySlotIndex):
+    """
+    The slot index of a date of a shared calendar, availabilities are read
+    from and written to the shared memory so that bookings of every process
+    are seen at once
+
+    Attributes:
+        _availability: The availability byte of every slot of the calendar
+        _offset: The position of the first slot of the date in _availability
+    """
+    _availability: memoryview
+    _offset: int
+
+    def __init__(self, slots: List[TimeSlot], availability: memoryview, offset: int):
+        # Slots are stored sorted, so positions in the index are positions in
+        # the shared memory
+        super().__init__(slots)
+        self._availability = availability
+        self._offset = offset
+
+    def get_slot(self, position: int) -> TimeSlot:
+        slot = self._slots[position]
+        slot.available = self.is_available(position)
+        return slot
+
+    def is_available(self, position: int) -> bool:
+        return self._availability[self._offset + position] == 1
+
+    def mark_unavailable(self, position: int):
+        self._availability[self._offset + position] = 0
+        self._slots[position].available = False
+
+
+class SharedDays(Mapping):
+    """
+    The dates of a shared calendar, each access gives the slots of the date as
+    they are in the shared memory when accessed
+    """
+
+    def __init__(self, calendar: "SharedMemoryCalendar"):
+        self._calendar = calendar
+
+    def __getitem__(self, date: str) -> List[TimeSlot]:
+        return self._calendar.get_slots(date)
+
+    def __contains__(self, date: object) -> bool:
+        return date in self._calendar._date_positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._calendar._dates)
+
+    def __len__(self) -> int:
+        return len(self._calendar._dates)
+
+
+class SharedMemoryCalendar:
+    """
+    A calendar held in a shared memory block, so that several worker
+    processes on a host book in one consistent calendar. The block holds the
+    slots of every date (their times are fixed), one availability byte per
+    slot, the version of each date, the version of the calendar and a change
+    feed. Bookings of a date are serialized across processes by a record lock
+    on a lock file, see SharedDateLock.
+
+    The calendar is created once by a parent process with create and every
+    worker attaches to it by name with attach, after being started. Only the
+    creator unlinks it. A process can attach several times, the calendars
+    share the locks of the process.
+
+    Attributes:
+        root: The slots of each date, like Calendar.root
+        _shared_memory: The shared memory block
+        _dates: The dates in the order of the calendar
+        _date_positions: The position of each date in _dates
+        _slot_offsets: The position of the first slot of each date, and the
+            amount of slots at the end
+        _slot_times: The (start, end) of each slot
+        _availability: One byte per slot, 1 when available
+        _versions: The version of each date
+        _header: The header fields, the version of the calendar among them
+        _changes: The (version, date position) of the last changes, at
+            version % SHARED_CHANGE_FEED_SIZE
+        _lock_path: The real path of the lock file
+        _lock_file: The lock file and the thread locks of this process
+        _guard_position: The byte of the lock file protecting the versions
+    """
+    root: SharedDays
+    _shared_memory: SharedMemory
+    _dates: List[str]
+    _date_positions: Dict[str, int]
+    _slot_offsets: List[int]
+    _slot_times: List[List[str]]
+    _availability: memoryview
+    _versions: memoryview
+    _header: memoryview
+    _changes: memoryview
+    _lock_path: str
+    _lock_file: _LockFile
+    _guard_position: int
+
+    def __init__(self, shared_memory: SharedMemory, lock_path: Optional[str] = None):
+        if fcntl is None:
+            raise OSError("Shared calendars need POSIX record locks")
+        self._shared_memory = shared_memory
+        buffer = shared_memory.buf
+        magic, metadata_size, date_count, slot_count, _ = _header.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{shared_memory.name} is not a shared calendar")
+        metadata = json.loads(bytes(buffer[_header.size:_header.size + metadata_size]))
+        self._dates = metadata["dates"]
+        self._date_positions = {date: position for position, date in enumerate(self._dates)}
+        self._slot_offsets = metadata["slot_offsets"]
+        self._slot_times = metadata["slot_times"]
+
+        versions_offset, changes_offset, availability_offset = _get_layout(metadata_size, date_count)
+        self._versions = buffer[versions_offset:changes_offset].cast("Q")
+        self._changes = buffer[changes_offset:availability_offset].cast("Q")
+        self._availability = buffer[availability_offset:availability_offset + slot_count]
+        self._header = buffer[len(MAGIC):_header.size].cast("Q")
+
+        lock_path = lock_path or os.path.join(tempfile.gettempdir(), f"{shared_memory.name.lstrip('/')}.lock")
+        self._lock_path = os.path.realpath(lock_path)
+        self._lock_file = _open_lock_file(self._lock_path)
+        self._guard_position = date_count
+        self.root = SharedDays(self)
+
+    @classmethod
+    def create(cls, calendar: "AnyCalendar", name: Optional[str] = None,
+               lock_path: Optional[str] = None) -> "SharedMemoryCalendar":
+        """
+        Copies a calendar in a new shared memory block
+
+        :param calendar: The calendar to share
+        :param name: The name of the block, a random one if not given
+        :param lock_path: The lock file, next to the temporary files if not given
+        """
+        dates = list(calendar.root)
+        slot_offsets = [0]
+        slot_times = []
+        availabilities = bytearray()
+        for date in dates:
+            for slot in sorted(calendar.root[date], key=lambda slot: get_in_minutes(slot.start)):
+                slot_times.append([slot.start, slot.end])
+                availabilities.append(1 if slot.available else 0)
+            slot_offsets.append(len(slot_times))
+        metadata = json.dumps({"dates": dates, "slot_offsets": slot_offsets, "slot_times": slot_times}).encode()
+
+        _, _, availability_offset = _get_layout(len(metadata), len(dates))
+        # A block can't be empty
+        shared_memory = SharedMemory(name=name, create=True, size=max(availability_offset + len(slot_times), 1))
+        buffer = shared_memory.buf
+        _header.pack_into(buffer, 0, MAGIC, len(metadata), len(dates), len(slot_times), 0)
+        buffer[_header.size:_header.size + len(metadata)] = metadata
+        # Versions and the change feed start at 0, the block is zero-filled
+        buffer[availability_offset:availability_offset + len(slot_times)] = availabilities
+        logger.debug(f"Shared {len(dates)} dates and {len(slot_times)} slots in {shared_memory.name}")
+        return cls(shared_memory, lock_path)
+
+    @classmethod
+    def attach(cls, name: str, lock_path: Optional[str] = None) -> "SharedMemoryCalendar":
+        """
+        Attaches a calendar shared by another process
+
+        :param name: The name of the block, see get_name
+        :param lock_path: The lock file given to create, if any
+        """
+        return cls(_attach(name), lock_path)
+
+    ############
+    #  Public  #
+    ############
+
+    def get_name(self) -> str:
+        return self._shared_memory.name
+
+    def get_slots(self, date: str) -> List[TimeSlot]:
+        """
+        Get the slots of a date as they are now
+
+        :raises KeyError: date not found in calendar
+        """
+        position = self._date_positions[date]
+        first, last = self._slot_offsets[position], self._slot_offsets[position + 1]
+        return [TimeSlot(start=start, end=end, available=self._availability[first + number] == 1)
+                for number, (start, end) in enumerate(self._slot_times[first:last])]
+
+    def get_index(self, date: str) -> SharedDaySlotIndex:
+        """
+        Get an index of a date reading and writing the shared availabilities
+
+        :raises KeyError: date not found in calendar
+        """
+        return SharedDaySlotIndex(self.get_slots(date), self._availability,
+                                  self._slot_offsets[self._date_positions[date]])
+
+    def get_date_lock(self, date: str) -> SharedDateLock:
+        return self._get_lock(self._date_positions[date])
+
+    def get_version(self, date: str) -> int:
+        position = self._date_positions.get(date)
+        return self._versions[position] if position is not None else 0
+
+    def get_calendar_version(self) -> int:
+        return self._header[_VERSION_INDEX]
+
+    def record_changes(self, dates: List[str]):
+        """
+        Bumps the versions of changed dates and of the calendar, and records
+        the changes in the feed
+        """
+        with self._get_lock(self._guard_position):
+            version = self._header[_VERSION_INDEX]
+            for date in dates:
+                position = self._date_positions[date]
+                self._versions[position] += 1
+                version += 1
+                feed_position = version % SHARED_CHANGE_FEED_SIZE * 2
+                self._changes[feed_position] = version
+                self._changes[feed_position + 1] = position
+            self._header[_VERSION_INDEX] = version
+
+    def get_changes_since(self, version: int) -> Optional[List[str]]:
+        """
+        Get the dates changed since a version of the calendar, None when the
+        change feed doesn't go back to this version anymore
+        """
+        with self._get_lock(self._guard_position):
+            current_version = self._header[_VERSION_INDEX]
+            if version == current_version:
+                return []
+            if version > current_version or current_version - version > SHARED_CHANGE_FEED_SIZE:
+                return None
+            positions = [self._changes[change_version % SHARED_CHANGE_FEED_SIZE * 2 + 1]
+                         for change_version in range(version + 1, current_version + 1)]
+        return list(dict.fromkeys(self._dates[position] for position in positions))
+
+    def model_dump(self) -> Dict[str, List[dict]]:
+        """
+        Get the calendar in json format, like Calendar.model_dump
+        """
+        return {date: [slot.model_dump() for slot in self.get_slots(date)] for date in self._dates}
+
+    def close(self):
+        """
+        Detaches the calendar from this process
+        """
+        for view in (self._availability, self._versions, self._changes, self._header):
+            view.release()
+        self._shared_memory.close()
+        _close_lock_file(self._lock_path, self._lock_file)
+
+    def unlink(self):
+        """
+        Destroys the shared memory block and its lock file, once every
+        process closed it
+        """
+        self._shared_memory.unlink()
+        try:
+            os.unlink(self._lock_path)
+        except FileNotFoundError:
+            pass
+
+    #############
+    #  Private  #
+    #############
+
+    def _get_lock(self, position: int) -> SharedDateLock:
+        lock_file = self._lock_file
+        thread_lock = lock_file.thread_locks.get(position)
+        if thread_lock is None:
+            with lock_file.thread_locks_guard:
+                thread_lock = lock_file.thread_locks.setdefault(position, threading.Lock())
+        return SharedDateLock(thread_lock, lock_file.fd, position)
@@ -0,0 +1,82 @@
+import logging
+from typing import Dict, List, Optional
+
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.booking_policies import BookingPolicies
+from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.exceptions import DateUnavailableError
+from booking_agent.shared_calendar import SharedDateLock, SharedMemoryCalendar
+from booking_agent.slot_index import DaySlotIndex
+
+logger = logging.getLogger("booking-agent")
+
+
+class SharedCalendarToolkit(CalendarToolkit):
+    """
+    A toolkit over a calendar in shared memory, each worker process has its
+    own toolkit over the same calendar. The date locks, the versions and the
+    change feed live in the shared calendar so that bookings are atomic
+    across processes and the caches of every process (slot indexes, bitmap
+    rows, tool results) see the bookings of the others.
+
+    The journal is not shared: each worker should journal its bookings in a
+    journal of its own, that doesn't compact since its calendar holds the
+    bookings of the others. The process that created the calendar replays
+    these journals after a crash and compacts the calendar in its journal.
+
+    Attributes:
+        _row_versions: The version of each date when its bitmap row was
+            filled, a row is filled again when the date changed since
+    """
+    _calendar: SharedMemoryCalendar
+    _row_versions: Dict[str, int]
+
+    def __init__(self, calendar: SharedMemoryCalendar, journal: Optional[BookingJournal] = None,
+                 result_cache_size: int = 4096, policies: Optional[BookingPolicies] = None):
+        super().__init__(calendar, journal, result_cache_size, policies)
+        self._row_versions = {}
+
+    ############
+    #  Public  #
+    ############
+
+    def get_version(self) -> int:
+        return self._calendar.get_calendar_version()
+
+    def get_changes_since(self, version: int) -> Optional[List[str]]:
+        return self._calendar.get_changes_since(version)
+
+    #############
+    #  Private  #
+    #############
+
+    def _get_date_lock(self, date: str) -> SharedDateLock:
+        return self._calendar.get_date_lock(date)
+
+    def _get_version(self, date: str) -> int:
+        return self._calendar.get_version(date)
+
+    def _record_changes(self, dates: List[str]):
+        self._calendar.record_changes(dates)
+
+    def _get_index(self, date: str) -> DaySlotIndex:
+        index = self._indexes.get(date)
+        if index is None:
+            try:
+                index = self._indexes.setdefault(date, self._calendar.get_index(date))
+            except KeyError:
+                raise DateUnavailableError
+        return index
+
+    def _get_available_slots_range(self, start_date: str, end_date: str, duration: str,
+                                   duration_minutes: int, first: int, last: int):
+        # Rows of dates booked by other processes since they were filled are
+        # filled again, the version is read under the date lock so that it
+        # matches the row
+        bitmap = self._get_bitmap()
+        for date in bitmap.get_dates(first, last):
+            if self._row_versions.get(date) != self._get_version(date):
+                with self._get_date_lock(date):
+                    self._row_versions[date] = self._get_version(date)
+                    bitmap.set_day(date, self._get_free_intervals(date))
+        return super()._get_available_slots_range(start_date, end_date, duration, duration_minutes, first, last)
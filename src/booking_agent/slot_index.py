@@ -0,0 +1,103 @@
+from bisect import bisect_left
+from typing import List
+
+from booking_agent.calendar import TimeSlot, get_in_minutes
+from booking_agent.exceptions import TimeSlotUnavailableError
+
+
+class DaySlotIndex:
+    """
+    A sorted view of the slots of a single date. Slot times are parsed once to
+    minute offsets so that lookups are bisections on integers instead of
+    linear scans comparing strings.
+
+    The index keeps references to the calendar TimeSlot objects, so booking
+    through it updates the calendar in place.
+
+    Attributes:
+        _slots: The slots of the date sorted by start time
+        _starts: The start of each slot in minutes
+        _ends: The end of each slot in minutes
+    """
+    _slots: List[TimeSlot]
+    _starts: List[int]
+    _ends: List[int]
+
+    def __init__(self, slots: List[TimeSlot]):
+        self._slots = sorted(slots, key=lambda slot: get_in_minutes(slot.start))
+        self._starts = [get_in_minutes(slot.start) for slot in self._slots]
+        self._ends = [get_in_minutes(slot.end) for slot in self._slots]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def find(self, start_minutes: int) -> int:
+        """
+        Find the position of the slot that begins at start_minutes
+
+        :param start_minutes: The start of the slot in minutes
+        :return: The position of the slot in the index
+        :raises TimeSlotUnavailableError: no slot begins at this time
+        """
+        position = bisect_left(self._starts, start_minutes)
+        if position == len(self._starts) or self._starts[position] != start_minutes:
+            raise TimeSlotUnavailableError
+        return position
+
+    def get_positions_within(self, start_minutes: int, end_minutes: int) -> List[int]:
+        """
+        Find the positions of the slots lying between start_minutes and
+        end_minutes
+
+        :param start_minutes: The start of the window in minutes
+        :param end_minutes: The end of the window in minutes
+        :return: The positions of the slots, sorted by start
+        """
+        positions = []
+        position = bisect_left(self._starts, start_minutes)
+        while position < len(self._starts) and self._starts[position] < end_minutes:
+            if self._ends[position] <= end_minutes:
+                positions.append(position)
+            position += 1
+        return positions
+
+    def get_positions_overlapping(self, start_minutes: int, end_minutes: int) -> List[int]:
+        """
+        Find the positions of the slots having some time between start_minutes
+        and end_minutes
+
+        :param start_minutes: The start of the time in minutes
+        :param end_minutes: The end of the time in minutes
+        :return: The positions of the slots, sorted by start
+        """
+        position = bisect_left(self._starts, start_minutes)
+        if position > 0 and self._ends[position - 1] > start_minutes:
+            position -= 1
+        positions = []
+        while position < len(self._starts) and self._starts[position] < end_minutes:
+            positions.append(position)
+            position += 1
+        return positions
+
+    def get_slot(self, position: int) -> TimeSlot:
+        return self._slots[position]
+
+    def get_start(self, position: int) -> int:
+        return self._starts[position]
+
+    def get_end(self, position: int) -> int:
+        return self._ends[position]
+
+    def get_duration(self, position: int) -> int:
+        return self._ends[position] - self._starts[position]
+
+    def is_available(self, position: int) -> bool:
+        return self._slots[position].available
+
+    def mark_unavailable(self, position: int):
+        """
+        Books the slot at position, the underlying TimeSlot is updated in place
+
+        :param position: The position of the slot in the index
+        """
+        self._slots[position].available = False
@@ -0,0 +1,47 @@
+from datetime import date
+
+from booking_agent.availability_bitmap import AvailabilityBitmap
+from booking_agent.calendar import Calendar
+
+
+def make_calendar():
+    return Calendar(**{
+        "2024-10-14": [
+            {"start": "09:00", "end": "10:00", "available": True},
+            {"start": "10:00", "end": "10:30", "available": True},
+            {"start": "11:00", "end": "12:00", "available": True},
+        ],
+        "2024-10-13": [
+            {"start": "09:00", "end": "10:00", "available": False},
+            {"start": "15:00", "end": "16:30", "available": True},
+        ],
+        "2024-10-20": [
+            {"start": "09:00", "end": "12:00", "available": True},
+        ],
+    })
+
+
+class TestAvailabilityBitmap:
+
+    def test_find_windows_merges_contiguous_slots(self):
+        bitmap = AvailabilityBitmap.from_calendar(make_calendar())
+        first, last = bitmap.get_range(date(2024, 10, 13).toordinal(),
+                                       date(2024, 10, 14).toordinal())
+        assert bitmap.find_windows(first, last, 90) == [
+            ("2024-10-13", 15 * 60, 16 * 60 + 30),
+            ("2024-10-14", 9 * 60, 10 * 60 + 30),
+        ]
+
+    def test_set_unavailable(self):
+        bitmap = AvailabilityBitmap.from_calendar(make_calendar())
+        bitmap.set_unavailable("2024-10-14", 9 * 60, 10 * 60)
+        first, last = bitmap.get_range(date(2024, 10, 14).toordinal(),
+                                       date(2024, 10, 14).toordinal())
+        assert bitmap.find_windows(first, last, 30) == [
+            ("2024-10-14", 10 * 60, 10 * 60 + 30),
+            ("2024-10-14", 11 * 60, 12 * 60),
+        ]
+
+    def test_compact_size(self):
+        bitmap = AvailabilityBitmap.from_calendar(make_calendar())
+        assert bitmap.nbytes < 3 * 200
@@ -0,0 +1,25 @@
+from benchmarks.run import find_regressions, time_operation
+from benchmarks.synthetic import generate_calendar_dict
+
+
+class TestBenchmarks:
+
+    def test_generate_calendar_dict(self):
+        calendar_dict = generate_calendar_dict(days=2, slot_minutes=30, occupancy=0.0,
+                                               day_start="09:00", day_end="12:00")
+        assert list(calendar_dict) == ["2024-10-14", "2024-10-15"]
+        assert [slot["start"] for slot in calendar_dict["2024-10-14"]] == \
+            ["09:00", "09:30", "10:00", "10:30", "11:00", "11:30"]
+        assert all(slot["available"] for slot in calendar_dict["2024-10-15"])
+
+    def test_time_operation_calls_setup_before_each_repeat(self):
+        calls = []
+        result = time_operation(lambda: calls.append("operation"), number=2, repeat=3,
+                                setup=lambda: calls.append("setup"))
+        assert calls == ["setup", "operation", "operation"] * 3
+        assert result["min_us"] <= result["median_us"]
+
+    def test_find_regressions(self):
+        baseline = {"fast": {"median_us": 10.0}, "slow": {"median_us": 10.0}}
+        results = {"fast": {"median_us": 11.0}, "slow": {"median_us": 13.0}, "new": {"median_us": 1.0}}
+        assert find_regressions(results, baseline, tolerance=0.25) == ["slow"]
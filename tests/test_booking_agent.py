@@ -0,0 +1,167 @@
+import asyncio
+import io
+import json
+import threading
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from benchmarks.fake_models import ScriptedChatModel, answer_message, tool_call_message
+from booking_agent.booking_agent import BookingAgent
+from booking_agent.booking_policies import BookingPolicies
+from booking_agent.calendar import Calendar
+from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.fast_path import FastPathRouter
+from booking_agent.metrics import JsonLinesLogger
+from booking_agent.multi_calendar_toolkit import MultiCalendarToolkit
+
+
+@pytest.fixture
+def calendar_toolkit():
+    with open("tests/test_files/calendar_test.json", "r") as f:
+        return CalendarToolkit(Calendar(**json.load(f)))
+
+
+@pytest.fixture
+def policies_db():
+    with open("data/booking_policies.txt", "r") as f:
+        policies = [line.strip() for line in f if line.strip()]
+    return InMemoryVectorStore.from_texts(policies, DeterministicFakeEmbedding(size=32))
+
+
+class TestBookingAgent:
+
+    def test_ainvoke_books(self, calendar_toolkit, policies_db):
+        model = ScriptedChatModel.from_messages([
+            tool_call_message({"name": "book", "args": {"date": "2024-10-13", "start_time": "09:00",
+                                                        "duration": "01:00"}}),
+            answer_message("Booked!"),
+        ])
+        agent = BookingAgent(model, calendar_toolkit, policies_db)
+        assert asyncio.run(agent.ainvoke("Book 2024-10-13 at 9")) == "Booked!"
+        assert calendar_toolkit.is_time_slot_available("2024-10-13", "09:00") is False
+        first_prompt = model.calls[0][-1].content
+        assert "User msg: Book 2024-10-13 at 9" in first_prompt
+        assert "Relevant booking policies:" in first_prompt
+
+    def test_astream(self, calendar_toolkit, policies_db):
+        model = ScriptedChatModel.from_messages([
+            tool_call_message({"name": "is_time_slot_available",
+                               "args": {"date": "2024-10-13", "start_time": "09:00"}}),
+            answer_message("Yes, it is available"),
+        ])
+        agent = BookingAgent(model, calendar_toolkit, policies_db)
+
+        async def collect_events():
+            return [event async for event in agent.astream("Is 2024-10-13 at 9 free?")]
+
+        events = asyncio.run(collect_events())
+        assert [(event.type, event.content) for event in events] == [
+            ("tool_call", "Checking availability on 2024-10-13 at 09:00"),
+            ("token", "Yes, "),
+            ("token", "it "),
+            ("token", "is "),
+            ("token", "available"),
+        ]
+        # The whole exchange is in memory, with merged messages
+        assert agent._messages[-1].content == "Yes, it is available"
+        assert agent._messages[-2].content.lower() == "true"
+        assert agent._messages[-3].tool_calls[0]["args"] == {"date": "2024-10-13", "start_time": "09:00"}
+
+    def test_retrieval_span_belongs_to_the_turn(self, calendar_toolkit, policies_db):
+        file = io.StringIO()
+        agent = BookingAgent(ScriptedChatModel.from_messages([answer_message("Hello!")]),
+                             calendar_toolkit, policies_db, metrics_sink=JsonLinesLogger(file=file))
+        agent.invoke("Hi")
+        spans = [json.loads(line) for line in file.getvalue().splitlines()]
+        assert [span["name"] for span in spans] == ["retrieval", "llm_call", "turn"]
+        assert len({span["attributes"]["turn"] for span in spans}) == 1
+
+    def test_find_earliest_slot_tool(self, calendar_toolkit, policies_db):
+        model = ScriptedChatModel.from_messages([
+            tool_call_message({"name": "find_earliest_slot",
+                               "args": {"duration": "01:00", "resources": ["main", "room"], "mode": "all"}}),
+            answer_message("The earliest is on 2024-10-13 at 09:00"),
+        ])
+        multi_calendar_toolkit = MultiCalendarToolkit({"main": calendar_toolkit, "room": calendar_toolkit.fork()})
+        agent = BookingAgent(model, calendar_toolkit, policies_db, multi_calendar_toolkit=multi_calendar_toolkit)
+        agent.invoke("When are both the main calendar and the room free?")
+        assert agent._messages[-2].content == \
+            "The earliest window of 01:00 where all of main, room are free is on 2024-10-13 from 09:00 up to 10:00."
+
+    def test_fast_path(self, calendar_toolkit, policies_db):
+        model = ScriptedChatModel.from_messages([answer_message("It is booked for you")])
+        router = FastPathRouter(lambda date, start_time, duration:
+                                "Appointments can't last more than 1 hour" if duration > "01:00" else None,
+                                calendar_toolkit.get_alternatives)
+        agent = BookingAgent(model, calendar_toolkit, policies_db, fast_path_router=router)
+
+        assert agent.invoke("Book 2024-10-13 at 09:00 for 1h") == "Booked at 09:00 on 2024-10-13 with success"
+        assert calendar_toolkit.is_time_slot_available("2024-10-13", "09:00") is False
+        assert agent.invoke("is 2024-10-13 at 09:00 free?") == \
+            "No, 2024-10-13 at 09:00 is not available for 01:00. Available that day: 11:00, 13:00, 15:00."
+        assert agent.invoke("Book 2024-10-13 at 11:00 for 2h") == "Appointments can't last more than 1 hour"
+        assert calendar_toolkit.is_time_slot_available("2024-10-13", "11:00") is True
+        assert len(model.calls) == 0
+        # The exchanges are in the history, the model sees them at the next turn
+        assert agent._messages[2].tool_calls[0]["name"] == "book"
+        assert agent._messages[3].content == "Booked at 09:00 on 2024-10-13 with success"
+        agent.invoke("Thanks!")
+        assert len(model.calls) == 1
+        assert "Booked at 09:00 on 2024-10-13 with success" in [message.content for message in model.calls[0]]
+        assert router.get_stats() == {"hits": 3, "misses": 1}
+
+    def test_async_fast_path_runs_the_tool_off_the_event_loop(self, calendar_toolkit, policies_db, monkeypatch):
+        threads = []
+        is_time_slot_available = calendar_toolkit._is_time_slot_available
+
+        def record_thread(date, start_time, duration):
+            threads.append(threading.current_thread())
+            return is_time_slot_available(date, start_time, duration)
+
+        monkeypatch.setattr(calendar_toolkit, "_is_time_slot_available", record_thread)
+        agent = BookingAgent(ScriptedChatModel.from_messages([]), calendar_toolkit, policies_db,
+                             fast_path_router=FastPathRouter())
+        assert asyncio.run(agent.ainvoke("is 2024-10-13 at 09:00 free?")).startswith("Yes")
+        assert threads[0] is not threading.main_thread()
+
+    def test_fast_path_falls_back_to_the_model_when_the_tool_fails(self, calendar_toolkit, policies_db,
+                                                                  monkeypatch):
+        def fail(date, start_time, duration):
+            raise ValueError(f"time data '{duration}' does not match format '%H:%M'")
+
+        monkeypatch.setattr(calendar_toolkit, "_is_time_slot_available", fail)
+        model = ScriptedChatModel.from_messages([answer_message("Let me check"), answer_message("Let me check")])
+        agent = BookingAgent(model, calendar_toolkit, policies_db, fast_path_router=FastPathRouter())
+        assert agent.invoke("is 2024-10-13 at 09:00 free?") == "Let me check"
+        assert asyncio.run(agent.ainvoke("is 2024-10-13 at 09:00 free?")) == "Let me check"
+        # No tool call is left without its output in the history
+        assert not any(getattr(message, "tool_calls", None) for message in agent._messages)
+
+    def test_policies_enforced_by_rules_are_not_prompted(self, policies_db):
+        with open("tests/test_files/calendar_test.json", "r") as f:
+            calendar_toolkit = CalendarToolkit(Calendar(**json.load(f)),
+                                               policies=BookingPolicies.from_file("data/booking_rules.json"))
+        model = ScriptedChatModel.from_messages([answer_message("Hello!")])
+        agent = BookingAgent(model, calendar_toolkit, policies_db)
+        agent.invoke("Hi")
+        prompt = model.calls[0][-1].content
+        # The 2 policies retrieved are the ones left to the model
+        assert "Clients can book a maximum of two appointments per week." in prompt
+        assert "If a requested time slot is unavailable, the system should suggest the next available slot." in prompt
+        assert "Each appointment slot is 1 hour long." not in prompt
+
+    def test_reset_follows_the_rules_of_the_new_toolkit(self, calendar_toolkit, policies_db):
+        model = ScriptedChatModel.from_messages([answer_message("Hello!"), answer_message("Hello!")])
+        agent = BookingAgent(model, calendar_toolkit, policies_db)
+        agent.invoke("Hi")
+        assert "Each appointment slot is 1 hour long." in model.calls[0][-1].content
+        with open("tests/test_files/calendar_test.json", "r") as f:
+            agent.reset_agent_and_calendar(CalendarToolkit(Calendar(**json.load(f)),
+                                                           policies=BookingPolicies.from_file("data/booking_rules.json")))
+        agent.invoke("Hi")
+        prompt = model.calls[1][-1].content
+        assert "Each appointment slot is 1 hour long." not in prompt
+        assert "Clients can book a maximum of two appointments per week." in prompt
+        assert "If a requested time slot is unavailable, the system should suggest the next available slot." in prompt
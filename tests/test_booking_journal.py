@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+
+import pytest
+
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.calendar import Calendar
+from booking_agent.calendar_toolkit import CalendarToolkit
+
+
+@pytest.fixture
+def calendar_dict():
+    with open("tests/test_files/calendar_test.json", "r") as f:
+        return json.load(f)
+
+
+class TestBookingJournal:
+
+    def test_replay_after_restart(self, tmp_path, calendar_dict):
+        journal = BookingJournal(str(tmp_path), sync_batch_size=2)
+        toolkit = CalendarToolkit(journal.load(Calendar(**calendar_dict)), journal)
+        toolkit.book("2024-10-13", "09:00", "01:00")
+        toolkit.book("2024-10-14", "10:00", "01:00")
+        journal.close()
+
+        restarted_journal = BookingJournal(str(tmp_path))
+        calendar = restarted_journal.load(Calendar(**calendar_dict))
+        toolkit = CalendarToolkit(calendar, restarted_journal)
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00") is False
+        assert toolkit.is_time_slot_available("2024-10-14", "10:00") is False
+        assert toolkit.is_time_slot_available("2024-10-14", "09:00") is True
+
+    def test_compaction(self, tmp_path, calendar_dict):
+        journal = BookingJournal(str(tmp_path), compaction_threshold=2)
+        toolkit = CalendarToolkit(journal.load(Calendar(**calendar_dict)), journal)
+        toolkit.book("2024-10-13", "09:00", "01:00")
+        toolkit.book("2024-10-14", "10:00", "01:00")
+        journal.wait_for_compaction()
+        assert (tmp_path / BookingJournal.SNAPSHOT_FILENAME).exists()
+        assert not (tmp_path / BookingJournal.JOURNAL_FILENAME).exists()
+        assert not (tmp_path / BookingJournal.ROTATED_JOURNAL_FILENAME).exists()
+        toolkit.book("2024-10-14", "09:00", "01:00")
+        journal.close()
+
+        calendar = BookingJournal(str(tmp_path)).load(Calendar(**calendar_dict))
+        booked = [(date, slot.start) for date, slots in calendar.root.items()
+                  for slot in slots if not slot.available]
+        assert ("2024-10-13", "09:00") in booked
+        assert ("2024-10-14", "10:00") in booked
+        assert ("2024-10-14", "09:00") in booked
+
+    def test_last_appends_are_synced_after_the_interval(self, tmp_path, monkeypatch):
+        synced = threading.Event()
+        monkeypatch.setattr(os, "fsync", lambda fd: synced.set())
+        journal = BookingJournal(str(tmp_path), sync_batch_size=16, sync_interval=0.05)
+        journal.append("2024-10-13", "09:00")
+        assert synced.wait(timeout=5)
+        journal.close()
+
+    def test_torn_last_line_is_ignored(self, tmp_path, calendar_dict):
+        (tmp_path / BookingJournal.JOURNAL_FILENAME).write_text(
+            '{"date": "2024-10-13", "start": "09:00"}\n{"date": "2024-10')
+        calendar = BookingJournal(str(tmp_path)).load(Calendar(**calendar_dict))
+        assert calendar.root["2024-10-13"][0].available is False
+        journal = BookingJournal(str(tmp_path))
+        journal.append("2024-10-14", "09:00")
+        journal.close()
+        calendar = BookingJournal(str(tmp_path)).load(Calendar(**calendar_dict))
+        assert calendar.root["2024-10-14"][0].available is False
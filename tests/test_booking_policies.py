@@ -0,0 +1,58 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+from booking_agent.booking_policies import BookingPolicies, MinLeadTimeRule
+from booking_agent.calendar import Calendar
+from booking_agent.calendar_toolkit import CalendarToolkit
+
+WEEKDAYS_POLICY = "Appointments can be scheduled between 9 AM and 4 PM on weekdays."
+
+
+@pytest.fixture
+def policies():
+    return BookingPolicies.from_file("data/booking_rules.json")
+
+
+class TestBookingPolicies:
+
+    def test_check(self, policies):
+        # 2024-10-14 is a Monday
+        assert policies.check("2024-10-14", "09:00", "01:00") is None
+        assert policies.check("2024-10-14", "15:30", "01:00") == \
+            f"This booking is not allowed by the booking policies: {WEEKDAYS_POLICY}"
+        assert policies.check("2024-10-13", "09:00", "01:00") == \
+            f"This booking is not allowed by the booking policies: {WEEKDAYS_POLICY}"
+        assert policies.get_broken_rule("2024-10-14", "09:00", "02:00").source == \
+            "Each appointment slot is 1 hour long."
+        # The calendar reports what can't be parsed
+        assert policies.check("tomorrow", "09:00", "01:00") is None
+
+    def test_covers(self, policies):
+        assert policies.covers(WEEKDAYS_POLICY + "\n")
+        # Policies indexed without their full stop are still recognized
+        assert policies.covers(WEEKDAYS_POLICY.rstrip(".").upper())
+        assert not policies.covers("Clients can book a maximum of two appointments per week.")
+
+    def test_lead_time(self):
+        policies = BookingPolicies([MinLeadTimeRule(hours=24, source="Book a day in advance.")],
+                                   clock=lambda: datetime(2024, 10, 14, 10, 30))
+        assert policies.check("2024-10-15", "10:00", "01:00") is not None
+        assert policies.check("2024-10-15", "11:00", "01:00") is None
+        assert policies.clip(date(2024, 10, 15), 540, 720) == (630, 720)
+        assert policies.get_time_key() == int(datetime(2024, 10, 14, 10, 30).timestamp() // 60)
+
+    def test_toolkit_enforces_policies(self, policies):
+        with open("tests/test_files/calendar_test.json", "r") as f:
+            toolkit = CalendarToolkit(Calendar(**json.load(f)), policies=policies)
+        # 2024-10-13 is a Sunday
+        assert toolkit.book("2024-10-13", "09:00", "01:00").startswith("This booking is not allowed")
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00") is not True
+        assert toolkit.get_available_slots("2024-10-13", "01:00") == "No available slots for 01:00"
+        assert toolkit.get_available_slots("2024-10-14", "02:00") == \
+            "No slot can be booked for 02:00, the booking policies say: Each appointment slot is 1 hour long."
+        assert toolkit.get_free_windows("2024-10-13") == []
+        assert "On date 2024-10-13" not in toolkit.get_available_slots_range("2024-10-13", "2024-10-15", "01:00")
+        assert "breaks the booking policy" in toolkit.book_recurring("2024-10-13", "11:00", "01:00", 1, 2)
+        assert toolkit.is_time_slot_available("2024-10-14", "11:00") is True
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from booking_agent.calendar import Calendar
+from booking_agent.calendar_overlay import CalendarOverlay
+from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.exceptions import CalendarNotForkedError
+from booking_agent.lazy_calendar import LazyCalendar
+
+
+@pytest.fixture
+def toolkit():
+    with open("tests/test_files/calendar_test.json", "r") as f:
+        return CalendarToolkit(Calendar(**json.load(f)))
+
+
+class TestCalendarOverlay:
+
+    def test_overlay_only_copies_accessed_dates(self):
+        base = LazyCalendar.from_file("tests/test_files/calendar_test.json")
+        overlay = CalendarOverlay(base)
+        assert list(overlay.root) == list(base.root)
+        overlay.root["2024-10-14"][0].available = False
+        assert overlay.root.get_copied_dates() == ["2024-10-14"]
+        assert base.root.get_loaded_dates() == ["2024-10-14"]
+        assert base.root["2024-10-14"][0].available is True
+        assert overlay.get_changes() == [("2024-10-14", overlay.root["2024-10-14"][0])]
+        assert overlay.model_dump()["2024-10-14"][0]["available"] is False
+
+    def test_fork_discard(self, toolkit):
+        fork = toolkit.fork()
+        assert "with success" in fork.book("2024-10-14", "09:00", "01:00")
+        assert fork.is_time_slot_available("2024-10-14", "09:00") is False
+        assert toolkit.is_time_slot_available("2024-10-14", "09:00") is True
+        fork.discard()
+        assert fork.is_time_slot_available("2024-10-14", "09:00") is True
+
+    def test_fork_commit(self, toolkit):
+        fork = toolkit.fork()
+        fork.book("2024-10-14", "09:00", "01:00")
+        fork.book("2024-10-15", "11:00", "01:00")
+        # Booked in the parent after the fork copied the date
+        toolkit.book("2024-10-15", "11:00", "01:00")
+        failures = fork.commit()
+        assert len(failures) == 1
+        assert "already booked" in failures[0]
+        assert toolkit.is_time_slot_available("2024-10-14", "09:00") is False
+        assert fork.is_time_slot_available("2024-10-14", "09:00") is False
+        assert fork._calendar.get_changes() == []
+
+    def test_commit_needs_a_fork(self, toolkit):
+        with pytest.raises(CalendarNotForkedError):
+            toolkit.commit()
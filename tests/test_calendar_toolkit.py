@@ -0,0 +1,146 @@
+import json
+from collections import deque
+
+import pytest
+
+from booking_agent.calendar import Calendar, SlotRequest
+from booking_agent.calendar_toolkit import CalendarToolkit
+
+
+@pytest.fixture
+def toolkit():
+    with open("tests/test_files/calendar_test.json", "r") as f:
+        json_calendar = json.load(f)
+    return CalendarToolkit(Calendar(**json_calendar))
+
+
+class TestCalendarToolkit:
+
+    def test_is_time_slot_available(self, toolkit):
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00", "01:00") is True
+        assert toolkit.is_time_slot_available("2024-10-13", "10:00", "01:00") is False
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00", "02:00") is False
+
+    def test_unknown_date_and_slot(self, toolkit):
+        assert "doesn't provide information about this specific date" in \
+            toolkit.is_time_slot_available("2024-01-01", "09:00")
+        assert "doesn't provide information about the slot" in \
+            toolkit.is_time_slot_available("2024-10-13", "09:30")
+        assert "doesn't provide information about the slot" in \
+            toolkit.book("2024-10-13", "not a time", "01:00")
+
+    def test_book_updates_calendar_in_place(self, toolkit):
+        assert toolkit.book("2024-10-13", "09:00", "01:00") == "Booked at 09:00 on 2024-10-13 with success"
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00") is False
+        assert toolkit.get_calendar_json()["2024-10-13"][0]["available"] is False
+        assert "not available" in toolkit.book("2024-10-13", "09:00", "01:00")
+
+    def test_find_slot_on_unsorted_day(self):
+        calendar = Calendar(**{"2024-10-13": [
+            {"start": "15:00", "end": "16:00", "available": True},
+            {"start": "09:00", "end": "10:00", "available": True},
+            {"start": "11:30", "end": "11:45", "available": False},
+        ]})
+        toolkit = CalendarToolkit(calendar)
+        assert toolkit._find_slot("2024-10-13", "11:30").end == "11:45"
+        assert toolkit._find_slot("2024-10-13", "9:00").start == "09:00"
+
+    def test_get_available_slots_range(self, toolkit):
+        result = toolkit.get_available_slots_range("2024-10-13", "2024-10-14", "02:00")
+        assert "On date 2024-10-13: 13:00 up to 14:00" not in result
+        assert ("On date 2024-10-14: 09:00 up to 12:00 [09:00 up to 10:00, 10:00 up to 11:00, 11:00 up to 12:00], "
+                "14:00 up to 16:00 [14:00 up to 15:00, 15:00 up to 16:00]") in result
+        # The slots of a window are booked together
+        assert "with success" in toolkit.book_batch([
+            {"date": "2024-10-14", "start_time": "10:00", "duration": "01:00"},
+            {"date": "2024-10-14", "start_time": "11:00", "duration": "01:00"}])
+        result = toolkit.get_available_slots_range("2024-10-13", "2024-10-14", "02:00")
+        assert "On date 2024-10-14: 14:00 up to 16:00 [14:00 up to 15:00, 15:00 up to 16:00]" in result
+        assert "09:00" not in result
+        assert "No available slots" in toolkit.get_available_slots_range("2024-10-13", "2024-10-15", "05:00")
+        assert "doesn't provide information" in toolkit.get_available_slots_range("2025-01-01", "2025-01-07", "01:00")
+
+    def test_get_available_slots_single(self, toolkit):
+        assert toolkit.get_available_slots("2024-10-13", "01:00") == \
+            "On date 2024-10-13, available slots are 09:00 up to 10:00, 11:00 up to 12:00, 13:00 up to 14:00, 15:00 up to 16:00"
+
+    def test_get_available_slots_combinations(self):
+        calendar = Calendar(**{"2024-10-13": [
+            {"start": "09:00", "end": "10:00", "available": True},
+            {"start": "10:00", "end": "10:30", "available": True},
+            {"start": "10:30", "end": "11:00", "available": False},
+            {"start": "13:00", "end": "13:30", "available": True},
+            {"start": "13:30", "end": "14:00", "available": True},
+            {"start": "14:00", "end": "15:00", "available": True},
+        ]})
+        toolkit = CalendarToolkit(calendar)
+        result = toolkit.get_available_slots("2024-10-13", "01:30")
+        assert "Combination 0 (09:00 up to 10:30): 09:00 up to 10:00, 10:00 up to 10:30" in result
+        assert "Combination 1 (13:30 up to 15:00): 13:30 up to 14:00, 14:00 up to 15:00" in result
+        assert "Combination 2" not in result
+        assert toolkit.get_available_slots("2024-10-13", "03:00") == "No available slots for 03:00"
+
+    def test_change_feed(self, toolkit, monkeypatch):
+        version = toolkit.get_version()
+        assert toolkit.get_changes_since(version) == []
+        toolkit.book("2024-10-14", "09:00", "01:00")
+        toolkit.book("2024-10-13", "09:00", "01:00")
+        toolkit.book("2024-10-14", "10:00", "01:00")
+        # A booking that fails changes nothing
+        toolkit.book("2024-10-14", "10:00", "01:00")
+        assert toolkit.get_version() == version + 3
+        assert toolkit.get_changes_since(version) == ["2024-10-14", "2024-10-13"]
+        assert toolkit.get_changes_since(version + 2) == ["2024-10-14"]
+
+        monkeypatch.setattr(toolkit, "_changes", deque(toolkit._changes, maxlen=1))
+        toolkit.book("2024-10-14", "11:00", "01:00")
+        assert toolkit.get_changes_since(version + 3) == ["2024-10-14"]
+        # The feed doesn't go back this far anymore
+        assert toolkit.get_changes_since(version + 2) is None
+
+    def test_book_batch(self, toolkit):
+        result = toolkit.book_batch([SlotRequest(date="2024-10-13", start_time="09:00", duration="01:00"),
+                                     SlotRequest(date="2024-10-14", start_time="09:00", duration="01:00")])
+        assert result.startswith("Booked 2 slots with success")
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00", "01:00") is False
+        assert toolkit.is_time_slot_available("2024-10-14", "09:00", "01:00") is False
+
+    def test_book_batch_is_all_or_nothing(self, toolkit):
+        version = toolkit.get_version()
+        result = toolkit.book_batch([SlotRequest(date="2024-10-13", start_time="09:00", duration="01:00"),
+                                     SlotRequest(date="2024-10-13", start_time="10:00", duration="01:00"),
+                                     SlotRequest(date="2024-10-13", start_time="09:00", duration="01:00"),
+                                     SlotRequest(date="2024-10-20", start_time="09:00", duration="01:00")])
+        assert result.startswith("Nothing was booked since 3 of the 4 slots can't be booked")
+        # The alternatives are the closest available slots
+        assert "- On 2024-10-13 at 10:00: already booked. Available that day: 09:00, 11:00, 13:00." in result
+        assert "- On 2024-10-13 at 09:00: asked twice." in result
+        assert "- On 2024-10-20 at 09:00: the calendar doesn't provide information about this date." in result
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00", "01:00") is True
+        assert toolkit.get_version() == version
+
+    def test_book_recurring(self, toolkit):
+        result = toolkit.book_recurring("2024-10-13", "11:00", "01:00", interval_days=1, occurrences=3)
+        assert result.startswith("Booked 3 slots with success")
+        for date in ["2024-10-13", "2024-10-14", "2024-10-15"]:
+            assert toolkit.is_time_slot_available(date, "11:00", "01:00") is False
+
+        result = toolkit.book_recurring("2024-10-13", "13:00", "01:00", interval_days=1, occurrences=2)
+        assert result.startswith("Nothing was booked since 1 of the 2 slots can't be booked")
+        assert toolkit.is_time_slot_available("2024-10-13", "13:00", "01:00") is True
+
+    def test_read_results_are_cached_until_a_booking(self, toolkit):
+        first_answer = toolkit.get_available_slots("2024-10-13", "01:00")
+        assert toolkit.get_available_slots("2024-10-13", "01:00") == first_answer
+        toolkit.get_available_slots_range("2024-10-13", "2024-10-15", "01:00")
+        toolkit.get_available_slots_range("2024-10-13", "2024-10-15", "01:00")
+        assert toolkit.get_cache_stats() == {"hits": 2, "misses": 2}
+
+        # A booking on another date leaves the answer of the date cached
+        toolkit.book("2024-10-14", "09:00", "01:00")
+        assert toolkit.get_available_slots("2024-10-13", "01:00") == first_answer
+        assert "On date 2024-10-14: 10:00 up to 12:00" in \
+            toolkit.get_available_slots_range("2024-10-13", "2024-10-15", "01:00")
+        toolkit.book("2024-10-13", "09:00", "01:00")
+        assert "09:00" not in toolkit.get_available_slots("2024-10-13", "01:00")
+        assert toolkit.is_time_slot_available("2024-10-13", "09:00") is False
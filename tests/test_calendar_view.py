@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from booking_agent.calendar import Calendar
+from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.calendar_view import CalendarView
+
+
+@pytest.fixture
+def toolkit():
+    with open("tests/test_files/calendar_test.json", "r") as f:
+        return CalendarToolkit(Calendar(**json.load(f)))
+
+
+class TestCalendarView:
+
+    def test_render_window(self, toolkit):
+        view = CalendarView(toolkit, window_size=2)
+        html = view.render(1)
+        assert "2024-10-13" not in html
+        assert "2024-10-14" in html and "2024-10-15" in html
+        assert view.clamp_offset(5) == 1
+        assert view.clamp_offset(-2) == 0
+
+    def test_only_changed_dates_rendered_again(self, toolkit, monkeypatch):
+        view = CalendarView(toolkit, window_size=3)
+        view.render(0)
+        key = view.refresh()
+        assert view.refresh() == key
+
+        rendered_dates = []
+        get_calendar_json = toolkit.get_calendar_json
+
+        def spy_get_calendar_json(dates=None):
+            rendered_dates.extend(dates)
+            return get_calendar_json(dates)
+
+        monkeypatch.setattr(toolkit, "get_calendar_json", spy_get_calendar_json)
+        toolkit.book("2024-10-14", "09:00", "01:00")
+        assert view.refresh() != key
+        html = view.render(0)
+        assert rendered_dates == ["2024-10-14"]
+        assert "<div class='slot' style='color: red;'>09:00 - 10:00</div>" in html.split("2024-10-14")[1]
+
+    def test_set_toolkit(self, toolkit):
+        view = CalendarView(toolkit)
+        key = view.refresh()
+        fork = toolkit.fork()
+        fork.book("2024-10-14", "09:00", "01:00")
+        view.set_toolkit(fork)
+        assert view.refresh() != key
+        assert "color: red;'>09:00 - 10:00" in view.render(0).split("2024-10-14")[1]
@@ -0,0 +1,68 @@
+import random
+import sys
+import threading
+from collections import Counter
+
+import pytest
+
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.calendar import Calendar, format_minutes
+from booking_agent.calendar_toolkit import CalendarToolkit
+
+
+@pytest.fixture
+def fast_thread_switching():
+    # Switching threads as often as possible makes interleavings between the
+    # availability check and the booking much more likely
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(switch_interval)
+
+
+def make_calendar(days: int = 5, slot_minutes: int = 15) -> Calendar:
+    return Calendar(**{
+        f"2024-10-{13 + day}": [
+            {"start": format_minutes(start), "end": format_minutes(start + slot_minutes), "available": True}
+            for start in range(9 * 60, 17 * 60, slot_minutes)
+        ]
+        for day in range(days)
+    })
+
+
+class TestConcurrentBooking:
+
+    def test_no_double_booking(self, tmp_path, fast_thread_switching):
+        journal = BookingJournal(str(tmp_path), compaction_threshold=50)
+        toolkit = CalendarToolkit(make_calendar(), journal)
+        requests = [(date, slot["start"]) for date, slots in toolkit.get_calendar_json().items()
+                    for slot in slots]
+        successes = Counter()
+        successes_lock = threading.Lock()
+        barrier = threading.Barrier(16)
+
+        def book_everything(seed: int):
+            shuffled_requests = list(requests)
+            random.Random(seed).shuffle(shuffled_requests)
+            barrier.wait()
+            for date, start in shuffled_requests:
+                result = toolkit.book(date, start, "00:15")
+                if "with success" in result:
+                    with successes_lock:
+                        successes[(date, start)] += 1
+                else:
+                    assert "already booked" in result
+
+        threads = [threading.Thread(target=book_everything, args=(seed,)) for seed in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        journal.close()
+
+        assert set(successes) == set(requests)
+        assert max(successes.values()) == 1
+        assert "No available slots" in toolkit.get_available_slots_range("2024-10-13", "2024-10-17", "00:15")
+        # Every booking survived the concurrent compactions
+        calendar = BookingJournal(str(tmp_path)).load(make_calendar())
+        assert all(not slot.available for slots in calendar.root.values() for slot in slots)
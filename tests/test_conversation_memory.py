@@ -0,0 +1,54 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from booking_agent.booking_agent import booking_fact_extractors
+from booking_agent.conversation_memory import ConversationMemory
+
+
+def make_turn(number: int, tool_name: str, tool_args: dict, tool_output: str):
+    return [
+        HumanMessage(content=f"Question {number} " + "blah " * 40),
+        AIMessage(content="", tool_calls=[{"name": tool_name, "args": tool_args, "id": f"call_{number}"}]),
+        ToolMessage(content=tool_output, tool_call_id=f"call_{number}", name=tool_name),
+        AIMessage(content=f"Answer {number}"),
+    ]
+
+
+def make_history(turns: int):
+    messages = [SystemMessage(content="You are a booking assistant")]
+    messages += make_turn(0, "get_today_date", {}, "Wednesday 2024-10-16")
+    messages += make_turn(1, "book", {"date": "2024-10-17", "start_time": "09:00", "duration": "01:00"},
+                          "Booked at 09:00 on 2024-10-17 with success")
+    for number in range(2, turns):
+        messages += make_turn(number, "get_available_slots", {"date": "2024-10-18", "duration": "01:00"},
+                              "On date 2024-10-18, available slots are 09:00 up to 10:00")
+    messages.append(HumanMessage(content="What did I book?"))
+    return messages
+
+
+class TestConversationMemory:
+
+    def test_old_turns_are_collapsed(self):
+        memory = ConversationMemory(max_tokens=100000, keep_recent_turns=2)
+        messages = memory.compact(make_history(6))
+        # 4 collapsed turns, 2 full ones and the ongoing one
+        assert len(messages) == 1 + 4 * 2 + 2 * 4 + 1
+        assert isinstance(messages[0], SystemMessage)
+        assert isinstance(messages[-1], HumanMessage)
+
+    def test_budget_keeps_facts(self):
+        memory = ConversationMemory(max_tokens=150, keep_recent_turns=1,
+                                    fact_extractors=booking_fact_extractors)
+        messages = memory.compact(make_history(10))
+        # Turns with the tool calls were dropped, their facts are pinned
+        assert not any(isinstance(message, ToolMessage) and message.name in ("book", "get_today_date")
+                       for message in messages)
+        assert messages[-1].content == "What did I book?"
+        context = memory.get_context(messages)
+        assert context[0].content == "You are a booking assistant"
+        assert "Today is Wednesday 2024-10-16" in context[1].content
+        assert "Booked on 2024-10-17 at 09:00 for 01:00" in context[1].content
+
+    def test_ongoing_turn_is_never_dropped(self):
+        memory = ConversationMemory(max_tokens=1)
+        messages = memory.compact(make_history(3))
+        assert messages == [messages[0], HumanMessage(content="What did I book?")]
@@ -0,0 +1,39 @@
+import pytest
+
+from booking_agent.fast_path import FastPathRouter, format_duration
+
+
+class TestFastPathRouter:
+
+    def test_format_duration(self):
+        assert format_duration("1h") == "01:00"
+        assert format_duration("1h30") == "01:30"
+        assert format_duration("2 hours") == "02:00"
+        assert format_duration("90min") == "01:30"
+        assert format_duration("1:30") == "01:30"
+        for duration in ["24h", "25h", "1500min", "1h 75min", "1:60"]:
+            with pytest.raises(ValueError):
+                format_duration(duration)
+
+    def test_route(self):
+        router = FastPathRouter()
+        request = router.route("What's free on 2024-10-17?")
+        assert request.tool == "get_available_slots"
+        assert request.args == {"date": "2024-10-17", "duration": "00:00"}
+        request = router.route("is 2024-10-17 at 9:00 available for 30min")
+        assert request.tool == "is_time_slot_available"
+        assert request.args == {"date": "2024-10-17", "start_time": "9:00", "duration": "00:30"}
+        # Ambiguous messages are left to the model
+        assert router.route("What's free tomorrow?") is None
+        assert router.route("Book 2024-10-16 at 09:00 for 1h and 2024-10-17 at 10:00 for 1h") is None
+        assert router.route("is 2024-10-17 at 9:00 free for 24h") is None
+        assert router.route("what's free on 2024-10-17 for 1h 75min") is None
+        assert router.get_stats() == {"hits": 2, "misses": 4}
+        assert router.get_hit_rate() == 2 / 6
+
+    def test_bookings_need_a_policy_checker(self):
+        assert FastPathRouter().route("Book 2024-10-16 at 09:00 for 1h") is None
+        router = FastPathRouter(lambda date, start_time, duration: None)
+        request = router.route("Please book 2024-10-16 at 09:00 for 1h.")
+        assert request.tool == "book"
+        assert request.args == {"date": "2024-10-16", "start_time": "09:00", "duration": "01:00"}
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+
+from benchmarks.bench_import_time import get_forbidden_imports, measure_import
+
+
+class TestImports:
+
+    def test_calendar_toolkit_imports_no_heavy_module(self):
+        assert get_forbidden_imports(measure_import("booking_agent.calendar_toolkit")) == []
+
+    def test_booking_agent_imports_no_gradio(self):
+        code = "import sys, booking_agent.booking_agent; print(' '.join(sys.modules))"
+        modules = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                 check=True).stdout.split()
+        assert "gradio" not in modules
+        assert "langchain" not in modules
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from benchmarks.synthetic import generate_calendar_dict
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.calendar import Calendar
+from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.lazy_calendar import LazyCalendar
+
+
+class TestLazyCalendar:
+
+    def test_same_content_as_calendar(self):
+        with open("tests/test_files/calendar_test.json", "r") as f:
+            calendar = Calendar(**json.load(f))
+        lazy_calendar = LazyCalendar.from_file("tests/test_files/calendar_test.json")
+        assert list(lazy_calendar.root) == list(calendar.root)
+        assert lazy_calendar.model_dump() == calendar.model_dump()
+        assert lazy_calendar.root["2024-10-14"] == calendar.root["2024-10-14"]
+
+    def test_dates_validated_on_access(self, tmp_path):
+        calendar_dict = generate_calendar_dict(days=3, slot_minutes=60)
+        calendar_dict["2024-10-15"][0]["available"] = "maybe"
+        calendar_path = tmp_path / "calendar.json"
+        calendar_path.write_text(json.dumps(calendar_dict, indent=2))
+
+        lazy_calendar = LazyCalendar.from_file(str(calendar_path))
+        assert len(lazy_calendar.root) == 3
+        assert "2024-10-15" in lazy_calendar.root
+        assert lazy_calendar.root.get_loaded_dates() == []
+        assert len(lazy_calendar.root["2024-10-14"]) == len(calendar_dict["2024-10-14"])
+        assert lazy_calendar.root.get_loaded_dates() == ["2024-10-14"]
+        with pytest.raises(ValidationError):
+            lazy_calendar.root["2024-10-15"]
+
+    def test_toolkit_and_journal(self, tmp_path):
+        calendar_path = tmp_path / "calendar.json"
+        calendar_path.write_text(json.dumps(generate_calendar_dict(days=30, occupancy=0.0)))
+        journal = BookingJournal(str(tmp_path / "journal"))
+        toolkit = CalendarToolkit(journal.load(LazyCalendar.from_file(str(calendar_path))), journal)
+        assert "with success" in toolkit.book("2024-10-20", "09:00", "01:00")
+        journal.close()
+
+        calendar = BookingJournal(str(tmp_path / "journal")).load(LazyCalendar.from_file(str(calendar_path)))
+        # Only the date of the journaled booking was validated
+        assert calendar.root.get_loaded_dates() == ["2024-10-20"]
+        assert CalendarToolkit(calendar).is_time_slot_available("2024-10-20", "09:00") is False
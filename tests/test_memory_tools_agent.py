@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import StructuredTool
+
+from benchmarks.fake_models import ScriptedChatModel, answer_message, tool_call_message
+from booking_agent.memory_tools_agent import MemoryToolsAgent
+
+
+def slow_square(x: int) -> int:
+    """
+    Squares x, slowly
+
+    :param x: The number to square
+    """
+    time.sleep(0.2)
+    return x * x
+
+
+class TestMemoryToolsAgent:
+
+    def test_invoke_keeps_tool_messages(self):
+        model = ScriptedChatModel.from_messages([
+            tool_call_message({"name": "slow_square", "args": {"x": 3}}),
+            answer_message("It is 9"),
+        ])
+        agent = MemoryToolsAgent(model, [StructuredTool.from_function(slow_square)])
+        assert agent.invoke("What is 3 squared?") == "It is 9"
+        tool_messages = [message for message in agent._messages if isinstance(message, ToolMessage)]
+        assert [message.content for message in tool_messages] == ["9"]
+
+    def test_ainvoke_runs_tool_calls_concurrently(self):
+        model = ScriptedChatModel.from_messages([
+            tool_call_message({"name": "slow_square", "args": {"x": 2}},
+                              {"name": "slow_square", "args": {"x": 3}},
+                              {"name": "slow_square", "args": {"x": 4}}),
+            answer_message("They are 4, 9 and 16"),
+        ])
+        agent = MemoryToolsAgent(model, [StructuredTool.from_function(slow_square)])
+        start = time.perf_counter()
+        assert asyncio.run(agent.ainvoke("Square 2, 3 and 4")) == "They are 4, 9 and 16"
+        assert time.perf_counter() - start < 0.5
+        tool_messages = [message for message in agent._messages if isinstance(message, ToolMessage)]
+        assert [message.content for message in tool_messages] == ["4", "9", "16"]
+        assert [message.tool_call_id for message in tool_messages] == ["call_0", "call_1", "call_2"]
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import json
+from typing import List
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+
+from benchmarks.fake_models import ScriptedChatModel, answer_message, tool_call_message
+from booking_agent.memory_tools_agent import MemoryToolsAgent
+from booking_agent.metrics import (NOOP_SPAN, JsonLinesLogger, MetricsSink, NoopMetricsSink,
+                                   PrometheusTextExporter, Span)
+
+
+class RecordingSink(MetricsSink):
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def record(self, span: Span):
+        self.spans.append(span)
+
+
+def square(x: int) -> int:
+    """
+    Squares x
+
+    :param x: The number to square
+    """
+    return x * x
+
+
+def with_usage(message: AIMessage, input_tokens: int, output_tokens: int) -> AIMessage:
+    message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                              "total_tokens": input_tokens + output_tokens}
+    return message
+
+
+class TestMetrics:
+
+    def test_noop_sink_shares_a_span(self):
+        sink = NoopMetricsSink()
+        with sink.span("turn", turn="0-0") as span:
+            span.set_attributes(prompt_tokens=3)
+        assert span is NOOP_SPAN
+        assert sink.span("llm_call") is NOOP_SPAN
+
+    def test_sinks_must_record(self):
+        class IncompleteSink(MetricsSink):
+            pass
+
+        with pytest.raises(TypeError):
+            IncompleteSink()
+
+    def test_agent_spans(self):
+        model = ScriptedChatModel.from_messages([
+            with_usage(tool_call_message({"name": "square", "args": {"x": 3}}), 50, 10),
+            with_usage(answer_message("It is 9"), 70, 4),
+        ])
+        sink = RecordingSink()
+        agent = MemoryToolsAgent(model, [StructuredTool.from_function(square)], metrics_sink=sink)
+        assert asyncio.run(agent.ainvoke("What is 3 squared?")) == "It is 9"
+
+        assert [span.name for span in sink.spans] == ["llm_call", "tool_call", "llm_call", "turn"]
+        assert len({span.attributes["turn"] for span in sink.spans}) == 1
+        first_call, tool_call, second_call, _ = sink.spans
+        assert first_call.attributes["history_length"] == 2
+        assert (first_call.attributes["prompt_tokens"], first_call.attributes["completion_tokens"]) == (50, 10)
+        assert second_call.attributes["history_length"] == 4
+        assert tool_call.attributes["tool"] == "square"
+
+    def test_prometheus_export(self):
+        exporter = PrometheusTextExporter(buckets=(0.1, 1.0))
+        exporter.record(Span(name="llm_call", start=0, duration=0.5,
+                             attributes={"prompt_tokens": 50, "completion_tokens": 10}))
+        exporter.record(Span(name="tool_call", start=0, duration=0.05, attributes={"tool": "book"}))
+        exported = exporter.export()
+        assert 'booking_agent_span_duration_seconds_bucket{span="llm_call",le="0.1"} 0' in exported
+        assert 'booking_agent_span_duration_seconds_bucket{span="llm_call",le="1.0"} 1' in exported
+        assert 'booking_agent_span_duration_seconds_count{span="tool_call",tool="book"} 1' in exported
+        assert 'booking_agent_llm_tokens_total{kind="prompt"} 50' in exported
+
+    def test_json_lines_logger(self):
+        file = io.StringIO()
+        sink = JsonLinesLogger(file=file)
+        with sink.span("retrieval", turn="0-0"):
+            pass
+        line = json.loads(file.getvalue())
+        assert line["name"] == "retrieval"
+        assert line["attributes"] == {"turn": "0-0"}
@@ -0,0 +1,85 @@
+import pytest
+
+from benchmarks.synthetic import generate_calendar
+from booking_agent.calendar import Calendar
+from booking_agent.calendar_toolkit import CalendarToolkit
+from booking_agent.multi_calendar_toolkit import MultiCalendarToolkit
+
+
+def make_toolkit(calendar_dict) -> CalendarToolkit:
+    return CalendarToolkit(Calendar(**{date: [{"start": start, "end": end, "available": available}
+                                               for start, end, available in slots]
+                                        for date, slots in calendar_dict.items()}))
+
+
+@pytest.fixture
+def multi_toolkit():
+    return MultiCalendarToolkit({
+        "alice": make_toolkit({
+            "2024-10-14": [("09:00", "10:00", False), ("10:00", "11:00", True), ("11:00", "12:00", True)],
+            "2024-10-15": [("09:00", "12:00", True)],
+        }),
+        "bob": make_toolkit({
+            "2024-10-14": [("09:00", "10:00", True), ("10:00", "10:30", False), ("10:30", "12:00", True)],
+            "2024-10-15": [("08:00", "09:30", True)],
+        }),
+        "room": make_toolkit({
+            "2024-10-14": [("09:00", "12:00", False)],
+            "2024-10-15": [("09:00", "10:00", True), ("10:00", "11:00", True)],
+        }),
+    })
+
+
+class TestMultiCalendarToolkit:
+
+    def test_any(self, multi_toolkit):
+        assert multi_toolkit.find_earliest_slot("01:00") == \
+            "The earliest window of 01:00 is with bob on 2024-10-14 from 09:00 up to 10:00."
+        # Contiguous available slots are merged in a window
+        assert multi_toolkit.find_earliest_slot("02:00", ["alice", "bob"]) == \
+            "The earliest window of 02:00 is with alice on 2024-10-14 from 10:00 up to 12:00."
+        assert multi_toolkit.find_earliest_slot("01:00", ["bob"], from_date="2024-10-14", from_time="10:00") == \
+            "The earliest window of 01:00 is with bob on 2024-10-14 from 10:30 up to 12:00."
+        assert "There's no window" in multi_toolkit.find_earliest_slot("04:00")
+
+    def test_all(self, multi_toolkit):
+        assert multi_toolkit.find_earliest_slot("01:00", ["alice", "bob"], mode="all") == \
+            "The earliest window of 01:00 where all of alice, bob are free is on 2024-10-14 from 10:30 up to 12:00."
+        assert multi_toolkit.find_earliest_slot("00:30", mode="all") == \
+            "The earliest window of 00:30 where all of alice, bob, room are free is on 2024-10-15 from 09:00 up to 09:30."
+        assert "There's no window" in multi_toolkit.find_earliest_slot("01:00", mode="all")
+
+    def test_errors(self, multi_toolkit):
+        assert multi_toolkit.find_earliest_slot("01:00", ["carol"]).startswith("Unknown resources: carol.")
+        assert multi_toolkit.find_earliest_slot("1 hour") == \
+            "Dates must be in format YYYY-m-d, the duration and times in format HH:mm."
+
+    def test_book_found_windows(self, multi_toolkit):
+        # A window merging two slots
+        assert multi_toolkit.book_resource("alice", "2024-10-14", "10:00", "02:00") == \
+            "Booked 2 slots with success: 2024-10-14 at 10:00, 2024-10-14 at 11:00"
+        # A common window starting in the middle of a slot of alice
+        assert multi_toolkit.find_earliest_slot("00:30", ["alice", "bob"], mode="all") == \
+            "The earliest window of 00:30 where all of alice, bob are free is on 2024-10-15 from 09:00 up to 09:30."
+        assert "with success" in multi_toolkit.book_resource("bob", "2024-10-15", "08:30", "01:00")
+        assert multi_toolkit.get_toolkit("bob").get_free_windows("2024-10-15") == []
+        assert "Nothing was booked" in multi_toolkit.book_resource("bob", "2024-10-14", "09:00", "02:00")
+        assert "no contiguous slots" in multi_toolkit.book_resource("room", "2024-10-15", "10:00", "02:00")
+
+    def test_book_updates_the_search(self, multi_toolkit):
+        assert "with success" in multi_toolkit.book_resource("bob", "2024-10-14", "09:00", "01:00")
+        assert multi_toolkit.find_earliest_slot("01:00") == \
+            "The earliest window of 01:00 is with alice on 2024-10-14 from 10:00 up to 12:00."
+
+    def test_many_calendars(self):
+        toolkits = {f"resource_{number}": CalendarToolkit(generate_calendar(days=7, slot_minutes=30,
+                                                                            occupancy=0.9, seed=number))
+                    for number in range(100)}
+        multi_toolkit = MultiCalendarToolkit(toolkits)
+        answer = multi_toolkit.find_earliest_slot("01:30")
+        # Checked against a search of every calendar one by one
+        earliest = min((date, start, resource)
+                       for resource, toolkit in toolkits.items()
+                       for date in toolkit.get_dates()
+                       for start, end in toolkit.get_free_windows(date) if end - start >= 90)
+        assert f"with {earliest[2]} on {earliest[0]} from" in answer
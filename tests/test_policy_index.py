@@ -0,0 +1,80 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from booking_agent.policy_index import build_policy_index, load_policy_index
+from booking_agent.policy_retrieval import HashingEmbeddings
+
+
+class CountingEmbeddings(HashingEmbeddings):
+
+    def __init__(self):
+        super().__init__()
+        self.embedded_texts = []
+
+    def embed_documents(self, texts):
+        self.embedded_texts += texts
+        return super().embed_documents(texts)
+
+
+def load_index(index_dir, embeddings: Embeddings):
+    vec_db = FAISS.load_local(str(index_dir), embeddings=embeddings, allow_dangerous_deserialization=True)
+    return sorted(document.page_content for document in vec_db.docstore._dict.values())
+
+
+class TestPolicyIndex:
+
+    def test_incremental_build(self, tmp_path):
+        policy_file = tmp_path / "policies.txt"
+        index_dir = tmp_path / "index"
+        policy_file.write_text("First policy.\nSecond policy.\n\nThird policy.")
+        embeddings = CountingEmbeddings()
+
+        stats = build_policy_index(str(policy_file), str(index_dir), embeddings, batch_size=2)
+        assert stats == {"added": 3, "removed": 0, "kept": 0}
+        # The last character of each policy is kept
+        assert load_index(index_dir, embeddings) == ["First policy.", "Second policy.", "Third policy."]
+
+        embeddings.embedded_texts = []
+        assert build_policy_index(str(policy_file), str(index_dir), embeddings) == \
+            {"added": 0, "removed": 0, "kept": 3}
+        assert embeddings.embedded_texts == []
+
+        policy_file.write_text("First policy.\nSecond policy, changed.\nThird policy.\n")
+        stats = build_policy_index(str(policy_file), str(index_dir), embeddings)
+        assert stats == {"added": 1, "removed": 1, "kept": 2}
+        assert embeddings.embedded_texts == ["Second policy, changed."]
+        assert load_index(index_dir, embeddings) == ["First policy.", "Second policy, changed.", "Third policy."]
+
+    def test_every_policy_excluded(self, tmp_path):
+        policy_file = tmp_path / "policies.txt"
+        index_dir = tmp_path / "index"
+        policy_file.write_text("First policy.\nSecond policy.\n")
+        embeddings = CountingEmbeddings()
+        build_policy_index(str(policy_file), str(index_dir), embeddings)
+        stats = build_policy_index(str(policy_file), str(index_dir), embeddings,
+                                   excluded_policies=["First policy.", "Second policy."])
+        assert stats == {"added": 0, "removed": 2, "kept": 0}
+        assert load_policy_index(str(index_dir), embeddings).similarity_search("policy") == []
+        # Same on a first build
+        policy_file.write_text("")
+        assert build_policy_index(str(policy_file), str(tmp_path / "new_index"), embeddings) == \
+            {"added": 0, "removed": 0, "kept": 0}
+        assert load_policy_index(str(tmp_path / "new_index"), embeddings).similarity_search("policy") == []
+
+    def test_model_change_rebuilds(self, tmp_path):
+        policy_file = tmp_path / "policies.txt"
+        policy_file.write_text("First policy.\nSecond policy.\n")
+        build_policy_index(str(policy_file), str(tmp_path / "index"), HashingEmbeddings(size=64))
+        stats = build_policy_index(str(policy_file), str(tmp_path / "index"), HashingEmbeddings(size=128))
+        assert stats == {"added": 2, "removed": 0, "kept": 0}
+
+    def test_excluded_policies(self, tmp_path):
+        policy_file = tmp_path / "policies.txt"
+        index_dir = tmp_path / "index"
+        policy_file.write_text("First policy.\nSecond policy.\n")
+        embeddings = CountingEmbeddings()
+        build_policy_index(str(policy_file), str(index_dir), embeddings)
+        stats = build_policy_index(str(policy_file), str(index_dir), embeddings,
+                                   excluded_policies=["Second policy."])
+        assert stats == {"added": 0, "removed": 1, "kept": 1}
+        assert load_index(index_dir, embeddings) == ["First policy."]
@@ -0,0 +1,78 @@
+import asyncio
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from booking_agent.policy_retrieval import CachedEmbeddings, HashingEmbeddings, PolicyRetriever
+
+
+class CountingEmbeddings(Embeddings):
+
+    def __init__(self):
+        self.embedded_texts = []
+        self._embeddings = HashingEmbeddings()
+
+    def embed_documents(self, texts):
+        self.embedded_texts += texts
+        return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.embedded_texts.append(text)
+        return self._embeddings.embed_query(text)
+
+
+def load_policies():
+    with open("data/booking_policies.txt", "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class TestPolicyRetrieval:
+
+    def test_hashing_embeddings_retrieve_offline(self):
+        vectorstore = FAISS.from_texts(load_policies(), HashingEmbeddings())
+        results = vectorstore.similarity_search("How many appointments can I book per week?", k=1)
+        assert results[0].page_content == "Clients can book a maximum of two appointments per week."
+
+    def test_embeddings_cache(self, tmp_path):
+        counting_embeddings = CountingEmbeddings()
+        embeddings = CachedEmbeddings(counting_embeddings, cache_path=str(tmp_path / "cache.sqlite3"),
+                                      max_size=2)
+        first_vectors = embeddings.embed_documents(["a", "b", "a"])
+        assert counting_embeddings.embedded_texts == ["a", "b"]
+        assert first_vectors[0] == first_vectors[2]
+        embeddings.embed_query("c")
+        # "a" was evicted from memory but is still on disk
+        assert embeddings.embed_query("a") == first_vectors[0]
+        assert counting_embeddings.embedded_texts == ["a", "b", "c"]
+        assert embeddings.get_stats() == {"memory_hits": 0, "disk_hits": 1, "misses": 4}
+
+        restarted_embeddings = CachedEmbeddings(counting_embeddings, cache_path=str(tmp_path / "cache.sqlite3"))
+        assert asyncio.run(restarted_embeddings.aembed_query("b")) == first_vectors[1]
+        assert counting_embeddings.embedded_texts == ["a", "b", "c"]
+
+    def test_cache_is_keyed_by_model(self, tmp_path):
+        counting_embeddings = CountingEmbeddings()
+        CachedEmbeddings(counting_embeddings, cache_path=str(tmp_path / "cache.sqlite3"),
+                         model="model-1").embed_query("a")
+        CachedEmbeddings(counting_embeddings, cache_path=str(tmp_path / "cache.sqlite3"),
+                         model="model-2").embed_query("a")
+        assert counting_embeddings.embedded_texts == ["a", "a"]
+
+    def test_retrieval_cache(self):
+        counting_embeddings = CountingEmbeddings()
+        vectorstore = FAISS.from_texts(load_policies(), CachedEmbeddings(counting_embeddings))
+        retriever = PolicyRetriever(vectorstore)
+        first_results = retriever.retrieve("Book it")
+        assert retriever.retrieve("book  it ") == first_results
+        assert asyncio.run(retriever.aretrieve("BOOK IT")) == first_results
+        stats = retriever.get_stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["embeddings_misses"] == len(load_policies()) + 1
+
+    def test_excluded_policies_are_replaced(self):
+        policies = load_policies()
+        vectorstore = FAISS.from_texts(policies, HashingEmbeddings())
+        retriever = PolicyRetriever(vectorstore, excluded_policies=[policy.rstrip(".") for policy in policies[:2]])
+        results = [result.page_content for result in retriever.retrieve("Book it")]
+        assert sorted(results) == sorted(policies[2:4])
@@ -0,0 +1,28 @@
+from booking_agent.result_cache import VersionedResultCache
+
+
+class TestVersionedResultCache:
+
+    def test_results_are_only_returned_for_their_version(self):
+        cache = VersionedResultCache()
+        cache.set("key", 1, False)
+        assert cache.get("key", 1) is False
+        assert cache.get("key", 2, "missing") == "missing"
+        # The outdated result was dropped
+        assert cache.get("key", 1, "missing") == "missing"
+        assert cache.get_stats() == {"hits": 1, "misses": 2}
+
+    def test_least_recently_used_results_are_dropped(self):
+        cache = VersionedResultCache(max_size=2)
+        cache.set("a", 0, "a")
+        cache.set("b", 0, "b")
+        cache.get("a", 0)
+        cache.set("c", 0, "c")
+        assert cache.get("b", 0) is None
+        assert cache.get("a", 0) == "a"
+        assert cache.get("c", 0) == "c"
+
+    def test_disabled(self):
+        cache = VersionedResultCache(max_size=0)
+        cache.set("key", 0, "result")
+        assert cache.get("key", 0) is None
@@ -0,0 +1,46 @@
+from booking_agent.session_manager import SessionManager
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionManager:
+
+    def test_one_agent_per_session(self):
+        sessions = SessionManager(object)
+        first_agent = sessions.get("a")
+        assert sessions.get("a") is first_agent
+        assert sessions.get("b") is not first_agent
+        sessions.drop("a")
+        assert sessions.get("a") is not first_agent
+
+    def test_lru_eviction(self):
+        sessions = SessionManager(object, max_sessions=2)
+        first_agent = sessions.get("a")
+        sessions.get("b")
+        # "a" becomes the most recently used session so "b" is evicted
+        sessions.get("a")
+        second_agent = sessions.get("b")
+        sessions.get("c")
+        assert len(sessions) == 2
+        assert sessions.get("b") is second_agent
+        assert sessions.get("a") is not first_agent
+
+    def test_ttl_eviction(self):
+        clock = FakeClock()
+        sessions = SessionManager(object, session_ttl=10, clock=clock)
+        first_agent = sessions.get("a")
+        sessions.get("b")
+        clock.now = 5
+        sessions.get("b")
+        clock.now = 12
+        assert len(sessions) == 2
+        assert sessions.get("b") is not None
+        assert len(sessions) == 1
+        assert sessions.get("a") is not first_agent
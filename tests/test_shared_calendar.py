@@ -0,0 +1,95 @@
+import json
+import multiprocessing
+import threading
+
+import pytest
+
+from booking_agent.booking_journal import BookingJournal
+from booking_agent.calendar import Calendar
+from booking_agent.shared_calendar import SharedMemoryCalendar
+from booking_agent.shared_calendar_toolkit import SharedCalendarToolkit
+
+
+@pytest.fixture
+def shared_calendar():
+    with open("tests/test_files/calendar_test.json", "r") as f:
+        calendar = SharedMemoryCalendar.create(Calendar(**json.load(f)))
+    yield calendar
+    calendar.close()
+    calendar.unlink()
+
+
+def book_every_slot(name: str, results):
+    calendar = SharedMemoryCalendar.attach(name)
+    toolkit = SharedCalendarToolkit(calendar)
+    answers = [toolkit.book("2024-10-14", start_time, "01:00")
+               for start_time in ["09:00", "10:00", "11:00", "13:00", "14:00", "15:00"]]
+    results.put(sum("with success" in answer for answer in answers))
+    calendar.close()
+
+
+class TestSharedMemoryCalendar:
+
+    def test_toolkits_see_the_bookings_of_each_other(self, shared_calendar):
+        first_toolkit = SharedCalendarToolkit(shared_calendar)
+        attached_calendar = SharedMemoryCalendar.attach(shared_calendar.get_name())
+        second_toolkit = SharedCalendarToolkit(attached_calendar)
+        assert second_toolkit.get_calendar_json() == first_toolkit.get_calendar_json()
+        assert "09:00 up to 12:00" in second_toolkit.get_available_slots_range("2024-10-14", "2024-10-14", "01:00")
+        assert second_toolkit.is_time_slot_available("2024-10-14", "10:00") is True
+
+        assert "with success" in first_toolkit.book("2024-10-14", "10:00", "01:00")
+        assert "already booked" in second_toolkit.book("2024-10-14", "10:00", "01:00")
+        # Cached results and bitmap rows of the second toolkit are outdated
+        assert second_toolkit.is_time_slot_available("2024-10-14", "10:00") is False
+        assert "09:00 up to 10:00, 11:00 up to 12:00" in \
+            second_toolkit.get_available_slots_range("2024-10-14", "2024-10-14", "01:00")
+        assert second_toolkit.get_version() == 1
+        assert second_toolkit.get_changes_since(0) == ["2024-10-14"]
+        assert shared_calendar.model_dump()["2024-10-14"][1] == {"start": "10:00", "end": "11:00", "available": False}
+        attached_calendar.close()
+
+    def test_workers_journal_their_bookings(self, shared_calendar, tmp_path):
+        journal = BookingJournal(str(tmp_path))
+        attached_calendar = SharedMemoryCalendar.attach(shared_calendar.get_name())
+        toolkit = SharedCalendarToolkit(attached_calendar, journal)
+        toolkit.book("2024-10-14", "10:00", "01:00")
+        journal.close()
+        with open("tests/test_files/calendar_test.json", "r") as f:
+            calendar = BookingJournal(str(tmp_path)).load(Calendar(**json.load(f)))
+        assert calendar.root["2024-10-14"][1].available is False
+        attached_calendar.close()
+
+    def test_calendars_attached_in_a_process_share_the_locks(self, shared_calendar):
+        attached_calendar = SharedMemoryCalendar.attach(shared_calendar.get_name())
+        other_calendar = SharedMemoryCalendar.attach(shared_calendar.get_name())
+        locked = threading.Event()
+
+        def lock_attached_calendar():
+            with attached_calendar.get_date_lock("2024-10-14"):
+                locked.set()
+
+        with shared_calendar.get_date_lock("2024-10-14"):
+            # Closing a calendar doesn't release the locks of the others
+            other_calendar.close()
+            thread = threading.Thread(target=lock_attached_calendar)
+            thread.start()
+            assert not locked.wait(timeout=0.2)
+        assert locked.wait(timeout=5)
+        thread.join()
+        attached_calendar.close()
+
+    def test_bookings_are_atomic_across_processes(self, shared_calendar):
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        processes = [context.Process(target=book_every_slot, args=(shared_calendar.get_name(), results))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        booked = sum(results.get(timeout=30) for _ in processes)
+        for process in processes:
+            process.join()
+        # Each of the 5 available slots was booked by a single process
+        assert booked == 5
+        assert SharedCalendarToolkit(shared_calendar).get_available_slots("2024-10-14", "01:00") == \
+            "No available slots for 01:00"